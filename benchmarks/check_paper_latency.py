@@ -0,0 +1,67 @@
+"""
+Benchmark comparing the per-paper latency of the batched `check_paper` path against the previous approach of invoking
+the retrieve/reorder graph once per citing sentence.
+
+Requires a running Elasticsearch instance with indexed papers and `OPENAI_API_KEY` to be set. Run from the repository
+root:
+
+    python -m benchmarks.check_paper_latency data/loose_pdfs/*.pdf --classifier-path <path>
+"""
+
+import argparse
+import time
+
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever
+
+
+def sequential_check_paper(retriever: MissingCitationRetriever, path: str) -> list[dict]:
+    """
+    Checks a paper by running every citing sentence through the graph one after another.
+    """
+    citing_sentences = retriever._find_citing_sentences(path)
+
+    responses = [retriever._graph.invoke({'sentence': sentence}) for sentence in citing_sentences]
+
+    return [{r['sentence']: r['reordered']} for r in responses]
+
+
+def _timed(fn, *args) -> tuple[float, list[dict]]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _same_retrieval(sequential: list[dict], batched: list[dict]) -> bool:
+    # The LLM reranker is not deterministic, so only compare the sentences and the sets of recommended papers
+    return [(s, set(titles)) for r in sequential for s, titles in r.items()] == \
+        [(s, set(titles)) for r in batched for s, titles in r.items()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sequential and batched check_paper latency")
+    parser.add_argument("paths", nargs="+", help="PDF files to check")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--retrieval-batch-size", type=int, default=64)
+    parser.add_argument("--rerank-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    retriever = MissingCitationRetriever(args.url, args.classifier_path,
+                                         retrieval_batch_size=args.retrieval_batch_size,
+                                         rerank_concurrency=args.rerank_concurrency)
+
+    total_sequential = total_batched = 0.0
+    for path in args.paths:
+        sequential_time, sequential_result = _timed(sequential_check_paper, retriever, path)
+        batched_time, batched_result = _timed(retriever.check_paper, path)
+        total_sequential += sequential_time
+        total_batched += batched_time
+
+        print(f"{path}: {len(batched_result)} citing sentences, "
+              f"sequential {sequential_time:.2f}s, batched {batched_time:.2f}s "
+              f"({sequential_time / batched_time:.1f}x), "
+              f"same retrieval: {_same_retrieval(sequential_result, batched_result)}")
+
+    print(f"Mean latency per paper: sequential {total_sequential / len(args.paths):.2f}s, "
+          f"batched {total_batched / len(args.paths):.2f}s "
+          f"({total_sequential / total_batched:.1f}x faster)")
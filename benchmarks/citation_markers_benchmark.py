@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of the shared citation marker scanner against the separate regexes it replaced.
+
+The baseline runs what the three call sites used to do on every sentence: the retriever's `_contains_reference`
+check, the four `re.sub` passes of `get_paper_text` and the `re.sub` + `re.search` labelling of the dataset script.
+The scanner does the same work with one `strip_citation_markers` call.
+
+The synthetic corpus defaults to roughly the number of sentences of the arXiv citing sentence dataset. Run from the
+repository root:
+
+    python -m benchmarks.citation_markers_benchmark --sentences 10000000
+"""
+
+import argparse
+import random
+import re
+import time
+
+from paper_text_extractor.citation_markers import strip_citation_markers
+
+_CONTAINS_REFERENCE_REGEX = r' ?\[\d+(?:-\d+|(?:, ?\d+(-\d+)?)*)+\] ?'
+_DATASET_REGEX = r" ?(\[\d+(?:-\d+|(?:, ?\d+(-\d+)?)*)+\]|<([A-Z]+:[a-zA-Z0-9._:/-]*)>) ?"
+
+# Dates, acronyms and product names followed by a year, which are not citation markers
+_NEGATIVES = [
+    "The annotators labeled the sentences over three months (January 2020) before the release.",
+    "Hospital admissions of the cohort (COVID 2020) were excluded from the training data.",
+    "The baseline was trained on machines running Windows (2000) with a single GPU.",
+    "Similar gains were reported before (as shown in Devlin et al., 2019, for English only).",
+]
+
+# Sentences with markers, and what is left once they are removed
+_POSITIVES = {
+    "Known results (de Vries et al., 2020).": "Known results.",
+    "We follow BERT [Devlin et al., 2019].": "We follow BERT.",
+    "Points are projected with t-SNE (van der Maaten and Hinton, 2008).": "Points are projected with t-SNE.",
+    "The bound is tight (Smith, 2019, p. 4).": "The bound is tight.",
+    "The bound is tight [Smith 2019].": "The bound is tight.",
+    "The bound was shown by Smith (2019).": "The bound was shown by.",
+}
+
+_TEMPLATES = [
+    "Recurrent neural networks have been firmly established as state of the art approaches{} in sequence modeling.",
+    "We used the Adam optimizer{} with a learning rate that increases linearly for the first warmup steps.",
+    "The encoder maps an input sequence of symbol representations to a sequence of continuous representations.",
+    "Attention mechanisms have become an integral part of compelling sequence modeling and transduction models{}.",
+    "In this work we propose the Transformer, a model architecture eschewing recurrence.",
+    *_NEGATIVES,
+]
+_MARKERS = ["", "", " [12]", " [3-5]", " [1, 4, 7-9]", " (Vaswani et al., 2017)",
+            " <GC:and.downey.fellows.vardy.whittle>"]
+
+
+def make_corpus(size: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    return [rng.choice(_TEMPLATES).format(rng.choice(_MARKERS)) for _ in range(size)]
+
+
+def baseline(sentence: str) -> tuple[str, bool]:
+    # retriever filter
+    re.search(_CONTAINS_REFERENCE_REGEX, sentence)
+    # get_paper_text marker removal
+    text = re.sub(r'\[.*]', '', sentence)
+    text = re.sub(r'\[\s*\d+\s*]', '', text)
+    text = re.sub(r'\[\s*\d+(,\s*\d+)*\s*]', '', text)
+    text = re.sub(r'\[\s*\d+\s*-\s*\d+\s*]', '', text)
+    # dataset labelling
+    return re.sub(_DATASET_REGEX, "", sentence), bool(re.search(_DATASET_REGEX, sentence))
+
+
+def scanner(sentence: str) -> tuple[str, bool]:
+    text, markers = strip_citation_markers(sentence)
+    return text, bool(markers)
+
+
+def run(name: str, fn, corpus: list[str]) -> float:
+    start = time.perf_counter()
+    citing = sum(fn(sentence)[1] for sentence in corpus)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name}: {elapsed:.2f}s, {len(corpus) / elapsed / 1e6:.2f}M sentences/s, {citing} citing sentences")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark citation marker detection and removal")
+    parser.add_argument("--sentences", type=int, default=10_000_000, help="Size of the synthetic sentence corpus")
+    args = parser.parse_args()
+
+    false_positives = [sentence for sentence in _NEGATIVES if scanner(sentence)[1]]
+    if false_positives:
+        raise RuntimeError(f"The scanner finds markers in sentences without any: {false_positives}")
+    missed = [sentence for sentence, stripped in _POSITIVES.items() if scanner(sentence)[0] != stripped]
+    if missed:
+        raise RuntimeError(f"The scanner does not remove the markers of: {missed}")
+
+    corpus = make_corpus(args.sentences)
+
+    baseline_time = run("separate regexes", baseline, corpus)
+    scanner_time = run("shared scanner", scanner, corpus)
+    print(f"Speedup: {baseline_time / scanner_time:.2f}x")
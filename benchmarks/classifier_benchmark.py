@@ -0,0 +1,78 @@
+"""
+Benchmark comparing the sentences/sec and accuracy of the citing sentence classifier backends on a balanced sample
+of the validation set used by the notebooks.
+
+The baseline is the HuggingFace `text-classification` pipeline with a fixed batch size of 16, as previously used by
+`MissingCitationRetriever.classify_sentences`. Run from the repository root:
+
+    python -m benchmarks.classifier_benchmark --model-path <classifier> --val-path citing_val.parquet
+"""
+
+import argparse
+import time
+import pandas as pd
+
+from missing_citation_retriever.citing_sentence_classifier import load_citing_sentence_classifier
+
+
+def load_validation_sample(path: str, n: int) -> pd.DataFrame:
+    # Same filtering and balancing as data/convert_parquet_to_jsonlines.py
+    df = pd.read_parquet(path).dropna()
+    df = df[~df['sentence'].str.contains('<figure>|<formula>')]
+
+    positive_samples = df[df['citing'] == True].sample(n=n // 2, random_state=42)
+    negative_samples = df[df['citing'] == False].sample(n=n // 2, random_state=42)
+
+    return pd.concat([positive_samples, negative_samples]).sample(frac=1, random_state=42).reset_index(drop=True)
+
+
+def pipeline_classifier(model_path: str, device: str):
+    from transformers import pipeline
+
+    classifier = pipeline('text-classification', model=model_path, device=device)
+    classifier.model.config.id2label = {0: False, 1: True}
+
+    def classify(sentences):
+        results = []
+        for i in range(0, len(sentences), 16):
+            results.extend(classifier(sentences[i:i + 16]))
+        return results
+
+    return classify
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare citing sentence classifier backends")
+    parser.add_argument("--model-path", type=str, required=True, help="Path to the fine-tuned classifier")
+    parser.add_argument("--val-path", type=str, required=True, help="Path to citing_val.parquet")
+    parser.add_argument("--samples", type=int, default=5000, help="Size of the balanced validation sample")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--max-tokens-per-batch", type=int, default=8192)
+    args = parser.parse_args()
+
+    df = load_validation_sample(args.val_path, args.samples)
+    sentences = df['sentence'].tolist()
+    labels = df['citing'].tolist()
+
+    backends = {
+        'pipeline (batch 16)': lambda: pipeline_classifier(args.model_path, args.device),
+        'torch': lambda: load_citing_sentence_classifier(args.model_path, 'torch', device=args.device,
+                                                         max_tokens_per_batch=args.max_tokens_per_batch),
+        'onnx': lambda: load_citing_sentence_classifier(args.model_path, 'onnx', device=args.device,
+                                                        max_tokens_per_batch=args.max_tokens_per_batch),
+        'onnx int8': lambda: load_citing_sentence_classifier(args.model_path, 'onnx', quantize=True,
+                                                             device=args.device,
+                                                             max_tokens_per_batch=args.max_tokens_per_batch),
+    }
+
+    for name, load in backends.items():
+        classifier = load()
+        # Warm up so that lazy initialization is not measured
+        classifier(sentences[:32])
+
+        start = time.perf_counter()
+        predictions = [output['label'] for output in classifier(sentences)]
+        elapsed = time.perf_counter() - start
+
+        accuracy = sum(prediction == label for prediction, label in zip(predictions, labels)) / len(labels)
+        print(f"{name}: {len(sentences) / elapsed:.1f} sentences/s, accuracy {accuracy:.4f}")
@@ -0,0 +1,133 @@
+"""
+Benchmark of compact `NumpyVectorStore` variants, derived from a float16 store with `compress_vector_store`: int8 and
+binary vectors, PCA-reduced vectors, and each of them with and without full-precision rescoring. Reports the size on
+disk, the query throughput and the recall@k of each variant against an exact float32 search of the base store.
+
+Queries are the sentences from `benchmarks/labeled_queries.py` embedded with the query instruction of the retriever,
+or vectors sampled from the store with `--synthetic-queries`, which needs no embedding model. Run from the repository
+root:
+
+    python -m benchmarks.compact_vectors_benchmark papers_store --work-dir compact_stores --pca-dims 256
+"""
+
+import argparse
+import json
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from database.numpy_vector_store import NumpyVectorStore, compress_vector_store
+
+VARIANTS = {
+    'int8': {'dtype': 'int8'},
+    'binary': {'dtype': 'binary'},
+    'pca': {'dtype': 'float16', 'pca_dims': True},
+    'pca+int8': {'dtype': 'int8', 'pca_dims': True},
+}
+
+
+def store_size_mb(path: Path, searched_only: bool = False) -> float:
+    files = [path / 'vectors.bin', path / 'scales.bin'] if searched_only else path.iterdir()
+    return sum(file.stat().st_size for file in files if file.exists()) / 2 ** 20
+
+
+def exact_neighbors(store_path: Path, queries: np.ndarray, k: int) -> np.ndarray:
+    meta = json.loads((store_path / 'meta.json').read_text())
+    vectors = np.memmap(store_path / 'vectors.bin', dtype=np.float16, mode='r', shape=(meta['rows'], meta['dims']))
+    scores = np.concatenate([queries @ vectors[i:i + 65536].astype(np.float32).T
+                             for i in range(0, meta['rows'], 65536)], axis=1)
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def chunk_papers(store_path: Path) -> np.ndarray:
+    return np.fromfile(store_path / 'chunk_papers.bin', dtype=np.int32)
+
+
+def recall(rows: np.ndarray, papers: np.ndarray, expected: np.ndarray) -> float:
+    """
+    Returns the mean fraction of the papers of the exact nearest chunks found, since partitioned variants store their
+    chunks in another order than the base store.
+    """
+    return float(np.mean([len(set(papers[found[found >= 0]]) & set(exact)) / len(set(exact))
+                          for found, exact in zip(rows, expected)]))
+
+
+def run_variant(store: NumpyVectorStore, queries: np.ndarray, k: int, batch_size: int) -> tuple[float, np.ndarray]:
+    # The first batch warms up the memory maps
+    store.search(queries[:batch_size], k)
+    start = time.perf_counter()
+    rows = np.concatenate([store.search(queries[i:i + batch_size], k)[1] for i in range(0, len(queries), batch_size)])
+
+    return len(queries) / (time.perf_counter() - start), rows
+
+
+def embed_queries(model: str) -> np.ndarray:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from benchmarks.labeled_queries import CITATION_TO_PAPER
+    from missing_citation_retriever.missing_citation_retriever import QUERY_INSTRUCTION, _format_query_instruction
+
+    embeddings = HuggingFaceEmbeddings(model_name=model, encode_kwargs={'normalize_embeddings': True})
+    return np.asarray(embeddings.embed_documents([_format_query_instruction(QUERY_INSTRUCTION, sentence)
+                                                  for sentence in CITATION_TO_PAPER]), dtype=np.float32)
+
+
+def sample_queries(store_path: Path, count: int, seed: int = 0) -> np.ndarray:
+    meta = json.loads((store_path / 'meta.json').read_text())
+    vectors = np.memmap(store_path / 'vectors.bin', dtype=np.float16, mode='r', shape=(meta['rows'], meta['dims']))
+    rows = np.sort(np.random.default_rng(seed).choice(meta['rows'], min(count, meta['rows']), replace=False))
+    queries = vectors[rows].astype(np.float32)
+    # Perturbed so that a query is not trivially its own nearest neighbor
+    queries += np.random.default_rng(seed + 1).normal(scale=0.02, size=queries.shape).astype(np.float32)
+
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare compact vector store variants")
+    parser.add_argument("store", type=str, help="Directory of a float16 store")
+    parser.add_argument("--work-dir", type=str, required=True, help="Directory where the variants are built")
+    parser.add_argument("--pca-dims", type=int, default=256)
+    parser.add_argument("--nlist", type=int, default=0, help="Number of IVF partitions of the variants")
+    parser.add_argument("--nprobe", type=int, default=32)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--model", type=str, default='intfloat/multilingual-e5-large-instruct')
+    parser.add_argument("--synthetic-queries", type=int, default=0,
+                        help="Number of queries sampled from the store instead of embedding the labeled sentences")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    base_path, work_dir = Path(args.store), Path(args.work_dir)
+    queries = sample_queries(base_path, args.synthetic_queries) if args.synthetic_queries else embed_queries(args.model)
+    expected = chunk_papers(base_path)[exact_neighbors(base_path, queries, args.k)]
+
+    results = {}
+    qps, rows = run_variant(NumpyVectorStore(base_path, args.nprobe), queries, args.k, args.batch_size)
+    results['float16'] = {'size_mb': store_size_mb(base_path), 'searched_mb': store_size_mb(base_path, True),
+                          'qps': qps, 'recall': recall(rows, chunk_papers(base_path), expected)}
+
+    for name, options in VARIANTS.items():
+        for rescore in (False, True):
+            variant = f'{name}+rescore' if rescore else name
+            path = work_dir / variant
+            if not (path / 'meta.json').exists():
+                compress_vector_store(base_path, path, options['dtype'],
+                                      args.pca_dims if options.get('pca_dims') else 0, rescore, args.nlist)
+
+            store = NumpyVectorStore(path, args.nprobe, args.rescore_factor)
+            qps, rows = run_variant(store, queries, args.k, args.batch_size)
+            results[variant] = {'size_mb': store_size_mb(path), 'searched_mb': store_size_mb(path, True),
+                                'qps': qps, 'recall': recall(rows, chunk_papers(path), expected)}
+
+    print(f"{len(queries)} queries, recall@{args.k} against an exact float32 search")
+    print(f"{'variant':<22}{'disk MB':>10}{'searched MB':>13}{'QPS':>10}{'recall':>9}")
+    for variant, result in results.items():
+        print(f"{variant:<22}{result['size_mb']:>10.1f}{result['searched_mb']:>13.1f}{result['qps']:>10.1f}"
+              f"{result['recall']:>9.3f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
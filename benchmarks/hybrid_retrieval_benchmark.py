@@ -0,0 +1,57 @@
+"""
+Benchmark of hybrid BM25 + kNN retrieval against dense-only retrieval on the fixed sentence set from
+`benchmarks/labeled_queries.py`.
+
+For each mode it reports the first-stage recall of the cited paper at several cutoffs, then reranks the candidates
+sent to the reranker with the local cross-encoder and reports the rerank time and the final recall@5. Dense mode
+sends every retrieved chunk to the reranker like before, hybrid mode only its 10 best fused papers.
+
+Requires a running Elasticsearch instance with the cited papers indexed. Run from the repository root:
+
+    python -m benchmarks.hybrid_retrieval_benchmark --classifier-path <path>
+"""
+
+import argparse
+import time
+
+from benchmarks.labeled_queries import CITATION_TO_PAPER, recall_at_k
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever
+
+
+def distinct_titles(retrieved: list[list]) -> list[list[str]]:
+    return [list(dict.fromkeys(doc.metadata['title'] for doc in docs)) for docs in retrieved]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare hybrid and dense retrieval")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--rerank-candidates", type=int, default=10, help="Papers reranked per sentence in hybrid mode")
+    args = parser.parse_args()
+
+    sentences = list(CITATION_TO_PAPER.keys())
+    cited_titles = list(CITATION_TO_PAPER.values())
+
+    dense = MissingCitationRetriever(args.url, args.classifier_path, reranker='cross-encoder', share_models=True)
+    # Without a limit on the candidates, the first-stage recall is measured over every fused paper
+    hybrid_full = MissingCitationRetriever(args.url, args.classifier_path, reranker='cross-encoder',
+                                           share_models=True, retrieval_mode='hybrid', rerank_candidates=10_000)
+    hybrid = MissingCitationRetriever(args.url, args.classifier_path, reranker='cross-encoder', share_models=True,
+                                      retrieval_mode='hybrid', rerank_candidates=args.rerank_candidates)
+
+    cutoffs = (5, 10, 20, 50)
+    print(f"{'first stage':<14}" + ''.join(f"{'recall@' + str(k):>11}" for k in cutoffs))
+    for name, retriever in (('dense', dense), ('hybrid', hybrid_full)):
+        titles = distinct_titles(retriever._retrieve_many(sentences))
+        print(f"{name:<14}" + ''.join(f"{recall_at_k(titles, cited_titles, k):>11.2f}" for k in cutoffs))
+
+    print()
+    print(f"{'reranked':<14}{'candidates':>11}{'rerank s':>11}{'recall@5':>11}")
+    for name, retriever in (('dense', dense), ('hybrid', hybrid)):
+        candidates = retriever._retrieve_many(sentences)
+        start = time.perf_counter()
+        reordered = [retriever._reorder({'sentence': sentence, 'retrieved': docs})['reordered']
+                     for sentence, docs in zip(sentences, candidates)]
+        elapsed = time.perf_counter() - start
+        mean_candidates = sum(map(len, candidates)) / len(candidates)
+        print(f"{name:<14}{mean_candidates:>11.1f}{elapsed:>11.2f}{recall_at_k(reordered, cited_titles, 5):>11.2f}")
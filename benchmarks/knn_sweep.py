@@ -0,0 +1,90 @@
+"""
+Offline recall-vs-latency sweep of the kNN search over paper chunks, on the fixed sentence set from
+`benchmarks/labeled_queries.py`.
+
+Every configuration searches the same query vectors against the existing chunks index. For each one it reports the
+median and p95 search latency, recall@k of the cited paper among the retrieved papers, and the overlap of the
+retrieved papers with an exact brute-force search. Only search-time settings can be swept against one index: to
+compare the HNSW or quantization settings of the profiles, ingest into one index per profile with
+`python -m database.ingest --knn-profile ... --chunks-index ...` and sweep each index.
+
+Requires a running Elasticsearch instance with the cited papers indexed. Run from the repository root:
+
+    python -m benchmarks.knn_sweep --num-candidates 50 100 250 500 1000 10000
+"""
+
+import argparse
+import statistics
+
+from benchmarks.labeled_queries import CITATION_TO_PAPER, recall_at_k
+from database.knn_profiles import KNN_PROFILES
+from elasticsearch import Elasticsearch
+from langchain_huggingface import HuggingFaceEmbeddings
+from missing_citation_retriever.missing_citation_retriever import QUERY_INSTRUCTION, _format_query_instruction
+
+
+def search_titles(es: Elasticsearch, index: str, body: dict) -> tuple[float, list[str]]:
+    """
+    Runs one search and resolves the retrieved chunks to the titles of their papers, keeping the first occurrence.
+
+    Returns:
+        tuple[float, list[str]]: The latency of the search as reported by Elasticsearch, in seconds, and the titles.
+    """
+    response = es.search(index=index, body={**body, '_source': ['metadata.id']})
+    paper_ids = list(dict.fromkeys(hit['_source']['metadata']['id'] for hit in response['hits']['hits']))
+    if not paper_ids:
+        return response['took'] / 1000, []
+
+    papers = es.mget(index='papers', ids=paper_ids, source=['title'])['docs']
+    return response['took'] / 1000, [paper['_source']['title'] for paper in papers if paper['found']]
+
+
+def overlap(retrieved: list[list[str]], reference: list[list[str]]) -> float:
+    """
+    Computes the mean fraction of the reference titles of each query that were also retrieved.
+    """
+    fractions = [len(set(r) & set(ref)) / len(ref) for r, ref in zip(retrieved, reference) if ref]
+    return statistics.mean(fractions) if fractions else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep kNN search settings for recall and latency")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--index", type=str, default="paper_embeddings", help="Index of the paper chunks")
+    parser.add_argument("--model", type=str, default="intfloat/multilingual-e5-large-instruct")
+    parser.add_argument("--k", type=int, default=50, help="Number of chunks retrieved per query")
+    parser.add_argument("--recall-k", type=int, default=10, help="Cutoff of the recall over retrieved papers")
+    parser.add_argument("--num-candidates", type=int, nargs="*", default=[],
+                        help="Extra numbers of candidates to sweep besides the named profiles")
+    parser.add_argument("--repeats", type=int, default=3, help="Times each query is run, the first run is dropped")
+    args = parser.parse_args()
+
+    es = Elasticsearch(args.url)
+    embeddings = HuggingFaceEmbeddings(model_name=args.model, encode_kwargs={'normalize_embeddings': True})
+
+    sentences = list(CITATION_TO_PAPER.keys())
+    cited_titles = list(CITATION_TO_PAPER.values())
+    query_vectors = embeddings.embed_documents([_format_query_instruction(QUERY_INSTRUCTION, s) for s in sentences])
+
+    configurations = [(name, profile, None) for name, profile in KNN_PROFILES.items()]
+    configurations += [(f"num_candidates={n}", KNN_PROFILES['balanced'], n) for n in args.num_candidates]
+
+    exact_titles = [search_titles(es, args.index, KNN_PROFILES['exact'].search_body('vector', v, args.k))[1]
+                    for v in query_vectors]
+
+    print(f"{'configuration':<24}{'p50 ms':>8}{'p95 ms':>8}{'recall@' + str(args.recall_k):>11}{'vs exact':>10}")
+    for name, profile, num_candidates in configurations:
+        latencies = []
+        titles = []
+        for query_vector in query_vectors:
+            body = profile.search_body('vector', query_vector, args.k, num_candidates)
+            for repeat in range(args.repeats):
+                took, retrieved = search_titles(es, args.index, body)
+                # The first run warms up the caches
+                if repeat or args.repeats == 1:
+                    latencies.append(took)
+            titles.append(retrieved)
+
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{name:<24}{statistics.median(latencies) * 1000:>8.1f}{p95 * 1000:>8.1f}"
+              f"{recall_at_k(titles, cited_titles, args.recall_k):>11.2f}{overlap(titles, exact_titles):>10.2f}")
@@ -0,0 +1,27 @@
+"""
+Citing sentences from "Attention Is All You Need" mapped to the title of the paper they cite, taken from
+`notebooks/embeddings_reference_retrieval.ipynb`. Used as a fixed query set by the retrieval benchmarks.
+"""
+
+CITATION_TO_PAPER = {
+    "We used the Adam optimizer.":
+        "Adam: A Method for Stochastic Optimization",
+    "In contrast to RNN sequence-to-sequence models":
+        "Grammar as a foreign language",
+    "the Transformer outperforms the Berkeley-Parser":
+        "Learning accurate, compact, and interpretable tree annotation",
+    "We trained a 4-layer transformer with dmodel = 1024 on the Wall Street Journal (WSJ) portion of the Penn Treebank":
+        "Building a Large Annotated Corpus of English: The Penn Treebank",
+    "we replace our sinusoidal positional encoding with learned positional embeddings":
+        "Convolutional Sequence to Sequence Learning",
+    "Recent work has achieved significant improvements in computational efficiency through factorization tricks":
+        "Factorization tricks for LSTM networks",
+}
+
+
+def recall_at_k(ranked_titles: list[list[str]], cited_titles: list[str], k: int) -> float:
+    """
+    Computes the fraction of queries whose cited paper appears in the first `k` ranked titles.
+    """
+    hits = sum(cited in titles[:k] for titles, cited in zip(ranked_titles, cited_titles))
+    return hits / len(cited_titles)
@@ -0,0 +1,352 @@
+"""
+End-to-end benchmark of `check_paper`, breaking its time down by pipeline stage.
+
+Every backend the pipeline calls is wrapped to record its wall time, number of calls and number of items:
+- `extract`: PDF text extraction and section segmentation
+- `tokenize`: sentence tokenization
+- `classify`: citing sentence classifier forward passes
+- `embed`: query embedding
+- `search`: Elasticsearch `msearch`, or the in-process vector store with `--vector-store`
+- `fetch`: Elasticsearch `mget`
+- `rerank`: reranker calls
+
+Reranking uses a stub that keeps the retrieval order and optionally sleeps, so that runs do not depend on the OpenAI
+API; pass `--reranker cross-encoder` to measure the real local reranker. Stage times of threaded stages (reranking)
+are summed over threads, so they can add up to more than the wall time of a paper.
+
+Results are written as JSON, including the commit they were measured on, and two result files can be compared with
+`--compare`. `--profile-stage` runs one stage under cProfile and dumps the stats, which can be turned into a flame
+graph with e.g. `flameprof` or viewed with `snakeviz`; `--py-spy` records a flame graph of the whole run if py-spy is
+installed. A cProfile profiler only records the thread that enabled it, so profiling `rerank` runs the reranker calls
+one at a time instead of concurrently.
+
+Requires a running Elasticsearch instance with indexed papers, unless `--vector-store` is given. Run from the
+repository root:
+
+    python -m benchmarks.pipeline_benchmark data/loose_pdfs/*.pdf --classifier-path <path> --output results.json
+    python -m benchmarks.pipeline_benchmark --compare before.json after.json
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from langchain_core.documents import BaseDocumentCompressor, Document
+from missing_citation_retriever.instrumentation import Metrics
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever
+from typing import Callable, Optional, Sequence
+
+
+class StageRecorder:
+    """
+    Collects the wall time, number of calls and number of items of each stage, optionally profiling one stage.
+
+    Args:
+        profile_stage (str): The stage to run under cProfile, if any.
+    """
+
+    def __init__(self, profile_stage: Optional[str] = None):
+        self.stages = defaultdict(lambda: {'seconds': 0.0, 'calls': 0, 'items': 0})
+        self.profile_stage = profile_stage
+        self.profiler = cProfile.Profile() if profile_stage else None
+        self._lock = threading.Lock()
+
+    def wrap(self, stage: str, fn: Callable, count_items: Callable = lambda args: 0) -> Callable:
+        """
+        Wraps a function so that its calls are recorded under a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            fn (Callable): The function to wrap.
+            count_items (Callable): Returns the number of items processed by a call from its positional arguments.
+        """
+
+        def wrapped(*args, **kwargs):
+            with self.record(stage, count_items(args)):
+                return fn(*args, **kwargs)
+
+        return wrapped
+
+    @contextmanager
+    def record(self, stage: str, items: int = 0):
+        """
+        Records the code run within the context manager as a call of a stage.
+        """
+        profile = stage == self.profile_stage
+        start = time.perf_counter()
+        if profile:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                self.profiler.disable()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[stage]['seconds'] += elapsed
+                self.stages[stage]['calls'] += 1
+                self.stages[stage]['items'] += items
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {stage: dict(values) for stage, values in self.stages.items()}
+
+
+class _StageMetrics(Metrics):
+    """
+    Records the extraction and tokenization spans of the retriever, which run within its own generators and cannot be
+    wrapped from outside. Its other spans time the same calls as the proxies and are ignored.
+    """
+
+    enabled = True
+
+    def __init__(self, recorder: StageRecorder):
+        self._recorder = recorder
+
+    def span(self, name: str):
+        return self._recorder.record(name) if name in ('extract', 'tokenize') else nullcontext()
+
+
+class _Proxy:
+    """
+    Forwards attribute accesses to an object, replacing some of its methods with recorded ones.
+    """
+
+    def __init__(self, target, methods: dict):
+        self._target = target
+        self._methods = methods
+
+    def __getattr__(self, name):
+        return self._methods.get(name) or getattr(self._target, name)
+
+    def __call__(self, *args, **kwargs):
+        return self._methods['__call__'](*args, **kwargs)
+
+
+class StubReranker(BaseDocumentCompressor):
+    """
+    Reranker keeping the retrieval order, optionally sleeping to simulate the latency of a remote reranker.
+    """
+
+    top_n: int = 5
+    latency: float = 0.0
+
+    def compress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> Sequence[Document]:
+        if self.latency:
+            time.sleep(self.latency)
+        return list(documents)[:self.top_n]
+
+
+class ProfiledMissingCitationRetriever(MissingCitationRetriever):
+    """
+    A `MissingCitationRetriever` recording the calls to its models and backends in a `StageRecorder`.
+    """
+
+    def __init__(self, recorder: StageRecorder, *args, **kwargs):
+        super().__init__(*args, metrics=_StageMetrics(recorder), **kwargs)
+        self._recorder = recorder
+        self._proxies = {}
+
+    def _proxy(self, name: str, target, methods: dict) -> _Proxy:
+        # Keep one proxy per wrapped object, so that lazily created objects are only wrapped once
+        proxy = self._proxies.get(name)
+        if proxy is None or proxy._target is not target:
+            proxy = self._proxies[name] = _Proxy(target, methods)
+        return proxy
+
+    @property
+    def _embeddings(self):
+        embeddings = super()._embeddings
+        return self._proxy('embeddings', embeddings, {
+            'embed_documents': self._recorder.wrap('embed', embeddings.embed_documents, lambda args: len(args[0])),
+        })
+
+    @property
+    def _citing_sentence_classifier(self):
+        classifier = super()._citing_sentence_classifier
+        return self._proxy('classifier', classifier, {
+            '__call__': self._recorder.wrap('classify', classifier, lambda args: len(args[0])),
+        })
+
+    @property
+    def _reranker(self):
+        reranker = super()._reranker
+        return self._proxy('reranker', reranker, {
+            'compress_documents': self._recorder.wrap('rerank', reranker.compress_documents,
+                                                      lambda args: len(args[0])),
+        })
+
+    @property
+    def _es(self):
+        es = super()._es
+        return self._proxy('es', es, {
+            'msearch': self._recorder.wrap('search', es.msearch, lambda args: 0),
+            'mget': self._recorder.wrap('fetch', es.mget, lambda args: 0),
+        })
+
+    @property
+    def _local_vector_store(self):
+        store = super()._local_vector_store
+        return self._proxy('local_vector_store', store, {
+            'search_papers': self._recorder.wrap('search', store.search_papers, lambda args: len(args[0])),
+            'get_papers': self._recorder.wrap('fetch', store.get_papers, lambda args: len(args[0])),
+        })
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(retriever: ProfiledMissingCitationRetriever, recorder: StageRecorder, paths: list[str],
+                  repeats: int) -> dict:
+    """
+    Checks every paper `repeats` times and collects the timings.
+
+    Returns:
+        dict: The per-paper results and the per-stage totals.
+    """
+    start = time.perf_counter()
+    papers = []
+    for path in paths:
+        for repeat in range(repeats):
+            before = recorder.snapshot()
+            paper_start = time.perf_counter()
+            result = retriever.check_paper(path)
+            elapsed = time.perf_counter() - paper_start
+
+            after = recorder.snapshot()
+            stages = {stage: round(values['seconds'] - before.get(stage, {}).get('seconds', 0.0), 6)
+                      for stage, values in after.items()}
+            papers.append({'path': path, 'repeat': repeat, 'seconds': round(elapsed, 6),
+                           'citing_sentences': len(result), 'stages': stages})
+            print(f"{path} #{repeat}: {elapsed:.2f}s, {len(result)} citing sentences, "
+                  + ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items()))
+
+    total = time.perf_counter() - start
+    sentences = sum(paper['citing_sentences'] for paper in papers)
+
+    return {
+        'papers': papers,
+        'stages': recorder.snapshot(),
+        'totals': {
+            'seconds': round(total, 6),
+            'papers_per_second': len(papers) / total if total else 0.0,
+            'citing_sentences_per_second': sentences / total if total else 0.0,
+            'peak_rss_mb': round(_peak_rss_mb(), 1),
+        },
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """
+    Prints the per-stage and total differences between two result files.
+    """
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"{'stage':<12}{'before s':>10}{'after s':>10}{'change':>9}{'calls':>14}")
+    for stage in sorted(set(before['stages']) | set(after['stages'])):
+        b = before['stages'].get(stage, {'seconds': 0.0, 'calls': 0})
+        a = after['stages'].get(stage, {'seconds': 0.0, 'calls': 0})
+        change = f"{(a['seconds'] / b['seconds'] - 1) * 100:+.0f}%" if b['seconds'] else 'new'
+        print(f"{stage:<12}{b['seconds']:>10.2f}{a['seconds']:>10.2f}{change:>9}{b['calls']:>7}->{a['calls']:<6}")
+
+    for metric in ('seconds', 'papers_per_second', 'peak_rss_mb'):
+        print(f"{metric}: {before['totals'][metric]:.2f} -> {after['totals'][metric]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark check_paper stage by stage")
+    parser.add_argument("paths", nargs="*", help="PDF files to check, e.g. data/loose_pdfs/*.pdf")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, help="Path to the citing sentence classifier")
+    parser.add_argument("--classifier-backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--vector-store", type=str, default=None,
+                        help="Retrieve from this in-process vector store instead of Elasticsearch")
+    parser.add_argument("--reranker", choices=["stub", "cross-encoder"], default="stub")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds the stub reranker sleeps per call")
+    parser.add_argument("--repeats", type=int, default=1, help="Times each paper is checked")
+    parser.add_argument("--output", type=str, default=None, help="JSON file the results are written to")
+    parser.add_argument("--profile-stage", type=str, default=None,
+                        choices=["extract", "tokenize", "classify", "embed", "search", "fetch", "rerank"],
+                        help="Stage to run under cProfile. Profiling rerank runs the reranker calls one at a time, "
+                             "since cProfile cannot follow concurrent threads")
+    parser.add_argument("--profile-output", type=str, default="stage.prof", help="File the cProfile stats go to")
+    parser.add_argument("--py-spy", type=str, default=None, metavar="SVG",
+                        help="Record a py-spy flame graph of the whole run to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    if not args.paths or not args.classifier_path:
+        parser.error("paths and --classifier-path are required unless comparing results")
+
+    recorder = StageRecorder(args.profile_stage)
+
+    reranker = StubReranker(latency=args.stub_latency) if args.reranker == 'stub' else args.reranker
+    # Concurrent reranker threads would enable and disable the single profiler over each other
+    options = {'rerank_concurrency': 1} if args.profile_stage == 'rerank' else {}
+    retriever = ProfiledMissingCitationRetriever(recorder, args.url, args.classifier_path, reranker=reranker,
+                                                 classifier_backend=args.classifier_backend,
+                                                 vector_store_path=args.vector_store, **options)
+    retriever.warmup()
+    # Warming up calls the models, which should not count towards the results
+    recorder.stages.clear()
+
+    py_spy = None
+    if args.py_spy:
+        if not shutil.which('py-spy'):
+            parser.error("py-spy is not installed")
+        py_spy = subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()), '--output', args.py_spy])
+
+    try:
+        results = run_benchmark(retriever, recorder, args.paths, args.repeats)
+    finally:
+        if py_spy:
+            py_spy.terminate()
+            py_spy.wait()
+
+    results = {
+        'commit': _commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('compare', 'paths')},
+        **results,
+    }
+
+    print()
+    for stage, values in sorted(results['stages'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"{stage:<10}{values['seconds']:>9.2f}s {values['calls']:>6} calls {values['items']:>8} items")
+    print(f"total {results['totals']['seconds']:.2f}s, {results['totals']['papers_per_second']:.2f} papers/s, "
+          f"peak RSS {results['totals']['peak_rss_mb']:.0f} MB")
+
+    if args.profile_stage:
+        recorder.profiler.dump_stats(args.profile_output)
+        print(f"cProfile stats of the {args.profile_stage} stage written to {args.profile_output}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
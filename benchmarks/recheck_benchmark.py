@@ -0,0 +1,41 @@
+"""
+Benchmark of re-checking unchanged papers with the PDF and result caches enabled, as when an author re-checks a draft
+after small edits.
+
+The first check of each paper fills the caches, the following ones should only read them. Requires a running
+Elasticsearch instance with indexed papers. Run from the repository root:
+
+    python -m benchmarks.recheck_benchmark data/loose_pdfs/*.pdf --classifier-path <path> --cache-dir /tmp/citeseek
+"""
+
+import argparse
+import time
+
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure re-checks of unchanged papers")
+    parser.add_argument("paths", nargs="+", help="PDF files to check")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--reranker", choices=["llm", "cross-encoder"], default="llm")
+    parser.add_argument("--cache-dir", type=str, required=True, help="Directory of the PDF and result caches")
+    parser.add_argument("--rechecks", type=int, default=3)
+    args = parser.parse_args()
+
+    retriever = MissingCitationRetriever(args.url, args.classifier_path, reranker=args.reranker,
+                                         pdf_cache_dir=f'{args.cache_dir}/pdf',
+                                         result_cache_dir=f'{args.cache_dir}/results')
+    retriever.warmup()
+
+    for path in args.paths:
+        timings = []
+        for _ in range(1 + args.rechecks):
+            start = time.perf_counter()
+            result = retriever.check_paper(path)
+            timings.append(time.perf_counter() - start)
+
+        rechecks = ', '.join(f"{t * 1000:.0f}ms" for t in timings[1:])
+        print(f"{path}: {len(result)} citing sentences, first check {timings[0]:.2f}s, re-checks {rechecks}")
+
+    print(f"result cache: {retriever._result_cache.stats()}")
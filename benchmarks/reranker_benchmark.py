@@ -0,0 +1,55 @@
+"""
+Benchmark comparing the throughput and recall@5 of the LLM reranker with the local cross-encoder reranker on the
+fixed sentence set from `benchmarks/labeled_queries.py`.
+
+Candidates are retrieved once from Elasticsearch and then reranked by each reranker, so both see the same input.
+Requires a running Elasticsearch instance with the cited papers indexed and `OPENAI_API_KEY` to be set. Run from the
+repository root:
+
+    python -m benchmarks.reranker_benchmark --classifier-path <path>
+"""
+
+import argparse
+import time
+
+from benchmarks.labeled_queries import CITATION_TO_PAPER, recall_at_k
+from langchain_community.document_compressors import RankLLMRerank
+from missing_citation_retriever.cross_encoder_reranker import CrossEncoderReranker
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever, _format_query_instruction
+
+
+def run_reranker(reranker, queries: list[str], candidates: list[list]) -> tuple[float, list[list[str]]]:
+    start = time.perf_counter()
+    ranked = [[doc.metadata['title'] for doc in reranker.compress_documents(docs, query)]
+              for query, docs in zip(queries, candidates)]
+    return time.perf_counter() - start, ranked
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the LLM and cross-encoder rerankers")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--quantize", action="store_true", help="Also benchmark the int8 quantized cross-encoder")
+    args = parser.parse_args()
+
+    retriever = MissingCitationRetriever(args.url, args.classifier_path, reranker='cross-encoder')
+
+    sentences = list(CITATION_TO_PAPER.keys())
+    cited_titles = list(CITATION_TO_PAPER.values())
+    queries = [_format_query_instruction(retriever._QUERY, sentence) for sentence in sentences]
+    candidates = retriever._retrieve_many(sentences)
+    num_pairs = sum(len(docs) for docs in candidates)
+
+    rerankers = {
+        'llm (gpt-4o-mini)': RankLLMRerank(top_n=5, model='gpt', gpt_model='gpt-4o-mini'),
+        'cross-encoder': retriever._reranker,
+    }
+    if args.quantize:
+        rerankers['cross-encoder (int8)'] = CrossEncoderReranker(top_n=5, device='cpu', quantize=True)
+
+    retrieved_titles = [[doc.metadata['title'] for doc in docs] for docs in candidates]
+    print(f"Retrieval only: recall@5 {recall_at_k(retrieved_titles, cited_titles, 5):.2f}")
+    for name, reranker in rerankers.items():
+        elapsed, ranked = run_reranker(reranker, queries, candidates)
+        print(f"{name}: {elapsed:.2f}s, {len(queries) / elapsed:.2f} queries/s, {num_pairs / elapsed:.1f} pairs/s, "
+              f"recall@5 {recall_at_k(ranked, cited_titles, 5):.2f}")
@@ -0,0 +1,130 @@
+"""
+Load test of the citation-check service, reporting p50/p99 latency and throughput.
+
+In `check` mode every client submits PDFs and polls the job until it is done, so the latency includes the time spent
+in the job queue. In `classify` mode every client sends batches of sentences to the classifier endpoint, which
+exercises micro-batching across clients. Rejected submissions (`503`) are counted and retried after a short delay.
+
+Start the service first, then run from the repository root:
+
+    python -m benchmarks.service_load_test check data/loose_pdfs/*.pdf --clients 8 --requests 32
+    python -m benchmarks.service_load_test classify --clients 32 --requests 500
+"""
+
+import aiohttp
+import argparse
+import asyncio
+import itertools
+import time
+
+from benchmarks.labeled_queries import CITATION_TO_PAPER
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Returns the p-th percentile of the values, using the nearest rank.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+async def check_paper(session: aiohttp.ClientSession, url: str, pdf: bytes, poll_interval: float,
+                      stats: dict) -> None:
+    while True:
+        async with session.post(f'{url}/papers/check', data=pdf,
+                                headers={'Content-Type': 'application/pdf'}) as response:
+            if response.status != 503:
+                response.raise_for_status()
+                job_url = url + (await response.json())['status_url']
+                break
+        stats['rejected'] += 1
+        await asyncio.sleep(poll_interval)
+
+    while True:
+        async with session.get(job_url) as response:
+            job = await response.json()
+        if job['status'] in ('done', 'failed'):
+            stats[job['status']] += 1
+            return
+        await asyncio.sleep(poll_interval)
+
+
+async def classify(session: aiohttp.ClientSession, url: str, sentences: list[str], stats: dict) -> None:
+    async with session.post(f'{url}/sentences/classify', json={'sentences': sentences}) as response:
+        response.raise_for_status()
+        await response.json()
+    stats['done'] += 1
+
+
+async def run_load_test(url: str, make_request, clients: int, requests: int) -> tuple[list[float], float, dict]:
+    """
+    Sends `requests` requests from `clients` concurrent clients.
+
+    Args:
+        url (str): The base URL of the service.
+        make_request (Callable): Called with the session, the request number and the stats, returns the coroutine
+            sending one request.
+        clients (int): The number of concurrent clients.
+        requests (int): The total number of requests.
+
+    Returns:
+        tuple[list[float], float, dict]: The latency of every request, the total time and the outcome counters.
+    """
+    counter = itertools.count()
+    latencies = []
+    stats = {'done': 0, 'failed': 0, 'rejected': 0}
+
+    async def client(session: aiohttp.ClientSession) -> None:
+        while (i := next(counter)) < requests:
+            start = time.perf_counter()
+            await make_request(session, i, stats)
+            latencies.append(time.perf_counter() - start)
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(f'{url}/health') as response:
+            response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    return latencies, elapsed, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the citation-check service")
+    parser.add_argument("mode", choices=["check", "classify"])
+    parser.add_argument("paths", nargs="*", help="PDF files submitted in check mode, cycled through")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="Base URL of the service")
+    parser.add_argument("--clients", type=int, default=8, help="Number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=32, help="Total number of requests")
+    parser.add_argument("--sentences-per-request", type=int, default=8, help="Sentences per classify request")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between job status polls")
+    args = parser.parse_args()
+
+    if args.mode == 'check':
+        if not args.paths:
+            parser.error("check mode needs at least one PDF")
+
+        pdfs = []
+        for path in args.paths:
+            with open(path, 'rb') as f:
+                pdfs.append(f.read())
+
+        def make_request(session, i, stats):
+            return check_paper(session, args.url, pdfs[i % len(pdfs)], args.poll_interval, stats)
+    else:
+        sentences = list(CITATION_TO_PAPER.keys())
+
+        def make_request(session, i, stats):
+            start = i * args.sentences_per_request
+            batch = [sentences[(start + j) % len(sentences)] for j in range(args.sentences_per_request)]
+            return classify(session, args.url, batch, stats)
+
+    latencies, elapsed, stats = asyncio.run(run_load_test(args.url, make_request, args.clients, args.requests))
+
+    print(f"{args.mode}: {len(latencies)} requests from {args.clients} clients in {elapsed:.2f}s")
+    print(f"  throughput {len(latencies) / elapsed:.2f} req/s")
+    print(f"  latency p50 {percentile(latencies, 50) * 1000:.0f}ms, p99 {percentile(latencies, 99) * 1000:.0f}ms")
+    print(f"  done {stats['done']}, failed {stats['failed']}, rejected with 503 {stats['rejected']}")
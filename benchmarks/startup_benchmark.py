@@ -0,0 +1,83 @@
+"""
+Benchmark of the cold start of `MissingCitationRetriever`: how long the module takes to import, how long the
+constructor takes now that models are loaded lazily, how long `warmup` takes and how long the first `check_paper`
+call takes with and without a prior warmup.
+
+Every measurement runs in a fresh interpreter so that nothing is already imported or loaded. Requires a running
+Elasticsearch instance with indexed papers. Run from the repository root:
+
+    python -m benchmarks.startup_benchmark paper.pdf --classifier-path <path> --reranker cross-encoder
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+_MODULE = 'missing_citation_retriever.missing_citation_retriever'
+
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from {module} import MissingCitationRetriever
+timings = {{'import': time.perf_counter() - start}}
+args = json.loads(sys.argv[1])
+
+start = time.perf_counter()
+retriever = MissingCitationRetriever(args['url'], args['classifier_path'], reranker=args['reranker'])
+timings['construct'] = time.perf_counter() - start
+
+if args['warmup']:
+    start = time.perf_counter()
+    retriever.warmup()
+    timings['warmup'] = time.perf_counter() - start
+
+if args['path']:
+    start = time.perf_counter()
+    retriever.check_paper(args['path'])
+    timings['first_check_paper'] = time.perf_counter() - start
+
+print(json.dumps(timings))
+"""
+
+
+def run_startup(url: str, classifier_path: str, reranker: str, path: str | None, warmup: bool) -> dict[str, float]:
+    """
+    Measures the startup stages in a fresh interpreter.
+
+    Args:
+        url (str): URL of the Elasticsearch instance.
+        classifier_path (str): Path to the citing sentence classifier.
+        reranker (str): Name of the reranker to use.
+        path (str | None): PDF to check after startup, or None to skip the first request.
+        warmup (bool): Whether to call `warmup` before the first request.
+
+    Returns:
+        dict[str, float]: Seconds spent in each stage.
+    """
+    args = json.dumps({'url': url, 'classifier_path': classifier_path, 'reranker': reranker,
+                       'path': path, 'warmup': warmup})
+    output = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT.format(module=_MODULE), args],
+                            check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _print_timings(label: str, timings: dict[str, float]) -> None:
+    stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
+    print(f"{label}: {stages} (total {sum(timings.values()):.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cold start of MissingCitationRetriever")
+    parser.add_argument("path", nargs="?", default=None, help="PDF to check as the first request")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--reranker", choices=["llm", "cross-encoder"], default="cross-encoder")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of fresh interpreters per configuration")
+    args = parser.parse_args()
+
+    for warmup in (False, True):
+        label = "with warmup" if warmup else "lazy"
+        for _ in range(args.repeats):
+            _print_timings(label, run_startup(args.url, args.classifier_path, args.reranker, args.path, warmup))
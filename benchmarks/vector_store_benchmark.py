@@ -0,0 +1,63 @@
+"""
+Benchmark comparing the retrieval throughput of Elasticsearch with the in-process `NumpyVectorStore`, on the fixed
+sentence set from `benchmarks/labeled_queries.py` repeated to fill batches.
+
+Both backends must be built from the same papers, e.g. with `python -m database.ingest papers.jsonl` and
+`python -m database.numpy_vector_store papers.jsonl papers_store`. Run from the repository root:
+
+    python -m benchmarks.vector_store_benchmark papers_store --classifier-path <path>
+"""
+
+import argparse
+import time
+
+from benchmarks.labeled_queries import CITATION_TO_PAPER, recall_at_k
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever
+
+
+def run_retrieval(retriever: MissingCitationRetriever, query_vectors: list, batch_size: int) -> tuple[float, list]:
+    start = time.perf_counter()
+    retrieved = []
+    for i in range(0, len(query_vectors), batch_size):
+        batch = query_vectors[i:i + batch_size]
+        if retriever._vector_store_path:
+            retrieved.extend(retriever._retrieve_many_locally(batch))
+        else:
+            doc_ids = retriever._parse_knn_responses(retriever._es.msearch(searches=retriever._knn_searches(batch)))
+            unique_ids = list(dict.fromkeys(doc_id for ids in doc_ids for doc_id in ids))
+            papers = retriever._found_papers(retriever._es.mget(index='papers', ids=unique_ids))
+            retrieved.extend(retriever._build_documents(doc_ids, papers))
+
+    return time.perf_counter() - start, retrieved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Elasticsearch and the local vector store")
+    parser.add_argument("vector_store_path", type=str, help="Directory of the local vector store")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--nprobe", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=1024, help="Number of queries, cycling through the set")
+    args = parser.parse_args()
+
+    sentences = list(CITATION_TO_PAPER.keys())
+    cited_titles = list(CITATION_TO_PAPER.values())
+
+    backends = {
+        'elasticsearch': MissingCitationRetriever(args.url, args.classifier_path, reranker='cross-encoder'),
+        'numpy': MissingCitationRetriever(args.url, args.classifier_path, reranker='cross-encoder',
+                                          vector_store_path=args.vector_store_path, nprobe=args.nprobe),
+    }
+
+    query_vectors = backends['numpy']._embeddings.embed_documents(backends['numpy']._query_instructions(sentences))
+    queries = [query_vectors[i % len(query_vectors)] for i in range(args.queries)]
+
+    for name, retriever in backends.items():
+        # The first pass warms up the caches and memory maps
+        run_retrieval(retriever, queries[:args.batch_size], args.batch_size)
+        elapsed, retrieved = run_retrieval(retriever, queries, args.batch_size)
+        titles = [list(dict.fromkeys(doc.metadata['title'] for doc in docs)) for docs in retrieved[:len(sentences)]]
+
+        print(f"{name}: {len(queries) / elapsed:.1f} queries/s, "
+              f"recall@10 {recall_at_k(titles, cited_titles, 10):.2f}")
@@ -75,10 +75,10 @@ df_val = filter_dataset(df_val)
 df_val = construct_dataset(df_val, 5000)
 
 def to_jsonlines(df: pd.DataFrame, path: str) -> None:
+  # Write each instance as it is built instead of collecting them all first
   with jsonlines.open(path, mode='w') as writer:
-    instances = []
     for row in df.itertuples():
-      instance = {
+      writer.write({
           "contents": [
               {
                   "role": "user",
@@ -89,11 +89,7 @@ def to_jsonlines(df: pd.DataFrame, path: str) -> None:
                   "parts": [{"text": "yes" if row.citing else "no"}]
               }
           ]
-      }
-
-      instances.append(instance)
-
-    writer.write_all(instances)
+      })
 
 to_jsonlines(df_train, '/content/citing_train.jsonl')
 
@@ -5,76 +5,118 @@ papers classified as either citing or non-citing sentences.
 The raw data is formed of text files for each paper with sentences separated by `\n============\n`.
 
 The sentences can be classified by the presence of a citation in the sentence, e.g.: `[1]`,
-`<GC:and.downey.fellows.vardy.whittle>`.
+`<GC:and.downey.fellows.vardy.whittle>`, `(Vaswani et al., 2017)`.
 
 The script will generate a dataset with the following columns:
 - `sentence`: the sentence text
 - `citing`: whether the sentence contains a citation
+
+Files are read and labelled by a pool of worker processes and the sentences are streamed into Parquet row groups as
+they arrive, so memory use does not depend on the size of the corpus. Each sentence is assigned to the
+train/validation/test split (80/10/10) by a hash of its text, which is deterministic and keeps duplicate sentences
+in the same split. Rows keep the order of the files, so shuffle the splits when sampling from them.
+
+Run from the repository root so that the citation marker scanner can be imported:
+
+    python -m data.generate_citing_sentences_dataset --data-dir <raw data> --output-dir <output>
 """
 
 import argparse
+import hashlib
 import os
-import pandas as pd
-import re
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from sklearn.model_selection import train_test_split
+from multiprocessing import Pool
+from paper_text_extractor.citation_markers import strip_citation_markers
+from typing import Iterator
 
 TEST_PQ = "citing_test.parquet"
 VAL_PQ = "citing_val.parquet"
 TRAIN_PQ = "citing_train.parquet"
 
-CITATION_REGEX = r" ?(\[\d+(?:-\d+|(?:, ?\d+(-\d+)?)*)+\]|<([A-Z]+:[a-zA-Z0-9._:/-]*)>) ?"
+SENTENCE_SEPARATOR = "\n============\n"
+
+SCHEMA = pa.schema([("sentence", pa.string()), ("citing", pa.bool_())])
+
+
+def _label_sentence(sentence: str) -> tuple[str, bool]:
+    stripped, markers = strip_citation_markers(sentence)
+    return stripped, bool(markers)
 
 
-def generate_citing_sentences_dataset(data_dir: str, output_dir: str):
-    # Glob all .txt files in the hierarchy
-    files = []
+def _label_file(path: str) -> list[tuple[str, bool]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [_label_sentence(sentence) for sentence in f.read().split(SENTENCE_SEPARATOR)]
 
+
+def _iter_files(data_dir: str) -> Iterator[str]:
+    # Walk all .txt files in the hierarchy
     for root, _, filenames in os.walk(data_dir):
         for filename in filenames:
             if filename.endswith(".txt"):
-                files.append(os.path.join(root, filename))
-
-    print(f"Found {len(files)} files")
-
-    # Construct the dataset in memory (requires 3 GB of RAM)
-    df = pd.DataFrame(
-        map(
-            lambda sentence: [
-                re.sub(CITATION_REGEX, "", sentence),
-                bool(re.search(CITATION_REGEX, sentence)),
-            ],
-            [
-                sentences
-                for file in files
-                for sentences in open(file, "r", encoding="utf-8")
-                .read()
-                .split("\n============\n")
-            ],
-        ),
-        columns=["sentence", "citing"],
-    )
-
-    # split the dataset into training, validation and test sets (80/10/10)
-    df_train, df_test = train_test_split(df, test_size=0.2, random_state=42)
-    df_test, df_val = train_test_split(df_test, test_size=0.5, random_state=42)
-
-    # save the datasets to disk
-    df_train.to_parquet(
-        os.path.join(output_dir, TRAIN_PQ),
-        engine="pyarrow",
-        compression="snappy",
-    )
-    df_val.to_parquet(
-        os.path.join(output_dir, VAL_PQ),
-        engine="pyarrow",
-        compression="snappy",
-    )
-    df_test.to_parquet(
-        os.path.join(output_dir, TEST_PQ),
-        engine="pyarrow",
-        compression="snappy",
-    )
+                yield os.path.join(root, filename)
+
+
+def assign_split(sentence: str) -> str:
+    """
+    Deterministically assigns a sentence to the train (80%), validation (10%) or test (10%) split.
+    """
+    bucket = int.from_bytes(hashlib.blake2b(sentence.encode("utf-8"), digest_size=8).digest(), "big") % 10
+
+    if bucket < 8:
+        return TRAIN_PQ
+    return VAL_PQ if bucket == 8 else TEST_PQ
+
+
+class _SplitWriter:
+    """
+    Buffers the rows of one split and writes them to its Parquet file one row group at a time.
+    """
+
+    def __init__(self, path: str, row_group_size: int):
+        self.writer = pq.ParquetWriter(path, SCHEMA, compression="snappy")
+        self.row_group_size = row_group_size
+        self.sentences = []
+        self.citing = []
+        self.rows = 0
+
+    def append(self, sentence: str, citing: bool):
+        self.sentences.append(sentence)
+        self.citing.append(citing)
+
+        if len(self.sentences) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.sentences:
+            self.writer.write_table(pa.table([self.sentences, self.citing], schema=SCHEMA))
+            self.rows += len(self.sentences)
+            self.sentences, self.citing = [], []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def generate_citing_sentences_dataset(data_dir: str, output_dir: str, workers: int = None,
+                                      row_group_size: int = 100_000):
+    writers = {split: _SplitWriter(os.path.join(output_dir, split), row_group_size)
+               for split in (TRAIN_PQ, VAL_PQ, TEST_PQ)}
+    files = 0
+
+    try:
+        with Pool(workers) as pool:
+            for sentences in pool.imap(_label_file, _iter_files(data_dir), chunksize=16):
+                files += 1
+                for sentence, citing in sentences:
+                    writers[assign_split(sentence)].append(sentence, citing)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    print(f"Processed {files} files: " + ", ".join(f"{split}: {writer.rows} sentences"
+                                                   for split, writer in writers.items()))
 
 
 if __name__ == "__main__":
@@ -82,6 +124,10 @@ if __name__ == "__main__":
     parser.add_argument("--data-dir", type=str, required=True, help="Directory with the raw data files")
     parser.add_argument("--output-dir", type=str, required=True,
                         help="Directory to save the generated dataset")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes reading the raw files (defaults to the number of CPUs)")
+    parser.add_argument("--row-group-size", type=int, default=100_000,
+                        help="Number of sentences per Parquet row group")
     args = parser.parse_args()
 
-    generate_citing_sentences_dataset(args.data_dir, args.output_dir)
+    generate_citing_sentences_dataset(args.data_dir, args.output_dir, args.workers, args.row_group_size)
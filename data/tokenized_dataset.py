@@ -0,0 +1,396 @@
+"""
+Pre-tokenized, memory-mapped splits of the citing sentences dataset for training the citing sentence classifier.
+
+A Parquet split generated by `data.generate_citing_sentences_dataset` is read one record batch at a time, filtered like
+in the fine-tuning notebooks (rows with a missing value or a `<figure>` or `<formula>` placeholder are dropped) and
+tokenized once into shards of a directory:
+- `meta.json`: the tokenizer, the maximum length, the type of the token IDs, the padding token and the shards
+- `shard-NNNNN.tokens.bin`: the token IDs of every sentence of the shard, concatenated, without padding
+- `shard-NNNNN.offsets.npy`: the int64 offset of each sentence in the tokens of the shard, followed by their count
+- `shard-NNNNN.labels.npy`: the int8 label of each sentence
+
+`TokenizedDataset` memory-maps the shards, so training reads token IDs from the page cache instead of tokenizing
+sentences on every run, and knows the length of every sentence without reading its tokens. `LengthGroupedSampler`
+batches sentences of similar lengths together so that `TokenizedDataset.collate` pads each batch only to its longest
+sentence:
+
+    dataset = TokenizedDataset('citing_train_tokens')
+    loader = DataLoader(dataset, batch_sampler=LengthGroupedSampler(dataset.lengths, 64), collate_fn=dataset.collate)
+
+`export_jsonlines` streams a split into the JSONL format of the Gemini tuning notebooks in constant memory, or samples a
+balanced subset of it with `--limit`. Run from the repository root:
+
+    python -m data.tokenized_dataset tokenize citing_train.parquet citing_train_tokens --tokenizer allenai/scibert_scivocab_uncased
+    python -m data.tokenized_dataset export-jsonl citing_val.parquet citing_val.jsonl --limit 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from typing import Iterator, Optional
+
+_PLACEHOLDER_REGEX = re.compile(r"<figure>|<formula>")
+
+
+def iter_sentences(path: str, batch_size: int = 10_000) -> Iterator[tuple[list[str], list[bool]]]:
+    """
+    Streams the sentences of a Parquet split, leaving out the rows the classifier is not trained on.
+
+    Args:
+        path (str): The Parquet file, with a `sentence` and a `citing` column.
+        batch_size (int): The number of rows read at a time.
+
+    Yields:
+        tuple[list[str], list[bool]]: The sentences of each record batch and their labels.
+    """
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=["sentence", "citing"]):
+        rows = batch.to_pydict()
+        kept = [(sentence, citing) for sentence, citing in zip(rows["sentence"], rows["citing"])
+                if sentence is not None and citing is not None and not _PLACEHOLDER_REGEX.search(sentence)]
+        if kept:
+            sentences, labels = zip(*kept)
+            yield list(sentences), list(labels)
+
+
+class _ShardWriter:
+    """
+    Appends tokenized sentences to the files of one shard.
+    """
+
+    def __init__(self, output_dir: str, name: str, dtype: np.dtype):
+        self.output_dir = output_dir
+        self.name = name
+        self.dtype = dtype
+        self.tokens_file = open(os.path.join(output_dir, f"{name}.tokens.bin"), "wb")
+        self.offsets = [0]
+        self.labels = []
+
+    @property
+    def rows(self) -> int:
+        return len(self.labels)
+
+    def append(self, input_ids: list[list[int]], labels: list[bool]):
+        lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+        self.tokens_file.write(np.fromiter((token for ids in input_ids for token in ids), dtype=self.dtype,
+                                           count=int(lengths.sum())).tobytes())
+        self.offsets.extend((self.offsets[-1] + np.cumsum(lengths)).tolist())
+        self.labels.extend(labels)
+
+    def close(self) -> dict:
+        self.tokens_file.close()
+        np.save(os.path.join(self.output_dir, f"{self.name}.offsets.npy"), np.array(self.offsets, dtype=np.int64))
+        np.save(os.path.join(self.output_dir, f"{self.name}.labels.npy"), np.array(self.labels, dtype=np.int8))
+        print(f"Wrote {self.name}: {self.rows} sentences, {self.offsets[-1]} tokens")
+
+        return {"name": self.name, "rows": self.rows, "tokens": self.offsets[-1]}
+
+
+def tokenize_split(path: str, output_dir: str, tokenizer, max_length: int = 512, shard_rows: int = 1_000_000,
+                   batch_size: int = 10_000, limit: Optional[int] = None) -> dict:
+    """
+    Tokenizes a Parquet split once into memory-mapped shards, holding a single record batch in memory at a time.
+
+    Args:
+        path (str): The Parquet file, with a `sentence` and a `citing` column.
+        output_dir (str): The directory of the shards, created if needed.
+        tokenizer (PreTrainedTokenizerBase): The tokenizer of the classifier, preferably a fast one.
+        max_length (int): The number of tokens sentences are truncated to, including the special tokens.
+        shard_rows (int): The maximum number of sentences per shard.
+        batch_size (int): The number of rows read and tokenized at a time.
+        limit (int): The maximum number of sentences tokenized, every sentence if None.
+
+    Returns:
+        dict: The metadata of the tokenized split, as written to `meta.json`.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # SciBERT and BERT vocabularies fit in 16 bits, which halves the size of the shards
+    dtype = np.dtype(np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32)
+
+    shards = []
+    writer = None
+    rows = 0
+
+    for sentences, labels in iter_sentences(path, batch_size):
+        if limit is not None:
+            sentences, labels = sentences[:limit - rows], labels[:limit - rows]
+
+        input_ids = tokenizer(sentences, add_special_tokens=True, truncation=True, max_length=max_length)["input_ids"]
+        start = 0
+        while start < len(input_ids):
+            if writer is None:
+                writer = _ShardWriter(output_dir, f"shard-{len(shards):05d}", dtype)
+
+            end = start + shard_rows - writer.rows
+            writer.append(input_ids[start:end], labels[start:end])
+            start = end
+
+            if writer.rows == shard_rows:
+                shards.append(writer.close())
+                writer = None
+
+        rows += len(input_ids)
+        if limit is not None and rows >= limit:
+            break
+
+    if writer is not None:
+        shards.append(writer.close())
+
+    meta = {
+        "source": os.path.abspath(path),
+        "tokenizer": getattr(tokenizer, "name_or_path", None),
+        "max_length": max_length,
+        "dtype": dtype.name,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "rows": sum(shard["rows"] for shard in shards),
+        "tokens": sum(shard["tokens"] for shard in shards),
+        "shards": shards,
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+class TokenizedDataset:
+    """
+    Map-style dataset over the shards written by `tokenize_split`, usable with a PyTorch `DataLoader`.
+
+    The shards are memory-mapped on first access in each process, so the dataset is cheap to send to `DataLoader`
+    workers.
+
+    Args:
+        path (str): The directory of the shards.
+
+    Attributes:
+        lengths (np.ndarray): The number of tokens of each sentence, e.g. for `LengthGroupedSampler`.
+        labels (np.ndarray): The label of each sentence.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        offsets = [np.load(os.path.join(path, f"{shard['name']}.offsets.npy")) for shard in self.meta["shards"]]
+        self.lengths = np.concatenate([np.diff(shard_offsets) for shard_offsets in offsets]) \
+            if offsets else np.zeros(0, dtype=np.int64)
+        self.labels = np.concatenate([np.load(os.path.join(path, f"{shard['name']}.labels.npy"))
+                                      for shard in self.meta["shards"]]) if offsets else np.zeros(0, dtype=np.int8)
+        self._offsets = offsets
+        # The index of the first sentence of each shard, and the number of sentences
+        self._starts = np.cumsum([0] + [shard["rows"] for shard in self.meta["shards"]])
+        self._tokens = None
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getstate__(self) -> dict:
+        # Memory maps are opened again by each worker rather than pickled with their content
+        return {**self.__dict__, "_tokens": None}
+
+    def _shard_tokens(self) -> list[np.memmap]:
+        if self._tokens is None:
+            self._tokens = [np.memmap(os.path.join(self.path, f"{shard['name']}.tokens.bin"), dtype=self.meta["dtype"],
+                                      mode="r", shape=(shard["tokens"],)) if shard["tokens"] else
+                            np.zeros(0, dtype=self.meta["dtype"])
+                            for shard in self.meta["shards"]]
+        return self._tokens
+
+    def __getitem__(self, index: int) -> dict:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Index {index} out of range for {len(self)} sentences")
+        index %= len(self)
+
+        shard = int(np.searchsorted(self._starts, index, side="right")) - 1
+        row = index - self._starts[shard]
+        start, end = self._offsets[shard][row], self._offsets[shard][row + 1]
+
+        return {"input_ids": np.asarray(self._shard_tokens()[shard][start:end], dtype=np.int64),
+                "labels": int(self.labels[index])}
+
+    def collate(self, batch: list[dict]) -> dict:
+        """
+        Pads a batch to its longest sentence, returning the tensors expected by `AutoModelForSequenceClassification`.
+
+        Args:
+            batch (list[dict]): The items of the batch.
+
+        Returns:
+            dict: The `input_ids`, `attention_mask` and `labels` tensors.
+        """
+        import torch
+
+        width = max(len(item["input_ids"]) for item in batch)
+        input_ids = np.full((len(batch), width), self.meta["pad_token_id"], dtype=np.int64)
+        attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+        for i, item in enumerate(batch):
+            input_ids[i, :len(item["input_ids"])] = item["input_ids"]
+            attention_mask[i, :len(item["input_ids"])] = 1
+
+        return {"input_ids": torch.from_numpy(input_ids), "attention_mask": torch.from_numpy(attention_mask),
+                "labels": torch.tensor([item["labels"] for item in batch], dtype=torch.long)}
+
+
+class LengthGroupedSampler:
+    """
+    Batch sampler grouping sentences of similar lengths, to be passed as the `batch_sampler` of a `DataLoader`.
+
+    Sentences are shuffled, split into groups of `group_batches` batches, sorted by length within each group and cut
+    into batches, and the batches are shuffled. Batches stay random across the dataset while padding each one to its
+    longest sentence wastes little computation.
+
+    Args:
+        lengths (np.ndarray): The number of tokens of each sentence.
+        batch_size (int): The number of sentences per batch.
+        group_batches (int): The number of batches sorted by length together, larger groups pad less but are less
+            random.
+        shuffle (bool): Whether to shuffle the sentences, or to batch them in order.
+        drop_last (bool): Whether to drop the last batch if it is smaller than `batch_size`.
+        seed (int): The seed of the shuffling, combined with the epoch set with `set_epoch`.
+    """
+
+    def __init__(self, lengths: np.ndarray, batch_size: int, group_batches: int = 50, shuffle: bool = True,
+                 drop_last: bool = False, seed: int = 0):
+        if batch_size < 1 or group_batches < 1:
+            raise ValueError("batch_size and group_batches must be positive")
+
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.group_batches = group_batches
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """
+        Sets the epoch, so that each epoch is shuffled differently.
+        """
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return -(-len(self.lengths) // self.batch_size)
+
+    def __iter__(self) -> Iterator[list[int]]:
+        rng = np.random.default_rng([self.seed, self.epoch])
+        indices = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+
+        group_size = self.batch_size * self.group_batches
+        batches = []
+        for start in range(0, len(indices), group_size):
+            group = indices[start:start + group_size]
+            # Longest first, so that the largest batch of a group is padded and allocated first
+            group = group[np.argsort(-self.lengths[group], kind="stable")]
+            batches.extend(group[i:i + self.batch_size] for i in range(0, len(group), self.batch_size))
+
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        for batch in batches:
+            yield batch.tolist()
+
+
+def to_instance(sentence: str, citing: bool) -> dict:
+    """
+    Turns a labeled sentence into a tuning example of the Gemini tuning notebooks.
+    """
+    return {
+        "contents": [
+            {"role": "user", "parts": [{"text": sentence}]},
+            {"role": "model", "parts": [{"text": "yes" if citing else "no"}]},
+        ]
+    }
+
+
+def export_jsonlines(path: str, output_path: str, limit: Optional[int] = None, batch_size: int = 10_000,
+                     seed: int = 42) -> int:
+    """
+    Streams a Parquet split into a JSONL file of tuning examples, holding a single record batch in memory at a time.
+
+    With a `limit`, the examples are sampled like in `data.convert_parquet_to_jsonlines.construct_dataset` instead: half
+    of them citing and half not, drawn uniformly from the whole split by reservoir sampling and shuffled, so only the
+    sampled sentences are held in memory.
+
+    Args:
+        path (str): The Parquet file, with a `sentence` and a `citing` column.
+        output_path (str): The JSONL file.
+        limit (int): The number of examples sampled, every sentence in file order if None.
+        batch_size (int): The number of rows read at a time.
+        seed (int): The seed of the sampling.
+
+    Returns:
+        int: The number of examples written, fewer than `limit` if a label has fewer than `limit // 2` sentences.
+    """
+    if limit is None:
+        written = 0
+        with open(output_path, "w", encoding="utf-8") as f:
+            for sentences, labels in iter_sentences(path, batch_size):
+                for sentence, citing in zip(sentences, labels):
+                    f.write(json.dumps(to_instance(sentence, citing)) + "\n")
+                    written += 1
+
+        return written
+
+    rng = random.Random(seed)
+    per_label = limit // 2
+    reservoirs = {True: [], False: []}
+    seen = {True: 0, False: 0}
+    for sentences, labels in iter_sentences(path, batch_size):
+        for sentence, citing in zip(sentences, labels):
+            citing = bool(citing)
+            reservoir = reservoirs[citing]
+            seen[citing] += 1
+            if len(reservoir) < per_label:
+                reservoir.append(sentence)
+            elif (i := rng.randrange(seen[citing])) < per_label:
+                reservoir[i] = sentence
+
+    examples = [(sentence, citing) for citing, reservoir in reservoirs.items() for sentence in reservoir]
+    rng.shuffle(examples)
+    with open(output_path, "w", encoding="utf-8") as f:
+        for sentence, citing in examples:
+            f.write(json.dumps(to_instance(sentence, citing)) + "\n")
+
+    return len(examples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenize or export the splits of the citing sentences dataset")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tokenize_parser = subparsers.add_parser("tokenize", help="Tokenize a Parquet split into memory-mapped shards")
+    tokenize_parser.add_argument("split", type=str, help="Parquet file of the split")
+    tokenize_parser.add_argument("output_dir", type=str, help="Directory of the shards")
+    tokenize_parser.add_argument("--tokenizer", type=str, required=True,
+                                 help="Name or path of the tokenizer of the classifier")
+    tokenize_parser.add_argument("--max-length", type=int, default=512)
+    tokenize_parser.add_argument("--shard-rows", type=int, default=1_000_000, help="Sentences per shard")
+    tokenize_parser.add_argument("--batch-size", type=int, default=10_000, help="Rows tokenized at a time")
+    tokenize_parser.add_argument("--limit", type=int, default=None, help="Maximum number of sentences")
+
+    export_parser = subparsers.add_parser("export-jsonl", help="Stream a Parquet split into tuning examples")
+    export_parser.add_argument("split", type=str, help="Parquet file of the split")
+    export_parser.add_argument("output", type=str, help="JSONL file")
+    export_parser.add_argument("--limit", type=int, default=None,
+                               help="Number of examples sampled, half of them citing, instead of every sentence")
+    export_parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == "tokenize":
+        from transformers import AutoTokenizer
+
+        meta = tokenize_split(args.split, args.output_dir, AutoTokenizer.from_pretrained(args.tokenizer),
+                              args.max_length, args.shard_rows, args.batch_size, args.limit)
+        print(f"Wrote {meta['rows']} sentences and {meta['tokens']} tokens in {len(meta['shards'])} shards")
+    else:
+        print(f"Wrote {export_jsonlines(args.split, args.output, args.limit, seed=args.seed)} examples")
@@ -0,0 +1,238 @@
+"""
+Content-addressed, persistent cache for text embeddings.
+
+Vectors are stored as float16 rows of a memory-mapped file, with an SQLite index mapping the hash of
+(model, kind, text) to the row holding its vector. A bounded in-memory LRU sits in front of the disk store.
+"""
+
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from pathlib import Path
+from typing import List, Optional
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store for a single model.
+
+    Only one process should write to a cache directory at a time; any number of threads in that process may use it.
+
+    Args:
+        cache_dir (str | Path): The directory holding the cache files of every model.
+        model_name (str): The name of the embedding model, used to namespace the cache.
+        max_memory_entries (int): The maximum number of vectors kept in the in-memory LRU.
+
+    Attributes:
+        hits (int): Number of lookups served from memory.
+        disk_hits (int): Number of lookups served from disk.
+        misses (int): Number of lookups not found in the cache.
+    """
+
+    def __init__(self, cache_dir: str | Path, model_name: str, max_memory_entries: int = 100_000):
+        self._model_name = model_name
+        self._dir = Path(cache_dir) / re.sub(r'[^A-Za-z0-9._-]', '_', model_name)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self._dir / 'vectors.f16'
+
+        self._db = sqlite3.connect(self._dir / 'index.sqlite', check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, row INTEGER NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._db.commit()
+
+        dim = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self._dim: Optional[int] = int(dim[0]) if dim else None
+        self._vectors: Optional[np.memmap] = None
+
+        self._memory: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._max_memory_entries = max_memory_entries
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str, kind: str = 'document') -> bytes:
+        """
+        Computes the cache key of a text, which depends on the model, the kind of embedding and the text itself.
+        """
+        return hashlib.sha256(f'{self._model_name}\0{kind}\0{text}'.encode('utf-8')).digest()
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up several vectors at once.
+
+        Args:
+            keys (List[bytes]): The keys to look up, as returned by `key`.
+
+        Returns:
+            List[Optional[np.ndarray]]: The float16 vector for each key, or None if it is not cached.
+        """
+        with self._lock:
+            results: List[Optional[np.ndarray]] = [None] * len(keys)
+            missing = {}
+
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                rows = self._lookup_rows(list(missing))
+                vectors = self._mapped_vectors()
+
+                for key, positions in missing.items():
+                    if key not in rows:
+                        self.misses += len(positions)
+                        continue
+
+                    vector = np.array(vectors[rows[key]])
+                    self._remember(key, vector)
+                    for i in positions:
+                        results[i] = vector
+                    self.disk_hits += len(positions)
+
+            return results
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        """
+        Stores several vectors at once. Keys that are already cached are skipped.
+
+        Args:
+            keys (List[bytes]): The keys of the vectors, as returned by `key`.
+            vectors (np.ndarray): A (len(keys), dim) array of vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float16)
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._db.execute("INSERT INTO meta (name, value) VALUES ('dim', ?)", (str(self._dim),))
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected vectors of dimension {self._dim}, got {vectors.shape[1]}")
+
+            existing = self._lookup_rows(keys)
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in existing and key not in new:
+                    new[key] = vector
+
+            if new:
+                # Write the vectors before committing the index so that it never points past the end of the file
+                with open(self._vectors_path, 'ab') as f:
+                    first_row = f.tell() // (self._dim * 2)
+                    f.write(np.stack(list(new.values())).tobytes())
+
+                self._db.executemany('INSERT INTO embeddings (key, row) VALUES (?, ?)',
+                                     [(key, first_row + i) for i, key in enumerate(new)])
+
+            self._db.commit()
+
+            for key, vector in new.items():
+                self._remember(key, vector)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counts of the cache.
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _lookup_rows(self, keys: List[bytes]) -> dict:
+        rows = {}
+        # Stay below SQLite's limit on the number of bound parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = f"SELECT key, row FROM embeddings WHERE key IN ({', '.join('?' * len(chunk))})"
+            rows.update(self._db.execute(query, chunk).fetchall())
+        return rows
+
+    def _mapped_vectors(self) -> np.ndarray:
+        if self._dim is None or not self._vectors_path.exists():
+            return np.empty((0, 0), dtype=np.float16)
+
+        num_rows = self._vectors_path.stat().st_size // (self._dim * 2)
+        # The file only ever grows, so remap it when rows were added since the last mapping
+        if self._vectors is None or self._vectors.shape[0] != num_rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r', shape=(num_rows, self._dim))
+
+        return self._vectors
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self._max_memory_entries:
+            self._memory.popitem(last=False)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so that texts embedded before are read from an `EmbeddingCache` instead of being
+    embedded again.
+
+    Returned vectors are always rounded to float16, whether they come from the cache or from the model, so results do
+    not depend on the state of the cache.
+
+    Args:
+        embeddings (Embeddings): The wrapped embedding model.
+        cache_dir (str | Path): The directory where the cache is stored.
+        model_name (str): The name used to namespace the cache, defaults to the `model_name` of the wrapped model.
+        max_memory_entries (int): The maximum number of vectors kept in the in-memory LRU.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_dir: str | Path, model_name: Optional[str] = None,
+                 max_memory_entries: int = 100_000):
+        self.embeddings = embeddings
+        self.model_name = model_name or embeddings.model_name
+        self.cache = EmbeddingCache(cache_dir, self.model_name, max_memory_entries)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, 'document', self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], 'query', lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counts of the underlying cache.
+        """
+        return self.cache.stats()
+
+    def _embed(self, texts: List[str], kind: str, embed_fn) -> List[List[float]]:
+        if not texts:
+            return []
+
+        keys = [self.cache.key(text, kind) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # Embed every distinct missing text once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = np.asarray(embed_fn(missing), dtype=np.float16)
+            self.cache.put_many([self.cache.key(text, kind) for text in missing], computed)
+
+            computed_by_text = dict(zip(missing, computed))
+            vectors = [computed_by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+        logging.debug(f"Embedding cache: {self.cache.stats()}")
+
+        return [vector.astype(np.float32).tolist() for vector in vectors]
@@ -0,0 +1,441 @@
+"""
+Streaming, resumable ingestion of large paper corpora into the indices used by `MissingCitationRetriever`.
+
+Papers are read from a JSONL or Parquet file with a title and an abstract per record and written to two indices, in
+the same layout as `MissingCitationRetriever.index_papers`:
+- `papers`: the title and abstract of each paper, and its metadata
+- `paper_embeddings`: the embedded chunks of each paper, pointing back to it through `metadata.id`, with a copy of the
+  metadata of the paper to filter the kNN search on (see `database.paper_metadata`)
+
+Only one batch of papers is held in memory at a time. The next batch is embedded while the previous one is being
+sent to Elasticsearch, and a checkpoint file records how many source records were ingested after every batch, so that
+an interrupted run can be resumed by running the same command again. Paper and chunk IDs are derived from the
+normalized paper content or from an external paper ID, and papers already in the index are skipped before being
+embedded, which makes re-running an ingestion cheap and never duplicates documents.
+
+Usage:
+    python -m database.ingest papers.jsonl --checkpoint papers.ckpt
+    python -m database.ingest s2_papers.jsonl --year-field year --venue-field venue \
+        --fields-of-study-field fieldsOfStudy --external-ids-field externalIds
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from database.embedding_cache import CachedEmbeddings
+from database.knn_profiles import KNN_PROFILES, QUANTIZED_INDEX_TYPES, KnnProfile, chunk_index_mappings
+from database.paper_metadata import METADATA_PROPERTIES, paper_metadata
+from database.result_cache import bump_index_generation
+from database.vector_database import VectorDatabase, paper_id, paper_text_splitter
+from elasticsearch import helpers
+from langchain_core.documents import Document
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+def read_papers(path: str | Path,
+                title_field: str = 'title',
+                abstract_field: str = 'abstract',
+                skip: int = 0,
+                id_field: Optional[str] = None,
+                metadata_fields: Optional[dict[str, str]] = None) -> Iterator[tuple[int, dict]]:
+    """
+    Streams papers from a JSONL or Parquet file.
+
+    Records without a title or an abstract are skipped, but still count towards the record positions.
+
+    Args:
+        path (str | Path): The path to a `.jsonl` or `.parquet` file.
+        title_field (str): The name of the field holding the paper title.
+        abstract_field (str): The name of the field holding the paper abstract.
+        skip (int): The number of records at the start of the file to skip, e.g. when resuming.
+        id_field (str): The name of an optional field holding an external paper ID, such as a DOI.
+        metadata_fields (dict[str, str]): The names of the fields holding the metadata of the papers, by metadata key
+            ('year', 'venue', 'fields_of_study' or 'external_ids').
+
+    Returns:
+        Iterator[tuple[int, dict]]: The position of each record after the current one in the file, and the paper as a
+            dictionary with a 'title' and an 'abstract' key, an 'external_id' key if the record has one, and the
+            metadata keys the record has a value for.
+    """
+    path = Path(path)
+    metadata_fields = metadata_fields or {}
+    columns = [title_field, abstract_field] + ([id_field] if id_field else []) + list(metadata_fields.values())
+
+    if path.suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        def records():
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=10_000, columns=columns):
+                yield from batch.to_pylist()
+    else:
+        def records():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line) if line.strip() else {}
+
+    for position, record in enumerate(itertools.islice(records(), skip, None), start=skip + 1):
+        title, abstract = record.get(title_field), record.get(abstract_field)
+        if title and abstract:
+            paper = {'title': title, 'abstract': abstract}
+            if id_field and record.get(id_field):
+                paper['external_id'] = str(record[id_field])
+            paper.update(paper_metadata({key: record.get(field) for key, field in metadata_fields.items()}))
+            yield position, paper
+
+
+class Checkpoint:
+    """
+    Progress of an ingestion run, persisted to a JSON file after every batch.
+
+    Args:
+        path (str | Path): The checkpoint file, or None to disable checkpointing.
+        source (str): The ingested file, used to refuse resuming a run from a different source.
+    """
+
+    def __init__(self, path: Optional[str | Path], source: str):
+        self.path = Path(path) if path else None
+        self.source = source
+        self.records_done = 0
+        self.papers = 0
+        self.chunks = 0
+        self.errors = 0
+
+        if self.path and self.path.exists():
+            state = json.loads(self.path.read_text())
+            if state['source'] != source:
+                raise ValueError(f"Checkpoint {self.path} belongs to {state['source']}, not {source}")
+
+            self.records_done = state['records_done']
+            self.papers = state['papers']
+            self.chunks = state['chunks']
+            self.errors = state['errors']
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        # Write to a temporary file first so that a crash never leaves a truncated checkpoint
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(json.dumps({
+            'source': self.source,
+            'records_done': self.records_done,
+            'papers': self.papers,
+            'chunks': self.chunks,
+            'errors': self.errors,
+        }))
+        os.replace(tmp_path, self.path)
+
+
+class Ingester:
+    """
+    Embeds batches of papers and streams them into Elasticsearch.
+
+    Args:
+        db (VectorDatabase): The database to ingest into.
+        embeddings: The embedding model for the paper chunks.
+        papers_index (str): The index storing the titles and abstracts.
+        chunks_index (str): The index storing the embedded chunks.
+        chunk_size (int): The maximum number of actions per bulk request.
+        max_chunk_bytes (int): The maximum size in bytes of a bulk request.
+        threads (int): The number of threads sending bulk requests, 1 uses `streaming_bulk`, more use
+            `parallel_bulk`.
+        errors_file (str | Path): Optional JSONL file where the failed bulk items are appended.
+        skip_existing (bool): Whether to skip the papers whose ID is already in the papers index instead of embedding
+            and indexing them again. Their metadata is still set in place, see `update_paper_metadata`.
+        knn_profile (str | KnnProfile): The kNN profile whose HNSW and quantization settings are used when creating
+            the chunks index.
+        quantization (str): Overrides the quantization of the kNN profile, one of 'none', 'int8', 'int4' or 'bbq'.
+    """
+
+    def __init__(self, db: VectorDatabase, embeddings, papers_index: str = 'papers',
+                 chunks_index: str = 'paper_embeddings', chunk_size: int = 500,
+                 max_chunk_bytes: int = 10 * 1024 * 1024, threads: int = 1, errors_file: Optional[str | Path] = None,
+                 knn_profile: str | KnnProfile = 'balanced', quantization: Optional[str] = None,
+                 skip_existing: bool = True):
+        self.db = db
+        self.embeddings = embeddings
+        self.papers_index = papers_index
+        self.chunks_index = chunks_index
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.threads = threads
+        self.errors_file = errors_file
+        self.knn_profile = knn_profile
+        self.quantization = quantization
+        self.skip_existing = skip_existing
+        self.metadata_updates = 0
+        self.text_splitter = paper_text_splitter()
+
+    def ensure_indices(self, dims: int) -> None:
+        """
+        Creates the papers and chunks indices if they do not exist yet.
+
+        Existing indices keep their mappings, so a different kNN profile or quantization needs a new chunks index.
+        """
+        self.db.create_index_if_missing(self.papers_index, {'properties': {
+            'title': {'type': 'text'},
+            'abstract': {'type': 'text'},
+            'external_id': {'type': 'keyword'},
+            **METADATA_PROPERTIES,
+        }})
+        self.db.create_index_if_missing(self.chunks_index,
+                                        chunk_index_mappings(dims, self.knn_profile, self.quantization))
+
+    def build_actions(self, papers: list[dict]) -> list[dict]:
+        """
+        Splits and embeds a batch of papers and turns them into bulk actions for both indices.
+
+        Papers repeated in the batch are only kept once, the first time they appear like in
+        `MissingCitationRetriever.index_papers`, and papers already in the index are left out when `skip_existing` is
+        set, only getting their metadata updated.
+
+        Args:
+            papers (list[dict]): The papers, each with a 'title' and an 'abstract' key, and optionally metadata keys.
+
+        Returns:
+            list[dict]: The bulk actions, the chunk actions first, empty if every paper is already indexed.
+        """
+        papers_by_id = {}
+        for paper in papers:
+            papers_by_id.setdefault(paper_id(paper['title'], paper['abstract'], paper.get('external_id')), paper)
+        if self.skip_existing:
+            existing = {id_: paper_metadata(papers_by_id.pop(id_))
+                        for id_ in self.db.existing_ids(list(papers_by_id), self.papers_index)}
+            self.metadata_updates += self.db.update_paper_metadata(existing, self.papers_index, self.chunks_index)
+
+        ids = list(papers_by_id)
+        papers = list(papers_by_id.values())
+        docs = [Document(page_content='\n\n'.join([paper['title'], paper['abstract']]),
+                         metadata={'id': id_, **paper_metadata(paper)})
+                for paper, id_ in zip(papers, ids)]
+        chunks = self.text_splitter.split_documents(docs)
+        vectors = self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+        actions = []
+        chunk_numbers = {}
+        for chunk, vector in zip(chunks, vectors):
+            id_ = chunk.metadata['id']
+            chunk_number = chunk_numbers[id_] = chunk_numbers.get(id_, -1) + 1
+            actions.append({
+                '_index': self.chunks_index,
+                '_id': f'{id_}-{chunk_number}',
+                '_source': {'text': chunk.page_content, 'vector': vector, 'metadata': chunk.metadata},
+            })
+        actions.extend({'_index': self.papers_index, '_id': id_, '_source': paper} for paper, id_ in zip(papers, ids))
+
+        return actions
+
+    def send(self, actions: list[dict]) -> tuple[int, int, int]:
+        """
+        Sends bulk actions to Elasticsearch in byte-bounded requests, collecting per-item errors instead of failing.
+
+        Chunks are sent before their papers, and a paper is only written once all of its chunks were, since papers
+        already in the index are skipped: a paper written without its chunks would never get them on a later run.
+        Papers held back because of a failed chunk count as failed actions.
+
+        Args:
+            actions (list[dict]): The bulk actions.
+
+        Returns:
+            tuple[int, int, int]: The number of successful and failed actions, and the number of papers written.
+        """
+        chunk_actions = [action for action in actions if action['_index'] != self.papers_index]
+        paper_actions = [action for action in actions if action['_index'] == self.papers_index]
+
+        # `parallel_bulk` does not keep the order of the actions, so the papers wait for every chunk to be sent
+        succeeded, errors = self._bulk(chunk_actions)
+        incomplete = {item['index']['_id'].rsplit('-', 1)[0] for item in errors}
+        if incomplete:
+            logging.warning(f"Holding back {len(incomplete)} papers whose chunks failed")
+        paper_actions = [action for action in paper_actions if action['_id'] not in incomplete]
+
+        papers_succeeded, paper_errors = self._bulk(paper_actions)
+
+        return (succeeded + papers_succeeded, len(errors) + len(incomplete) + len(paper_errors),
+                papers_succeeded)
+
+    def _bulk(self, actions: list[dict]) -> tuple[int, list[dict]]:
+        """
+        Sends bulk actions, logging and recording the failed items.
+
+        Returns:
+            tuple[int, list[dict]]: The number of successful actions and the failed items.
+        """
+        if not actions:
+            return 0, []
+
+        options = dict(chunk_size=self.chunk_size, max_chunk_bytes=self.max_chunk_bytes, raise_on_error=False)
+        if self.threads > 1:
+            results = helpers.parallel_bulk(self.db.es, actions, thread_count=self.threads, **options)
+        else:
+            results = helpers.streaming_bulk(self.db.es, actions, max_retries=3, **options)
+
+        succeeded = 0
+        errors = []
+        for ok, item in results:
+            if ok:
+                succeeded += 1
+            else:
+                errors.append(item)
+
+        if errors:
+            logging.warning(f"{len(errors)} bulk items failed, first error: {errors[0]}")
+            if self.errors_file:
+                with open(self.errors_file, 'a', encoding='utf-8') as f:
+                    for error in errors:
+                        f.write(json.dumps(error) + '\n')
+
+        return succeeded, errors
+
+    def ingest(self, source: str | Path, batch_size: int = 1024, checkpoint_path: Optional[str | Path] = None,
+               title_field: str = 'title', abstract_field: str = 'abstract',
+               id_field: Optional[str] = None, metadata_fields: Optional[dict[str, str]] = None) -> Checkpoint:
+        """
+        Ingests every paper of a JSONL or Parquet file, resuming from the checkpoint if there is one.
+
+        Args:
+            source (str | Path): The file to ingest.
+            batch_size (int): The number of papers embedded and sent together.
+            checkpoint_path (str | Path): The checkpoint file, or None to always start from the beginning.
+            title_field (str): The name of the field holding the paper title.
+            abstract_field (str): The name of the field holding the paper abstract.
+            id_field (str): The name of an optional field holding an external paper ID used as the document ID.
+            metadata_fields (dict[str, str]): The names of the fields holding the metadata of the papers, by metadata
+                key, see `read_papers`.
+
+        Returns:
+            Checkpoint: The final progress of the run.
+        """
+        checkpoint = Checkpoint(checkpoint_path, str(Path(source).resolve()))
+        if checkpoint.records_done:
+            logging.info(f"Resuming after {checkpoint.records_done} records")
+
+        papers = read_papers(source, title_field, abstract_field, skip=checkpoint.records_done, id_field=id_field,
+                             metadata_fields=metadata_fields)
+        start = time.perf_counter()
+        papers_this_run = 0
+        self.metadata_updates = 0
+        indices_ready = False
+
+        # Embed the next batch while the previous one is being sent
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = None
+
+            while batch := list(itertools.islice(papers, batch_size)):
+                actions = self.build_actions([paper for _, paper in batch])
+
+                if actions and not indices_ready:
+                    # The chunk actions come first, so the first action tells the dimension of the embeddings
+                    self.ensure_indices(len(actions[0]['_source']['vector']))
+                    indices_ready = True
+
+                if pending:
+                    papers_this_run += self._finish_batch(pending, checkpoint, start, papers_this_run)
+                    pending = None
+
+                if not actions:
+                    checkpoint.records_done = batch[-1][0]
+                    checkpoint.save()
+                    continue
+
+                num_chunks = sum(action['_index'] == self.chunks_index for action in actions)
+                pending = (executor.submit(self.send, actions), batch[-1][0], num_chunks)
+
+            if pending:
+                papers_this_run += self._finish_batch(pending, checkpoint, start, papers_this_run)
+
+        if papers_this_run or self.metadata_updates:
+            # Results cached by retrievers against the previous papers are no longer valid
+            bump_index_generation(self.db.es, self.papers_index)
+
+        elapsed = time.perf_counter() - start
+        logging.info(f"Ingested {papers_this_run} papers in {elapsed:.1f}s "
+                     f"({papers_this_run / elapsed if elapsed else 0:.1f} docs/s), "
+                     f"{checkpoint.errors} failed bulk items in total, "
+                     f"metadata of {self.metadata_updates} indexed papers updated")
+
+        return checkpoint
+
+    @staticmethod
+    def _finish_batch(pending, checkpoint: Checkpoint, start: float, papers_before: int) -> int:
+        future, records_done, num_chunks = pending
+        _, failed, num_papers = future.result()
+
+        checkpoint.records_done = records_done
+        checkpoint.papers += num_papers
+        checkpoint.chunks += num_chunks
+        checkpoint.errors += failed
+        checkpoint.save()
+
+        elapsed = time.perf_counter() - start
+        logging.info(f"{checkpoint.records_done} records done, "
+                     f"{(papers_before + num_papers) / elapsed:.1f} docs/s")
+
+        return num_papers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream papers from a JSONL or Parquet file into Elasticsearch.')
+    parser.add_argument('source', type=str, help='Path to a .jsonl or .parquet file with titles and abstracts')
+    parser.add_argument('--url', type=str, default='http://localhost:9200', help='Elasticsearch URL')
+    parser.add_argument('--papers-index', type=str, default='papers')
+    parser.add_argument('--chunks-index', type=str, default='paper_embeddings')
+    parser.add_argument('--title-field', type=str, default='title')
+    parser.add_argument('--abstract-field', type=str, default='abstract')
+    parser.add_argument('--id-field', type=str, default=None, help='Field holding an external paper ID, e.g. a DOI')
+    parser.add_argument('--year-field', type=str, default=None, help='Field holding the publication year')
+    parser.add_argument('--venue-field', type=str, default=None, help='Field holding the publication venue')
+    parser.add_argument('--fields-of-study-field', type=str, default=None,
+                        help='Field holding the list of fields of study')
+    parser.add_argument('--external-ids-field', type=str, default=None,
+                        help='Field holding an object of external IDs, e.g. {"DOI": ..., "ArXiv": ...}')
+    parser.add_argument('--reindex-existing', action='store_true',
+                        help='Embed and overwrite papers that are already indexed instead of skipping them')
+    parser.add_argument('--model', type=str, default='intfloat/multilingual-e5-large-instruct',
+                        help='Embedding model, must match the one used for retrieval')
+    parser.add_argument('--device', type=str, default=None, help='Device for the embedding model')
+    parser.add_argument('--batch-size', type=int, default=1024, help='Papers per batch')
+    parser.add_argument('--embed-batch-size', type=int, default=128, help='Chunks per embedding forward pass')
+    parser.add_argument('--bulk-chunk-size', type=int, default=500, help='Maximum actions per bulk request')
+    parser.add_argument('--bulk-chunk-bytes', type=int, default=10 * 1024 * 1024,
+                        help='Maximum size of a bulk request in bytes')
+    parser.add_argument('--threads', type=int, default=1, help='Threads sending bulk requests')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Checkpoint file used to resume the run')
+    parser.add_argument('--errors-file', type=str, default=None, help='JSONL file collecting failed bulk items')
+    parser.add_argument('--embedding-cache-dir', type=str, default=None, help='Directory of the embedding cache')
+    parser.add_argument('--knn-profile', choices=list(KNN_PROFILES), default='balanced',
+                        help='HNSW and quantization settings of a newly created chunks index')
+    parser.add_argument('--quantization', choices=list(QUANTIZED_INDEX_TYPES), default=None,
+                        help='Overrides the quantization of the kNN profile, bbq requires Elasticsearch 8.16+')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    embeddings = HuggingFaceEmbeddings(model_name=args.model,
+                                       model_kwargs={'device': device},
+                                       encode_kwargs={'normalize_embeddings': True,
+                                                      'batch_size': args.embed_batch_size})
+    if args.embedding_cache_dir:
+        embeddings = CachedEmbeddings(embeddings, args.embedding_cache_dir)
+
+    ingester = Ingester(VectorDatabase(args.url), embeddings, args.papers_index, args.chunks_index,
+                        chunk_size=args.bulk_chunk_size, max_chunk_bytes=args.bulk_chunk_bytes,
+                        threads=args.threads, errors_file=args.errors_file,
+                        knn_profile=args.knn_profile, quantization=args.quantization,
+                        skip_existing=not args.reindex_existing)
+    metadata_fields = {key: field for key, field in [('year', args.year_field), ('venue', args.venue_field),
+                                                     ('fields_of_study', args.fields_of_study_field),
+                                                     ('external_ids', args.external_ids_field)] if field}
+    ingester.ingest(args.source, args.batch_size, args.checkpoint, args.title_field, args.abstract_field, args.id_field,
+                    metadata_fields)
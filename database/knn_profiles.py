@@ -0,0 +1,175 @@
+"""
+Named latency/recall tradeoffs for the kNN search over paper chunks.
+
+A profile fixes both sides of the tradeoff:
+- index time: the HNSW graph parameters `m` and `ef_construction` and the quantization of the `dense_vector` field
+- search time: how many candidates each shard considers per result, or an exact brute-force search
+
+Index-time settings only apply when an index is created, so changing them needs a reindex. Search-time settings apply
+to any index, which is what `benchmarks/knn_sweep.py` relies on to compare profiles against the same data.
+"""
+
+from dataclasses import dataclass
+from database.paper_metadata import METADATA_PROPERTIES
+from typing import Optional
+
+# `dense_vector` index types for each quantization, `bbq_hnsw` requires Elasticsearch 8.16 or newer
+QUANTIZED_INDEX_TYPES = {
+    'none': 'hnsw',
+    'int8': 'int8_hnsw',
+    'int4': 'int4_hnsw',
+    'bbq': 'bbq_hnsw',
+}
+
+# Elasticsearch rejects kNN searches with more candidates than this
+MAX_NUM_CANDIDATES = 10_000
+
+
+@dataclass(frozen=True)
+class KnnProfile:
+    """
+    Index and search settings for kNN retrieval.
+
+    Args:
+        name (str): The name of the profile.
+        m (int): The number of neighbors of each node in the HNSW graph.
+        ef_construction (int): The number of candidates considered when inserting a node in the HNSW graph.
+        num_candidates_factor (int): The number of candidates considered per shard, as a multiple of `k`.
+        quantization (str): The quantization of the indexed vectors, one of 'none', 'int8', 'int4' or 'bbq'.
+        exact (bool): Whether to search by scoring every vector instead of walking the HNSW graph.
+    """
+
+    name: str
+    m: int
+    ef_construction: int
+    num_candidates_factor: int
+    quantization: str = 'none'
+    exact: bool = False
+
+    def num_candidates(self, k: int) -> int:
+        return min(MAX_NUM_CANDIDATES, max(k, k * self.num_candidates_factor))
+
+    def index_options(self, quantization: Optional[str] = None) -> dict:
+        """
+        Builds the `index_options` of a `dense_vector` field.
+
+        Args:
+            quantization (str): Overrides the quantization of the profile.
+
+        Returns:
+            dict: The index options.
+        """
+        quantization = quantization or self.quantization
+        if quantization not in QUANTIZED_INDEX_TYPES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+
+        return {'type': QUANTIZED_INDEX_TYPES[quantization], 'm': self.m, 'ef_construction': self.ef_construction}
+
+    def dense_vector_mapping(self, dims: int, quantization: Optional[str] = None) -> dict:
+        """
+        Builds the mapping of a `dense_vector` field indexed with the settings of the profile.
+
+        Args:
+            dims (int): The number of dimensions of the vectors.
+            quantization (str): Overrides the quantization of the profile.
+
+        Returns:
+            dict: The field mapping.
+        """
+        return {'type': 'dense_vector', 'dims': dims, 'index': True, 'similarity': 'cosine',
+                'index_options': self.index_options(quantization)}
+
+    def search_body(self, field: str, query_vector: list[float], k: int, num_candidates: Optional[int] = None,
+                    size: Optional[int] = None, filter: Optional[list[dict]] = None) -> dict:
+        """
+        Builds the body of a search returning the `k` nearest vectors to a query vector.
+
+        Exact profiles score every document with a `script_score` query. Quantized indices keep the original vectors,
+        so the exact scores are computed at full precision on any index.
+
+        Filters are applied before the nearest neighbors are searched, so a filtered search still returns `k` hits
+        when enough documents match.
+
+        Args:
+            field (str): The `dense_vector` field to search.
+            query_vector (list[float]): The query vector.
+            k (int): The number of nearest neighbors to return.
+            num_candidates (int): Overrides the number of candidates of the profile.
+            size (int): The number of hits to return, defaults to `k`. Smaller than `k` when the hits are collapsed.
+            filter (list[dict]): Optional filter clauses the searched documents must match.
+
+        Returns:
+            dict: The search body.
+        """
+        if self.exact:
+            return {
+                'query': {
+                    'script_score': {
+                        'query': {'bool': {'filter': filter}} if filter else {'match_all': {}},
+                        'script': {
+                            'source': f"cosineSimilarity(params.query_vector, '{field}') + 1.0",
+                            'params': {'query_vector': query_vector},
+                        },
+                    },
+                },
+                'size': size or k,
+            }
+
+        knn = {
+            'field': field,
+            'query_vector': query_vector,
+            'k': k,
+            'num_candidates': num_candidates or self.num_candidates(k),
+        }
+        if filter:
+            knn['filter'] = filter
+
+        return {'knn': knn, 'size': size or k}
+
+
+KNN_PROFILES = {
+    'fast': KnnProfile('fast', m=16, ef_construction=100, num_candidates_factor=2, quantization='int8'),
+    'balanced': KnnProfile('balanced', m=16, ef_construction=200, num_candidates_factor=10, quantization='int8'),
+    'exact': KnnProfile('exact', m=32, ef_construction=400, num_candidates_factor=1, exact=True),
+}
+
+
+def get_knn_profile(profile: str | KnnProfile) -> KnnProfile:
+    """
+    Looks up a kNN profile by name, passing profile instances through unchanged.
+
+    Args:
+        profile (str | KnnProfile): The name of a profile in `KNN_PROFILES` or a profile.
+
+    Returns:
+        KnnProfile: The profile.
+    """
+    if isinstance(profile, KnnProfile):
+        return profile
+    if profile not in KNN_PROFILES:
+        raise ValueError(f"Unknown kNN profile: {profile}, expected one of {', '.join(KNN_PROFILES)}")
+
+    return KNN_PROFILES[profile]
+
+
+def chunk_index_mappings(dims: int, profile: str | KnnProfile = 'balanced', quantization: Optional[str] = None) -> dict:
+    """
+    Builds the mappings of the index holding the embedded chunks of papers.
+
+    Args:
+        dims (int): The number of dimensions of the embeddings.
+        profile (str | KnnProfile): The kNN profile whose index settings are used.
+        quantization (str): Overrides the quantization of the profile.
+
+    Returns:
+        dict: The index mappings.
+    """
+    return {'properties': {
+        'text': {'type': 'text'},
+        'vector': get_knn_profile(profile).dense_vector_mapping(dims, quantization),
+        'metadata': {'properties': {
+            'id': {'type': 'keyword'},
+            'start_index': {'type': 'integer'},
+            **METADATA_PROPERTIES,
+        }},
+    }}
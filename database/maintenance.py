@@ -0,0 +1,210 @@
+"""
+Maintenance of the `papers` and `paper_embeddings` indices built before paper IDs were deterministic.
+
+`dedupe` finds the copies of each paper in the papers index by their `paper_id`. It keeps one copy and moves it to its
+deterministic ID, repoints its chunks to that ID, and deletes the other copies with their chunks. It then deletes the
+chunks repeated within a paper, i.e. with the same paper ID and start index, and optionally force-merges both indices
+to reclaim the space of the deleted documents. Running it again on a deduplicated index changes nothing. Papers
+indexed under an external ID keep it, whether or not the ID is stored with them as `external_id`.
+
+Usage:
+    python -m database.maintenance dedupe --dry-run
+    python -m database.maintenance dedupe --forcemerge
+    python -m database.maintenance forcemerge --max-num-segments 1
+"""
+
+import argparse
+import logging
+import re
+
+from database.result_cache import bump_index_generation
+from database.vector_database import paper_id
+from elasticsearch import Elasticsearch, helpers
+from typing import Optional
+
+
+def _keyword_field(es: Elasticsearch, index: str, field: str) -> str:
+    """
+    Returns the name under which a field can be matched exactly: the field itself if it is a keyword, or else its
+    `keyword` subfield, like in the dynamic mappings created by `ElasticsearchStore`.
+    """
+    mapping = next(iter(es.indices.get_field_mapping(index=index, fields=field).values()))['mappings']
+    if field not in mapping:
+        raise ValueError(f"Index {index} has no field {field}")
+
+    field_mapping = next(iter(mapping[field]['mapping'].values()))
+    return field if field_mapping['type'] == 'keyword' else f'{field}.keyword'
+
+
+# IDs given to papers before they were deterministic: content hashes, and the random UUIDs of `ElasticsearchStore`
+_GENERATED_ID = re.compile(r'[0-9a-f]{40}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def _deterministic_id(hit: dict) -> str:
+    """
+    Returns the `paper_id` a paper should be stored under.
+
+    Papers indexed under an external ID that is not stored with them keep their ID, since it cannot be recomputed.
+    """
+    source = hit['_source']
+    if source.get('external_id'):
+        return str(source['external_id'])
+    if not _GENERATED_ID.fullmatch(hit['_id']):
+        return hit['_id']
+
+    return paper_id(source['title'], source['abstract'])
+
+
+def _repoint_chunks(es: Elasticsearch, chunks_index: str, id_field: str, new_ids: dict[str, str]) -> int:
+    response = es.update_by_query(index=chunks_index, query={'terms': {id_field: list(new_ids)}}, conflicts='proceed',
+                                  script={'source': 'ctx._source.metadata.id = params.ids[ctx._source.metadata.id]',
+                                          'params': {'ids': new_ids}})
+    return response['updated']
+
+
+def _move_papers(es: Elasticsearch, papers_index: str, new_ids: dict[str, str]) -> None:
+    docs = es.mget(index=papers_index, ids=list(new_ids))['docs']
+    actions = []
+    for doc in docs:
+        if doc.get('found'):
+            actions.append({'_index': papers_index, '_id': new_ids[doc['_id']], '_source': doc['_source']})
+            actions.append({'_op_type': 'delete', '_index': papers_index, '_id': doc['_id']})
+    helpers.bulk(es, actions, raise_on_error=False)
+
+
+def dedupe_papers(es: Elasticsearch, papers_index: str = 'papers', chunks_index: str = 'paper_embeddings',
+                  dry_run: bool = False, batch_size: int = 1000) -> dict:
+    """
+    Keeps a single copy of each paper, stored under its deterministic ID, and deletes the chunks of the other copies.
+
+    Papers are moved and deleted in batches, and both indices are only refreshed once at the end.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        papers_index (str): The index storing the titles and abstracts.
+        chunks_index (str): The index storing the embedded chunks.
+        dry_run (bool): Whether to only count the changes without making them.
+        batch_size (int): The number of documents moved or deleted per request.
+
+    Returns:
+        dict: The number of papers moved to their deterministic ID, duplicate papers deleted and chunks deleted.
+    """
+    # Only the document IDs are kept, the texts are fetched again for the papers that move
+    copies = {}
+    for hit in helpers.scan(es, index=papers_index, query={'query': {'match_all': {}}},
+                            _source=['title', 'abstract', 'external_id']):
+        copies.setdefault(_deterministic_id(hit), []).append(hit['_id'])
+
+    id_field = _keyword_field(es, chunks_index, 'metadata.id')
+    stats = {'papers': len(copies), 'moved': 0, 'deleted_papers': 0, 'deleted_chunks': 0}
+    duplicate_ids = []
+    new_ids = {}
+
+    for id_, doc_ids in copies.items():
+        # Prefer the copy already stored under the deterministic ID
+        doc_ids.sort(key=lambda doc_id: doc_id != id_)
+        kept, duplicates = doc_ids[0], doc_ids[1:]
+        duplicate_ids.extend(duplicates)
+        if kept != id_:
+            new_ids[kept] = id_
+    del copies
+
+    stats['moved'] = len(new_ids)
+    stats['deleted_papers'] = len(duplicate_ids)
+
+    # The chunks of the duplicates are deleted before the kept copies are repointed, so that no search has to see the
+    # repointed chunks and both indices can be refreshed once at the end
+    for i in range(0, len(duplicate_ids), batch_size):
+        batch = duplicate_ids[i:i + batch_size]
+        query = {'terms': {id_field: batch}}
+        if dry_run:
+            stats['deleted_chunks'] += es.count(index=chunks_index, query=query)['count']
+            continue
+
+        stats['deleted_chunks'] += es.delete_by_query(index=chunks_index, query=query, conflicts='proceed')['deleted']
+        helpers.bulk(es, ({'_op_type': 'delete', '_index': papers_index, '_id': doc_id} for doc_id in batch),
+                     raise_on_error=False)
+
+    if not dry_run:
+        moves = list(new_ids.items())
+        for i in range(0, len(moves), batch_size):
+            batch = dict(moves[i:i + batch_size])
+            _move_papers(es, papers_index, batch)
+            _repoint_chunks(es, chunks_index, id_field, batch)
+
+        es.indices.refresh(index=[papers_index, chunks_index])
+
+    return stats
+
+
+def dedupe_chunks(es: Elasticsearch, chunks_index: str = 'paper_embeddings', dry_run: bool = False) -> int:
+    """
+    Deletes the chunks repeated within a paper, keeping one chunk per paper ID and start index.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        chunks_index (str): The index storing the embedded chunks.
+        dry_run (bool): Whether to only count the duplicate chunks without deleting them.
+
+    Returns:
+        int: The number of duplicate chunks.
+    """
+    seen = set()
+    duplicates = []
+    for hit in helpers.scan(es, index=chunks_index, query={'query': {'match_all': {}}},
+                            _source=['metadata.id', 'metadata.start_index']):
+        metadata = hit['_source'].get('metadata', {})
+        key = (metadata.get('id'), metadata.get('start_index'))
+        if key in seen:
+            duplicates.append(hit['_id'])
+        else:
+            seen.add(key)
+
+    if duplicates and not dry_run:
+        helpers.bulk(es, ({'_op_type': 'delete', '_index': chunks_index, '_id': doc_id} for doc_id in duplicates),
+                     raise_on_error=False, refresh=True)
+
+    return len(duplicates)
+
+
+def forcemerge(es: Elasticsearch, indices: list[str], max_num_segments: Optional[int] = None) -> None:
+    """
+    Force-merges indices, expunging deleted documents or merging each shard down to `max_num_segments` segments.
+    """
+    for index in indices:
+        logging.info(f"Force-merging {index}")
+        if max_num_segments:
+            es.indices.forcemerge(index=index, max_num_segments=max_num_segments, wait_for_completion=True)
+        else:
+            es.indices.forcemerge(index=index, only_expunge_deletes=True, wait_for_completion=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deduplicate and compact the paper indices.')
+    parser.add_argument('command', choices=['dedupe', 'forcemerge'])
+    parser.add_argument('--url', type=str, default='http://localhost:9200', help='Elasticsearch URL')
+    parser.add_argument('--papers-index', type=str, default='papers')
+    parser.add_argument('--chunks-index', type=str, default='paper_embeddings')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what dedupe would change')
+    parser.add_argument('--forcemerge', action='store_true', help='Force-merge both indices after dedupe')
+    parser.add_argument('--max-num-segments', type=int, default=None,
+                        help='Merge each shard down to this many segments instead of only expunging deletes')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    es = Elasticsearch(args.url)
+
+    if args.command == 'dedupe':
+        paper_stats = dedupe_papers(es, args.papers_index, args.chunks_index, args.dry_run)
+        duplicate_chunks = dedupe_chunks(es, args.chunks_index, args.dry_run)
+        action = 'Would change' if args.dry_run else 'Changed'
+        logging.info(f"{action}: {paper_stats['papers']} distinct papers, {paper_stats['moved']} moved to their "
+                     f"deterministic ID, {paper_stats['deleted_papers']} duplicate papers and "
+                     f"{paper_stats['deleted_chunks'] + duplicate_chunks} chunks deleted")
+
+        if not args.dry_run and (paper_stats['moved'] or paper_stats['deleted_papers'] or duplicate_chunks):
+            # Cached retrieval results point to the removed IDs
+            bump_index_generation(es, args.papers_index)
+
+    if args.command == 'forcemerge' or (args.forcemerge and not args.dry_run):
+        forcemerge(es, [args.papers_index, args.chunks_index], args.max_num_segments)
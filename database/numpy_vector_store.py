@@ -0,0 +1,618 @@
+"""
+In-process vector store for offline runs, as an alternative to Elasticsearch.
+
+A store is a directory built from the same JSONL or Parquet papers as `database.ingest`:
+- `vectors.bin`: the searched chunk vectors, float16, int8 or binary rows of a memory-mapped matrix
+- `scales.bin`: for int8 stores, the float32 scale of each row
+- `full_vectors.bin`: for stores rescoring their results, the float16 normalized chunk embeddings
+- `projection.npy`: for compact stores, the PCA projection applied to the embeddings and queries before searching
+- `chunk_papers.bin`: the int32 row in `papers.arrow` of the paper each chunk belongs to
+- `papers.arrow`: the ID, title and abstract of each paper, in the Arrow IPC format
+- `ivf_centroids.npy`, `ivf_offsets.npy`: for IVF stores, the centroid of each partition and the range of rows it
+  covers, the rows being sorted by partition
+- `meta.json`: the number of rows, dimensions, dtype and embedding model, and the compression settings
+
+Everything is memory-mapped when loading, so opening a store is instant and the pages of the operating system cache
+are shared between processes. Searches score batches of queries with a matrix multiplication over blocks of rows.
+
+Compact stores shrink the searched vectors with a PCA projection fitted on a sample of the corpus, int8 or binary
+quantization, or both. To make up for the lost precision, they can keep the full-precision embeddings on disk and
+rescore the best candidates of the compact search with them, reading only the rows of the candidates.
+`benchmarks/compact_vectors_benchmark.py` reports the size, speed and recall of each setting.
+
+Usage:
+    python -m database.numpy_vector_store papers.jsonl papers_store --dtype int8 --nlist 1024
+    python -m database.numpy_vector_store papers.jsonl papers_store --dtype int8 --pca-dims 256 --rescore
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import time
+import numpy as np
+import pyarrow as pa
+
+from database.ingest import read_papers
+from database.vector_database import paper_id, paper_text_splitter
+from pathlib import Path
+from typing import Optional
+
+_BLOCK_ROWS = 65_536
+
+DTYPES = ('float16', 'int8', 'binary')
+
+
+def _quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes each row symmetrically to int8, returning the quantized rows and the scale of each row.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _storage(dtype: str, dims: int) -> tuple[str, int]:
+    """
+    Returns the NumPy type and number of columns of the rows of `vectors.bin`, binary rows packing 8 dimensions per
+    byte.
+    """
+    return ('uint8', -(-dims // 8)) if dtype == 'binary' else (dtype, dims)
+
+
+def _decode(block: np.ndarray, scales: Optional[np.ndarray], dtype: str, dims: int) -> np.ndarray:
+    """
+    Turns stored rows back into float32 vectors, binary rows becoming vectors of -1 and 1.
+    """
+    if dtype == 'binary':
+        return np.unpackbits(block, axis=1, count=dims).astype(np.float32) * 2 - 1
+
+    vectors = block.astype(np.float32)
+    if scales is not None:
+        vectors *= scales[:, None]
+    return vectors
+
+
+def _fit_projection(sample: np.ndarray, dims: int) -> np.ndarray:
+    """
+    Fits a PCA projection preserving the inner products of vectors as well as possible in `dims` dimensions.
+
+    The vectors are not centered, since inner products with the queries depend on their mean too.
+
+    Returns:
+        np.ndarray: The projection, of shape (input dims, dims).
+    """
+    if dims > sample.shape[1]:
+        raise ValueError(f"Cannot project {sample.shape[1]} dimensions to {dims}")
+
+    # The eigenvectors of the second moment matrix with the largest eigenvalues, in decreasing order
+    _, eigenvectors = np.linalg.eigh(sample.T @ sample)
+    return np.ascontiguousarray(eigenvectors[:, ::-1][:, :dims], dtype=np.float32)
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Keeps the `k` best scores of each query, sorted from best to worst.
+
+    Args:
+        scores (np.ndarray): The scores of shape (queries, candidates).
+        rows (np.ndarray): The rows of the candidates, of the same shape as the scores.
+        k (int): The number of scores to keep.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The kept scores and rows.
+    """
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, best, axis=1)
+        rows = np.take_along_axis(rows, best, axis=1)
+
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+
+class NumpyVectorStore:
+    """
+    Memory-mapped store of chunk embeddings and the papers they belong to.
+
+    Args:
+        path (str | Path): The directory of the store.
+        nprobe (int): For IVF stores, the number of partitions searched per query.
+        rescore_factor (int): For stores keeping full-precision embeddings, the number of candidates of the compact
+            search rescored per result.
+    """
+
+    def __init__(self, path: str | Path, nprobe: int = 32, rescore_factor: int = 4):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / 'meta.json').read_text())
+        self.nprobe = nprobe
+        self.rescore_factor = rescore_factor
+
+        rows, dims, dtype = self.meta['rows'], self.meta['dims'], self.meta['dtype']
+        storage, columns = _storage(dtype, dims)
+        self._vectors = np.memmap(self.path / 'vectors.bin', dtype=storage, mode='r', shape=(rows, columns))
+        self._scales = np.memmap(self.path / 'scales.bin', dtype=np.float32, mode='r', shape=(rows,)) \
+            if dtype == 'int8' else None
+
+        self._projection = np.load(self.path / 'projection.npy') if self.meta.get('pca_dims') else None
+        self._full_vectors = np.memmap(self.path / 'full_vectors.bin', dtype=np.float16, mode='r',
+                                       shape=(rows, self.meta['full_dims'])) if self.meta.get('rescore') else None
+        self._chunk_papers = np.memmap(self.path / 'chunk_papers.bin', dtype=np.int32, mode='r', shape=(rows,))
+
+        # Reading from a memory map keeps the columns backed by the file instead of copying them
+        self._papers = pa.ipc.open_file(pa.memory_map(str(self.path / 'papers.arrow'))).read_all()
+        self._rows_by_id: Optional[dict[str, int]] = None
+
+        self._centroids = None
+        self._offsets = None
+        if self.meta.get('nlist'):
+            self._centroids = np.load(self.path / 'ivf_centroids.npy')
+            self._offsets = np.load(self.path / 'ivf_offsets.npy')
+
+        logging.info(f"Loaded vector store {self.path} with {rows} chunks of {len(self._papers)} papers")
+
+    def __len__(self) -> int:
+        return self.meta['rows']
+
+    def search(self, query_vectors, k: int = 50) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the `k` chunks most similar to each query vector.
+
+        Args:
+            query_vectors: The normalized query vectors, of shape (queries, dims).
+            k (int): The number of chunks to return per query.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The cosine similarities and rows of the chunks, of shape (queries, k) and
+                sorted from most to least similar.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        k = min(k, len(self))
+        if self._full_vectors is None:
+            return self._search_compact(queries, k)
+
+        _, rows = self._search_compact(queries, min(len(self), k * self.rescore_factor))
+        return self._rescore(queries, rows, k)
+
+    def _search_compact(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        if self._projection is not None:
+            queries = queries @ self._projection
+
+        if self._centroids is None:
+            return self._search_rows(queries, 0, len(self), k)
+
+        # Search each query in the partitions with the closest centroids
+        probed = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.nprobe]
+        results = [self._search_partitions(query[None], partitions, k) for query, partitions in zip(queries, probed)]
+
+        return np.concatenate([s for s, _ in results]), np.concatenate([r for _, r in results])
+
+    def _rescore(self, queries: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scores the candidate rows of each query with the full-precision embeddings and keeps the `k` best.
+        """
+        # Read every candidate once, in file order
+        unique_rows = np.unique(rows[rows >= 0])
+        vectors = self._full_vectors[unique_rows].astype(np.float32)
+
+        scores = np.full(rows.shape, -np.inf, dtype=np.float32)
+        for i, (query, query_rows) in enumerate(zip(queries, rows)):
+            found = query_rows >= 0
+            scores[i, found] = vectors[np.searchsorted(unique_rows, query_rows[found])] @ query
+
+        return _pad(*_top_k(scores, rows, k), k)
+
+    def search_papers(self, query_vectors, k: int = 50) -> list[list[str]]:
+        """
+        Finds the `k` chunks most similar to each query vector and returns the IDs of their papers, in the order of
+        the chunks. A paper with several retrieved chunks appears once per chunk, like in a kNN search over the
+        Elasticsearch chunks index.
+        """
+        _, rows = self.search(query_vectors, k)
+        ids = self._papers.column('id')
+
+        return [ids.take(self._chunk_papers[query_rows[query_rows >= 0]]).to_pylist() for query_rows in rows]
+
+    def get_papers(self, ids: list[str]) -> dict[str, dict]:
+        """
+        Looks up papers by ID.
+
+        Returns:
+            dict[str, dict]: The title and abstract of each paper found, by ID.
+        """
+        # Built on first lookup, so that searching alone never reads the whole ID column
+        if self._rows_by_id is None:
+            self._rows_by_id = {paper_id_: row for row, paper_id_ in enumerate(self._papers.column('id').to_pylist())}
+
+        rows = [self._rows_by_id[id_] for id_ in ids if id_ in self._rows_by_id]
+        papers = self._papers.take(rows).to_pylist()
+
+        return {paper['id']: {'title': paper['title'], 'abstract': paper['abstract']} for paper in papers}
+
+    def knn_search(self, query_vector: list[float], k: int = 10) -> list[dict]:
+        """
+        Performs a k-nearest neighbors search with the same result format as `VectorDatabase.knn_search` over the
+        chunks index.
+
+        Args:
+            query_vector (list[float]): The query vector to use for the k-NN search.
+            k (int): The number of nearest neighbors to return.
+
+        Returns:
+            list[dict]: A list of the k nearest chunks to the query vector.
+        """
+        scores, rows = self.search([query_vector], k)
+        found = rows[0] >= 0
+        ids = self._papers.column('id').take(self._chunk_papers[rows[0][found]]).to_pylist()
+
+        return [{'_id': str(row), '_score': float(score), '_source': {'metadata': {'id': id_}}}
+                for score, row, id_ in zip(scores[0][found], rows[0][found], ids)]
+
+    def _scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        if self.meta['dtype'] == 'binary':
+            return queries @ _decode(self._vectors[start:end], None, 'binary', self.meta['dims']).T
+
+        scores = queries @ self._vectors[start:end].astype(np.float32).T
+        if self._scales is not None:
+            scores *= self._scales[start:end]
+        return scores
+
+    def _search_rows(self, queries: np.ndarray, start: int, end: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+
+        for block_start in range(start, end, _BLOCK_ROWS):
+            block_end = min(end, block_start + _BLOCK_ROWS)
+            rows = np.broadcast_to(np.arange(block_start, block_end), (len(queries), block_end - block_start))
+            best_scores, best_rows = _top_k(np.concatenate([best_scores, self._scores(queries, block_start, block_end)],
+                                                           axis=1),
+                                            np.concatenate([best_rows, rows], axis=1), k)
+
+        return _pad(best_scores, best_rows, k)
+
+    def _search_partitions(self, query: np.ndarray, partitions: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        results = [self._search_rows(query, self._offsets[p], self._offsets[p + 1], k) for p in partitions
+                   if self._offsets[p + 1] > self._offsets[p]]
+        if not results:
+            return _pad(np.zeros((1, 0), dtype=np.float32), np.zeros((1, 0), dtype=np.int64), k)
+
+        scores, rows = _top_k(np.concatenate([s for s, _ in results], axis=1),
+                              np.concatenate([r for _, r in results], axis=1), k)
+        return _pad(scores, rows, k)
+
+
+def _pad(scores: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pads results with fewer than `k` chunks with a score of -inf and a row of -1.
+    """
+    missing = k - scores.shape[1]
+    if missing <= 0:
+        return scores, rows
+
+    return (np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf),
+            np.pad(rows, ((0, 0), (0, missing)), constant_values=-1))
+
+
+class _DecodedRows:
+    """
+    Decodes the rows of a store on access, so that IVF centroids are trained on a sample in the searched space.
+    """
+
+    def __init__(self, decode, rows: int):
+        self._decode = decode
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __getitem__(self, rows: np.ndarray) -> np.ndarray:
+        # Read and decode every requested row at once, in file order
+        rows = np.asarray(rows)
+        order = np.argsort(rows, kind='stable')
+        block = self._decode(rows[order])
+        decoded = np.empty_like(block)
+        decoded[order] = block
+
+        return decoded
+
+
+def _reorder_rows(path: Path, vectors: np.memmap, order: np.ndarray) -> None:
+    sorted_vectors = np.memmap(path.with_name(path.name + '.tmp'), dtype=vectors.dtype, mode='w+', shape=vectors.shape)
+    for i in range(0, len(order), _BLOCK_ROWS):
+        sorted_vectors[i:i + _BLOCK_ROWS] = vectors[order[i:i + _BLOCK_ROWS]]
+    sorted_vectors.flush()
+    del sorted_vectors, vectors
+    path.with_name(path.name + '.tmp').replace(path)
+
+
+def _train_ivf(vectors: np.ndarray, nlist: int, iterations: int = 10, sample_size: int = 256,
+               seed: int = 0) -> np.ndarray:
+    """
+    Trains the centroids of an IVF partition with spherical k-means on a sample of the vectors.
+
+    Args:
+        vectors (np.ndarray): The vectors to partition.
+        nlist (int): The number of partitions.
+        iterations (int): The number of k-means iterations.
+        sample_size (int): The number of sampled vectors per partition.
+        seed (int): The seed of the sampling and initialization.
+
+    Returns:
+        np.ndarray: The normalized centroids, of shape (nlist, dims).
+    """
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(vectors), min(len(vectors), nlist * sample_size), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    sample /= np.linalg.norm(sample, axis=1, keepdims=True) + 1e-12
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = ~sums.any(axis=1)
+        # Restart empty partitions from random sampled vectors
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+
+    return centroids
+
+
+def build_numpy_vector_store(source: str | Path, output_dir: str | Path, embeddings, dtype: str = 'float16',
+                             nlist: int = 0, batch_size: int = 1024, title_field: str = 'title',
+                             abstract_field: str = 'abstract', pca_dims: int = 0, rescore: bool = False,
+                             pca_sample_size: int = 100_000, id_field: Optional[str] = None) -> None:
+    """
+    Splits, embeds and writes papers from a JSONL or Parquet file into a new store.
+
+    Papers are split and identified like in `database.ingest`, so a store and an Elasticsearch index built from the
+    same file hold the same chunks and paper IDs.
+
+    Args:
+        source (str | Path): The path to a `.jsonl` or `.parquet` file with titles and abstracts.
+        output_dir (str | Path): The directory of the store, created if needed.
+        embeddings: The embedding model for the paper chunks, normalizing its vectors.
+        dtype (str): The type of the searched vectors, 'float16', 'int8' or 'binary'.
+        nlist (int): The number of IVF partitions, 0 to search every vector.
+        batch_size (int): The number of papers embedded at a time.
+        title_field (str): The name of the field holding the paper title.
+        abstract_field (str): The name of the field holding the paper abstract.
+        pca_dims (int): The number of dimensions the vectors are projected to before being searched, 0 to keep them
+            all. The projection is fitted on a sample of the embedded chunks once they are all written.
+        rescore (bool): Whether to keep the full-precision embeddings and rescore the candidates of the search with
+            them.
+        pca_sample_size (int): The number of chunks the PCA projection and the binary mean are fitted on.
+        id_field (str): The name of an optional field holding an external paper ID, such as a DOI, used as the paper
+            ID like with `--id-field` in `database.ingest`.
+    """
+    from langchain_core.documents import Document
+
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    # Compact stores are written at full precision first, and compressed once the sample to fit on is known
+    compact = bool(pca_dims) or dtype == 'binary' or rescore
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    text_splitter = paper_text_splitter()
+    schema = pa.schema([('id', pa.string()), ('title', pa.string()), ('abstract', pa.string())])
+
+    start = time.perf_counter()
+    rows = dims = num_papers = 0
+    seen = set()
+    with open(output_dir / ('full_vectors.bin' if compact else 'vectors.bin'), 'wb') as vectors_file, \
+            open(output_dir / 'scales.bin', 'wb') as scales_file, \
+            open(output_dir / 'chunk_papers.bin', 'wb') as chunk_papers_file, \
+            pa.OSFile(str(output_dir / 'papers.arrow'), 'wb') as papers_sink, \
+            pa.ipc.new_file(papers_sink, schema) as papers_writer:
+
+        def write_batch(batch: list[dict], ids: list[str]) -> None:
+            nonlocal rows, dims, num_papers
+            docs = [Document(page_content='\n\n'.join([paper['title'], paper['abstract']]),
+                             metadata={'row': num_papers + i}) for i, paper in enumerate(batch)]
+            chunks = text_splitter.split_documents(docs)
+            vectors = np.asarray(embeddings.embed_documents([chunk.page_content for chunk in chunks]),
+                                 dtype=np.float32)
+
+            if dtype == 'int8' and not compact:
+                quantized, scales = _quantize_int8(vectors)
+                vectors_file.write(quantized.tobytes())
+                scales_file.write(scales.tobytes())
+            else:
+                vectors_file.write(vectors.astype(np.float16).tobytes())
+
+            chunk_papers_file.write(np.array([chunk.metadata['row'] for chunk in chunks], dtype=np.int32).tobytes())
+            papers_writer.write_batch(pa.record_batch([ids, [p['title'] for p in batch], [p['abstract'] for p in batch]],
+                                                      schema=schema))
+            rows += len(chunks)
+            dims = vectors.shape[1] if len(vectors) else dims
+            num_papers += len(batch)
+            logging.info(f"{num_papers} papers, {rows} chunks, {num_papers / (time.perf_counter() - start):.1f} docs/s")
+
+        batch, ids = [], []
+        for _, paper in read_papers(source, title_field, abstract_field, id_field=id_field):
+            id_ = paper_id(paper['title'], paper['abstract'], paper.get('external_id'))
+            if id_ in seen:
+                continue
+            seen.add(id_)
+            batch.append(paper)
+            ids.append(id_)
+            if len(batch) == batch_size:
+                write_batch(batch, ids)
+                batch, ids = [], []
+        if batch:
+            write_batch(batch, ids)
+
+    if dtype != 'int8' or compact:
+        (output_dir / 'scales.bin').unlink()
+
+    meta = {'rows': rows, 'dims': dims, 'dtype': 'float16' if compact else dtype, 'nlist': 0,
+            'model': getattr(embeddings, 'model_name', None)}
+    if compact:
+        _compress(output_dir, meta, dtype, pca_dims, rescore, pca_sample_size)
+    if nlist:
+        _partition(output_dir, meta, nlist)
+    (output_dir / 'meta.json').write_text(json.dumps(meta))
+
+    logging.info(f"Built vector store {output_dir} with {rows} chunks of {num_papers} papers "
+                 f"in {time.perf_counter() - start:.1f}s")
+
+
+def _compress(output_dir: Path, meta: dict, dtype: str, pca_dims: int, rescore: bool, sample_size: int = 100_000,
+              seed: int = 0) -> None:
+    """
+    Writes the searched vectors of a compact store from the full-precision embeddings in `full_vectors.bin`, fitting
+    its PCA projection and binary mean on a sample of them, and updates `meta` in place. The full-precision
+    embeddings are deleted unless the store rescores with them.
+    """
+    rows, full_dims = meta['rows'], meta['dims']
+    full_vectors = np.memmap(output_dir / 'full_vectors.bin', dtype=np.float16, mode='r', shape=(rows, full_dims))
+
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(full_vectors[np.sort(rng.choice(rows, min(rows, sample_size), replace=False))],
+                        dtype=np.float32)
+
+    projection = None
+    if pca_dims:
+        projection = _fit_projection(sample, pca_dims)
+        np.save(output_dir / 'projection.npy', projection)
+        sample = sample @ projection
+
+    # Binary rows keep the signs of the centered vectors. Queries are not centered: since q.x = q.(x - mean) + q.mean,
+    # ranking by q.sign(x - mean) estimates q.x, while centering the queries would add a term that varies with x
+    mean = sample.mean(axis=0) if dtype == 'binary' else None
+
+    with open(output_dir / 'vectors.bin', 'wb') as vectors_file, open(output_dir / 'scales.bin', 'wb') as scales_file:
+        for i in range(0, rows, _BLOCK_ROWS):
+            block = full_vectors[i:i + _BLOCK_ROWS].astype(np.float32)
+            if projection is not None:
+                block = block @ projection
+
+            if dtype == 'binary':
+                vectors_file.write(np.packbits(block > mean, axis=1).tobytes())
+            elif dtype == 'int8':
+                quantized, scales = _quantize_int8(block)
+                vectors_file.write(quantized.tobytes())
+                scales_file.write(scales.tobytes())
+            else:
+                vectors_file.write(block.astype(np.float16).tobytes())
+
+    if dtype != 'int8':
+        (output_dir / 'scales.bin').unlink()
+    del full_vectors
+    if not rescore:
+        (output_dir / 'full_vectors.bin').unlink()
+
+    meta.update({'dims': pca_dims or full_dims, 'dtype': dtype, 'full_dims': full_dims, 'pca_dims': pca_dims,
+                 'rescore': rescore})
+
+
+def compress_vector_store(source_dir: str | Path, output_dir: str | Path, dtype: str = 'int8', pca_dims: int = 0,
+                          rescore: bool = False, nlist: int = 0, pca_sample_size: int = 100_000) -> None:
+    """
+    Builds a compact store from a float16 store without embedding the papers again.
+
+    Args:
+        source_dir (str | Path): The directory of a float16 store without PCA projection.
+        output_dir (str | Path): The directory of the new store, created if needed.
+        dtype (str): The type of the searched vectors, 'float16', 'int8' or 'binary'.
+        pca_dims (int): The number of dimensions the vectors are projected to, 0 to keep them all.
+        rescore (bool): Whether to keep the full-precision embeddings and rescore the candidates with them.
+        nlist (int): The number of IVF partitions, 0 to search every vector.
+        pca_sample_size (int): The number of chunks the PCA projection and the binary mean are fitted on.
+    """
+    source_dir, output_dir = Path(source_dir), Path(output_dir)
+    meta = json.loads((source_dir / 'meta.json').read_text())
+    if meta['dtype'] != 'float16' or meta.get('pca_dims'):
+        raise ValueError(f"{source_dir} is not a full-precision float16 store")
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name in ('chunk_papers.bin', 'papers.arrow'):
+        shutil.copyfile(source_dir / name, output_dir / name)
+    shutil.copyfile(source_dir / 'vectors.bin', output_dir / 'full_vectors.bin')
+
+    meta = {key: meta[key] for key in ('rows', 'dims', 'model')} | {'dtype': 'float16', 'nlist': 0}
+    _compress(output_dir, meta, dtype, pca_dims, rescore, pca_sample_size)
+    if nlist:
+        _partition(output_dir, meta, nlist)
+    (output_dir / 'meta.json').write_text(json.dumps(meta))
+
+
+def _partition(output_dir: Path, meta: dict, nlist: int) -> None:
+    """
+    Trains an IVF partition of a store and sorts its rows by partition, updating `meta` in place.
+    """
+    rows, dims, dtype = meta['rows'], meta['dims'], meta['dtype']
+    nlist = min(nlist, rows)
+    storage, columns = _storage(dtype, dims)
+    vectors = np.memmap(output_dir / 'vectors.bin', dtype=storage, mode='r', shape=(rows, columns))
+    scales = np.fromfile(output_dir / 'scales.bin', dtype=np.float32) if dtype == 'int8' else None
+    chunk_papers = np.fromfile(output_dir / 'chunk_papers.bin', dtype=np.int32)
+
+    # Partitions are trained and assigned in the space the queries are searched in
+    def decoded(index: slice | np.ndarray) -> np.ndarray:
+        return _decode(vectors[index], None if scales is None else scales[index], dtype, dims)
+
+    centroids = _train_ivf(_DecodedRows(decoded, rows), nlist)
+    assignments = np.concatenate([np.argmax(decoded(slice(i, i + _BLOCK_ROWS)) @ centroids.T, axis=1)
+                                  for i in range(0, rows, _BLOCK_ROWS)])
+    order = np.argsort(assignments, kind='stable')
+
+    _reorder_rows(output_dir / 'vectors.bin', vectors, order)
+    del vectors
+    if meta.get('rescore'):
+        _reorder_rows(output_dir / 'full_vectors.bin',
+                      np.memmap(output_dir / 'full_vectors.bin', dtype=np.float16, mode='r',
+                                shape=(rows, meta['full_dims'])), order)
+
+    chunk_papers[order].tofile(output_dir / 'chunk_papers.bin')
+    if scales is not None:
+        scales[order].tofile(output_dir / 'scales.bin')
+
+    np.save(output_dir / 'ivf_centroids.npy', centroids.astype(np.float32))
+    np.save(output_dir / 'ivf_offsets.npy', np.concatenate([[0], np.cumsum(np.bincount(assignments,
+                                                                                       minlength=nlist))]))
+    meta['nlist'] = nlist
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an in-process vector store from a JSONL or Parquet file.')
+    parser.add_argument('source', type=str, help='Path to a .jsonl or .parquet file with titles and abstracts')
+    parser.add_argument('output_dir', type=str, help='Directory of the store')
+    parser.add_argument('--title-field', type=str, default='title')
+    parser.add_argument('--abstract-field', type=str, default='abstract')
+    parser.add_argument('--id-field', type=str, default=None, help='Field holding an external paper ID, e.g. a DOI')
+    parser.add_argument('--model', type=str, default='intfloat/multilingual-e5-large-instruct',
+                        help='Embedding model, must match the one used for retrieval')
+    parser.add_argument('--device', type=str, default=None, help='Device for the embedding model')
+    parser.add_argument('--dtype', choices=DTYPES, default='float16', help='Type of the searched vectors')
+    parser.add_argument('--pca-dims', type=int, default=0,
+                        help='Dimensions the vectors are projected to with PCA before being searched, 0 to keep them')
+    parser.add_argument('--rescore', action='store_true',
+                        help='Keep the full-precision embeddings and rescore the search candidates with them')
+    parser.add_argument('--nlist', type=int, default=0, help='Number of IVF partitions, 0 for exhaustive search')
+    parser.add_argument('--batch-size', type=int, default=1024, help='Papers per batch')
+    parser.add_argument('--embed-batch-size', type=int, default=128, help='Chunks per embedding forward pass')
+    parser.add_argument('--embedding-cache-dir', type=str, default=None, help='Directory of the embedding cache')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    import torch
+    from database.embedding_cache import CachedEmbeddings
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    embeddings = HuggingFaceEmbeddings(model_name=args.model,
+                                       model_kwargs={'device': device},
+                                       encode_kwargs={'normalize_embeddings': True,
+                                                      'batch_size': args.embed_batch_size})
+    if args.embedding_cache_dir:
+        embeddings = CachedEmbeddings(embeddings, args.embedding_cache_dir)
+
+    build_numpy_vector_store(args.source, args.output_dir, embeddings, args.dtype, args.nlist, args.batch_size,
+                             args.title_field, args.abstract_field, args.pca_dims, args.rescore,
+                             id_field=args.id_field)
@@ -0,0 +1,110 @@
+"""
+Metadata of indexed papers, and filters on it that restrict the retrieval of cited papers.
+
+Papers can be indexed with their publication year, venue, fields of study and external IDs (e.g. as returned by the
+Semantic Scholar API). The metadata is stored on each paper in the `papers` index and copied into the `metadata` of
+each of its chunks in the `paper_embeddings` index, so that a `PaperFilter` can be applied as a pre-filter of the kNN
+search: Elasticsearch then only walks the chunks of matching papers, instead of filtering the nearest chunks after the
+fact and returning fewer papers than asked for.
+
+The typical filter bounds the year of the cited papers by the year of the checked paper, since a paper cannot cite
+work published after it.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+# Field mappings of the metadata, in both indices
+METADATA_PROPERTIES = {
+    'year': {'type': 'integer'},
+    'venue': {'type': 'keyword'},
+    'fields_of_study': {'type': 'keyword'},
+    'external_ids': {'type': 'flattened'},
+}
+
+
+def paper_metadata(paper: dict) -> dict:
+    """
+    Picks and normalizes the metadata of a paper, leaving out missing values.
+
+    Args:
+        paper (dict): A paper, possibly with a 'year', a 'venue', a list of 'fields_of_study' and a dictionary of
+            'external_ids'. A single field of study may be given as a string.
+
+    Returns:
+        dict: The metadata to index.
+    """
+    metadata = {}
+    if paper.get('year') is not None:
+        metadata['year'] = int(paper['year'])
+    if paper.get('venue'):
+        metadata['venue'] = str(paper['venue'])
+    if paper.get('fields_of_study'):
+        fields = paper['fields_of_study']
+        metadata['fields_of_study'] = [fields] if isinstance(fields, str) else [str(field) for field in fields]
+    if paper.get('external_ids'):
+        metadata['external_ids'] = {key: str(value) for key, value in paper['external_ids'].items()
+                                    if value is not None}
+
+    return metadata
+
+
+@dataclass(frozen=True)
+class PaperFilter:
+    """
+    Restricts the papers retrieved for the sentences of a checked paper.
+
+    Papers indexed without the filtered metadata never match a filter on it.
+
+    Args:
+        min_year (int): The earliest publication year, inclusive.
+        max_year (int): The latest publication year, inclusive, e.g. the year of the checked paper.
+        venues (tuple[str]): The venues the papers must be published in, any venue if empty.
+        fields_of_study (tuple[str]): The papers must have one of these fields of study, any field if empty.
+    """
+
+    min_year: Optional[int] = None
+    max_year: Optional[int] = None
+    venues: tuple[str, ...] = ()
+    fields_of_study: tuple[str, ...] = ()
+
+    def __post_init__(self):
+        # Lists are accepted for convenience, but kept as tuples so that filters stay hashable
+        object.__setattr__(self, 'venues', tuple(self.venues))
+        object.__setattr__(self, 'fields_of_study', tuple(self.fields_of_study))
+        if self.min_year is not None and self.max_year is not None and self.min_year > self.max_year:
+            raise ValueError(f"min_year {self.min_year} is after max_year {self.max_year}")
+
+    def __bool__(self) -> bool:
+        return any([self.min_year is not None, self.max_year is not None, self.venues, self.fields_of_study])
+
+    def es_filters(self, prefix: str = 'metadata.') -> list[dict]:
+        """
+        Builds the Elasticsearch filter clauses of the filter.
+
+        Args:
+            prefix (str): The path of the metadata in the documents, 'metadata.' for chunks and '' for papers.
+
+        Returns:
+            list[dict]: The clauses, to be used as the `filter` of a kNN search or of a `bool` query.
+        """
+        clauses = []
+        if self.min_year is not None or self.max_year is not None:
+            bounds = {}
+            if self.min_year is not None:
+                bounds['gte'] = self.min_year
+            if self.max_year is not None:
+                bounds['lte'] = self.max_year
+            clauses.append({'range': {f'{prefix}year': bounds}})
+        if self.venues:
+            clauses.append({'terms': {f'{prefix}venue': list(self.venues)}})
+        if self.fields_of_study:
+            clauses.append({'terms': {f'{prefix}fields_of_study': list(self.fields_of_study)}})
+
+        return clauses
+
+    def cache_key(self) -> list:
+        """
+        Returns a JSON-serializable value identifying the filter in cache keys.
+        """
+        return [self.min_year, self.max_year, sorted(self.venues), sorted(self.fields_of_study)]
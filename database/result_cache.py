@@ -0,0 +1,181 @@
+"""
+Persistent cache for the retrieval, rerank and classification results of `MissingCitationRetriever`.
+
+Results are stored as JSON in SQLite under a hash of everything they depend on. Entries expire after a TTL and the
+least recently used ones are evicted once the cache holds more than a maximum number of entries.
+
+Results that depend on the indexed papers include the generation of the papers index in their key. The generation is
+a counter stored in the `_meta` of the index mapping and bumped whenever papers are added, which invalidates every
+cached result of the previous generation without having to find and delete them.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from elasticsearch import Elasticsearch, NotFoundError
+from pathlib import Path
+from typing import Any, List, Optional
+
+
+def normalize_sentence(sentence: str) -> str:
+    """
+    Normalizes the Unicode form and whitespace of a sentence, so that sentences only differing in line breaks or
+    spacing share their cached results.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', sentence).split())
+
+
+def index_generation(es: Elasticsearch, index: str) -> int:
+    """
+    Reads the generation counter of an index, 0 if the index does not exist or was never bumped.
+    """
+    try:
+        mappings = next(iter(es.indices.get_mapping(index=index).values()))['mappings']
+    except NotFoundError:
+        return 0
+
+    return mappings.get('_meta', {}).get('generation', 0)
+
+
+def bump_index_generation(es: Elasticsearch, index: str) -> int:
+    """
+    Increments the generation counter of an existing index, invalidating the cached results computed against it.
+
+    Returns:
+        int: The new generation.
+    """
+    meta = next(iter(es.indices.get_mapping(index=index).values()))['mappings'].get('_meta', {})
+    generation = meta.get('generation', 0) + 1
+    # The _meta of a mapping is replaced as a whole, so keep its other fields
+    es.indices.put_mapping(index=index, meta={**meta, 'generation': generation})
+
+    return generation
+
+
+class ResultCache:
+    """
+    On-disk cache of JSON-serializable results.
+
+    Any number of threads in a process may use the cache. Several processes may share a cache file, at the cost of
+    waiting for each other's writes.
+
+    Args:
+        path (str | Path): The SQLite file of the cache, created with its directory if needed.
+        ttl (float): The number of seconds after which an entry expires, None to keep entries until evicted.
+        max_entries (int): The maximum number of entries, the least recently used ones are evicted beyond it.
+
+    Attributes:
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not found in the cache or expired.
+    """
+
+    def __init__(self, path: str | Path, ttl: Optional[float] = 7 * 24 * 3600, max_entries: int = 1_000_000):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'key BLOB PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+        self._db.commit()
+
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._size = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts) -> bytes:
+        """
+        Computes the cache key of a result from everything it depends on, given as JSON-serializable values.
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).digest()
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[Any]]:
+        """
+        Looks up several results at once.
+
+        Args:
+            keys (List[bytes]): The keys to look up, as returned by `key`.
+
+        Returns:
+            List[Optional[Any]]: The result for each key, or None if it is not cached or expired.
+        """
+        now = time.time()
+        oldest = now - self._ttl if self._ttl is not None else float('-inf')
+
+        with self._lock:
+            found = {}
+            # Stay below SQLite's limit on the number of bound parameters
+            for i in range(0, len(keys), 500):
+                chunk = list(dict.fromkeys(keys[i:i + 500]))
+                query = f"SELECT key, value FROM results WHERE key IN ({', '.join('?' * len(chunk))}) AND created >= ?"
+                found.update(self._db.execute(query, [*chunk, oldest]).fetchall())
+
+            if found:
+                self._db.executemany('UPDATE results SET accessed = ? WHERE key = ?', [(now, key) for key in found])
+                self._db.commit()
+
+            results = [json.loads(found[key]) if key in found else None for key in keys]
+            self.hits += sum(result is not None for result in results)
+            self.misses += sum(result is None for result in results)
+
+            return results
+
+    def put_many(self, items: List[tuple[bytes, Any]]) -> None:
+        """
+        Stores several results at once, replacing the results already stored under the same keys.
+
+        Args:
+            items (List[tuple[bytes, Any]]): The keys, as returned by `key`, and their results.
+        """
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany('INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                                 [(key, json.dumps(value), now, now) for key, value in items])
+            # Replacing an entry counts as a change too, so this overestimates the size until the next eviction
+            self._size += self._db.total_changes - before
+
+            if self._size > self._max_entries:
+                self._evict()
+
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counts of the cache.
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _evict(self) -> None:
+        if self._ttl is not None:
+            self._db.execute('DELETE FROM results WHERE created < ?', (time.time() - self._ttl,))
+
+        self._size = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        # Evict a tenth more than needed, so that evictions do not run on every insertion
+        excess = self._size - int(self._max_entries * 0.9)
+        if excess > 0:
+            self._db.execute('DELETE FROM results WHERE key IN '
+                             '(SELECT key FROM results ORDER BY accessed LIMIT ?)', (excess,))
+            self._size -= excess
@@ -1,9 +1,119 @@
-from elasticsearch import Elasticsearch
+import hashlib
+import unicodedata
+
+from database.knn_profiles import KnnProfile, get_knn_profile
+from database.paper_metadata import METADATA_PROPERTIES
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from langchain_core.embeddings import Embeddings
+from typing import Optional
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes the Unicode form, case and whitespace of a text, so that copies of a paper that only differ in
+    formatting get the same ID.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def paper_id(title: str, abstract: str, external_id: Optional[str] = None) -> str:
+    """
+    Derives a deterministic document ID for a paper, from its external ID (e.g. a DOI or a Semantic Scholar ID) when it
+    has one, or else from its normalized title and abstract.
+    """
+    if external_id:
+        return str(external_id)
+
+    return hashlib.sha1(f'{normalize_text(title)}\n\n{normalize_text(abstract)}'.encode('utf-8')).hexdigest()
+
+
+def paper_text_splitter():
+    """
+    Creates the text splitter cutting papers into the chunks that are embedded, shared by every writer of chunks so
+    that the Elasticsearch indices and the in-process vector stores hold the same chunks.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=100, add_start_index=True)
+
+
+def existing_ids(es: Elasticsearch, ids: list[str], index_name: str) -> set[str]:
+    """
+    Checks which of the given document IDs are already in an index, with batched `mget` requests that do not fetch the
+    documents themselves.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        ids (list[str]): The document IDs to check, e.g. from `paper_id`.
+        index_name (str): The name of the Elasticsearch index to check.
+
+    Returns:
+        set[str]: The IDs already in the index, empty if the index does not exist.
+    """
+    existing = set()
+    for i in range(0, len(ids), 1000):
+        try:
+            response = es.mget(index=index_name, ids=ids[i:i + 1000], source=False)
+        except NotFoundError:
+            return set()
+
+        existing.update(doc['_id'] for doc in response['docs'] if doc.get('found'))
+
+    return existing
+
+
+def update_paper_metadata(es: Elasticsearch, metadata: dict[str, dict], papers_index: str = 'papers',
+                          chunks_index: str = 'paper_embeddings', batch_size: int = 500) -> int:
+    """
+    Sets the metadata of papers that are already indexed, on the papers and in the `metadata` of their chunks, so that
+    metadata can be added to an existing corpus without indexing it again.
+
+    Only the given metadata fields are set, and papers whose metadata already has these values are left untouched.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        metadata (dict[str, dict]): The metadata of each paper ID, as returned by `paper_metadata`.
+        papers_index (str): The index storing the titles and abstracts.
+        chunks_index (str): The index storing the embedded chunks.
+        batch_size (int): The number of papers updated per request.
+
+    Returns:
+        int: The number of papers whose metadata changed.
+    """
+    ids = [id_ for id_, fields in metadata.items() if fields]
+    updated = 0
+    for i in range(0, len(ids), batch_size):
+        docs = es.mget(index=papers_index, ids=ids[i:i + batch_size], source=list(METADATA_PROPERTIES))['docs']
+        changed = {doc['_id']: metadata[doc['_id']] for doc in docs
+                   if doc.get('found') and any(doc['_source'].get(field) != value
+                                               for field, value in metadata[doc['_id']].items())}
+        if not changed:
+            continue
+
+        helpers.bulk(es, ({'_op_type': 'update', '_index': papers_index, '_id': id_, 'doc': fields}
+                          for id_, fields in changed.items()))
+        es.update_by_query(index=chunks_index, query={'terms': {'metadata.id': list(changed)}}, conflicts='proceed',
+                           script={'source': 'for (entry in params.metadata[ctx._source.metadata.id].entrySet()) '
+                                             '{ ctx._source.metadata[entry.getKey()] = entry.getValue(); }',
+                                   'params': {'metadata': changed}})
+        updated += len(changed)
+
+    return updated
 
 
 class VectorDatabase:
-    def __init__(self, db_url: str):
+    """
+    Thin wrapper around an Elasticsearch instance used to store papers and search them by embedding.
+
+    Args:
+        db_url (str): The URL of the Elasticsearch instance.
+        embeddings (Embeddings): Optional embedding model, e.g. a `CachedEmbeddings`, used to embed documents and
+            queries given as text.
+    """
+
+    def __init__(self, db_url: str, embeddings: Optional[Embeddings] = None):
         self.es = Elasticsearch(db_url)
+        self.embeddings = embeddings
         print('Connected to Elasticsearch!')
         print(self.es.info())
 
@@ -25,7 +135,8 @@ class VectorDatabase:
             **document,
         })
 
-    def insert_documents_in_index(self, documents: list[dict], index_name: str):
+    def insert_documents_in_index(self, documents: list[dict], index_name: str, embed_fields: list[str] = (),
+                                  ids: Optional[list[str]] = None):
         """
         Inserts a list of documents into a specified Elasticsearch index with their
         titles and embeddings.
@@ -34,16 +145,24 @@ class VectorDatabase:
             documents (list[dict]): A list of dictionaries containing the documents to be indexed.
                                     Each dictionary must include a 'title' key (str) and an 'abstract' key (str).
             index_name (str): The name of the Elasticsearch index where the documents should be stored.
+            embed_fields (list[str]): Fields to embed with the database's embedding model before indexing, e.g.
+                                      ['title', 'abstract']. Each embedding is stored under '<field>_embedding'.
+            ids (list[str]): Optional IDs of the documents, e.g. from `paper_id`. A document whose ID is already in
+                             the index replaces the indexed one instead of being added again.
 
         Returns:
             None
         """
+        if embed_fields:
+            documents = self.embed_documents(documents, embed_fields)
+
         operations = []
-        
-        for document in documents:
+
+        for i, document in enumerate(documents):
             operations.append({
                 'index': {
-                    '_index': index_name
+                    '_index': index_name,
+                    **({'_id': ids[i]} if ids else {}),
                 }
             })
 
@@ -53,6 +172,28 @@ class VectorDatabase:
 
         return self.es.bulk(operations=operations)
 
+    def embed_documents(self, documents: list[dict], fields: list[str]) -> list[dict]:
+        """
+        Embeds the given fields of a list of documents with the database's embedding model.
+
+        Args:
+            documents (list[dict]): The documents to embed.
+            fields (list[str]): The fields to embed.
+
+        Returns:
+            list[dict]: Copies of the documents with each embedding stored under '<field>_embedding'.
+        """
+        if self.embeddings is None:
+            raise ValueError("No embedding model was given to the database.")
+
+        documents = [dict(document) for document in documents]
+        for field in fields:
+            embeddings = self.embeddings.embed_documents([document[field] for document in documents])
+            for document, embedding in zip(documents, embeddings):
+                document[f'{field}_embedding'] = embedding
+
+        return documents
+
     def create_index(self, index_name: str, mappings: dict) -> None:
         """
             Creates a new Elasticsearch index with a specified name and mapping configuration
@@ -68,6 +209,37 @@ class VectorDatabase:
         self.es.indices.delete(index=index_name, ignore_unavailable=True)
         self.es.indices.create(index=index_name, mappings=mappings)
 
+    def create_index_if_missing(self, index_name: str, mappings: dict) -> bool:
+        """
+        Creates a new Elasticsearch index with a specified name and mapping configuration,
+        leaving it untouched if it already exists.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to create.
+            mappings (dict): The mapping configuration for the index.
+
+        Returns:
+            bool: Whether the index was created.
+        """
+        if self.es.indices.exists(index=index_name):
+            return False
+
+        self.es.indices.create(index=index_name, mappings=mappings)
+        return True
+
+    def existing_ids(self, ids: list[str], index_name: str) -> set[str]:
+        """
+        Checks which of the given document IDs are already in the specified index, see `existing_ids`.
+        """
+        return existing_ids(self.es, ids, index_name)
+
+    def update_paper_metadata(self, metadata: dict[str, dict], papers_index: str = 'papers',
+                              chunks_index: str = 'paper_embeddings') -> int:
+        """
+        Sets the metadata of papers that are already indexed, see `update_paper_metadata`.
+        """
+        return update_paper_metadata(self.es, metadata, papers_index, chunks_index)
+
     def check_already_indexed(self, title: str, index_name: str) -> bool:
         """
         Checks if a document with a given title is already indexed in the specified index.
@@ -75,7 +247,7 @@ class VectorDatabase:
         This function performs a search query on the Elasticsearch instance to determine
         whether a document with the given title exists in the index. If the search finds at
         least one result, it returns True, indicating the document is already indexed.
-        Otherwise, it returns False.
+        Otherwise, it returns False. Prefer `existing_ids` with `paper_id` to check many papers.
 
         Args:
             title (str): The title of the document to check for existence in the index.
@@ -94,7 +266,8 @@ class VectorDatabase:
 
         return rsp['hits']['total']['value'] > 0
 
-    def knn_search(self, query_vector: list[float], index_name: str, field: str, k: int = 10) -> list[dict]:
+    def knn_search(self, query_vector: list[float], index_name: str, field: str, k: int = 10,
+                   profile: str | KnnProfile = 'balanced', num_candidates: Optional[int] = None) -> list[dict]:
         """
         Performs a k-nearest neighbors search on the specified index using the given query vector.
 
@@ -103,18 +276,34 @@ class VectorDatabase:
             index_name (str): The name of the Elasticsearch index to search within.
             field (str): The field in the index to use for the k-NN.
             k (int): The number of nearest neighbors to return.
+            profile (str | KnnProfile): The kNN profile setting how many candidates are considered, or whether the
+                search is exact.
+            num_candidates (int): Overrides the number of candidates of the profile.
 
         Returns:
             list[dict]: A list of the k nearest neighbors to the query vector.
         """
-        rsp = self.es.search(
-            index=index_name,
-            knn={
-                'field': field,
-                'query_vector': query_vector,
-                'num_candidates': 10000,
-                'k': k,
-            }
-        )
+        rsp = self.es.search(index=index_name,
+                             body=get_knn_profile(profile).search_body(field, query_vector, k, num_candidates))
 
         return rsp['hits']['hits']
+
+    def knn_search_text(self, query: str, index_name: str, field: str, k: int = 10,
+                        profile: str | KnnProfile = 'balanced') -> list[dict]:
+        """
+        Embeds a query with the database's embedding model and performs a k-nearest neighbors search with it.
+
+        Args:
+            query (str): The query text.
+            index_name (str): The name of the Elasticsearch index to search within.
+            field (str): The field in the index to use for the k-NN.
+            k (int): The number of nearest neighbors to return.
+            profile (str | KnnProfile): The kNN profile of the search.
+
+        Returns:
+            list[dict]: A list of the k nearest neighbors to the query.
+        """
+        if self.embeddings is None:
+            raise ValueError("No embedding model was given to the database.")
+
+        return self.knn_search(self.embeddings.embed_query(query), index_name, field, k, profile)
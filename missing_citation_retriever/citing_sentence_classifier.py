@@ -0,0 +1,280 @@
+"""
+Inference backends for the fine-tuned SciBERT citing sentence classifier.
+
+Both backends share the batching strategy: sentences are tokenized once, sorted by token length and grouped into
+batches whose padded size stays within a token budget, so short sentences are batched in large numbers and long ones
+are not padded against each other. Fragments that obviously cannot be citing sentences (very short strings,
+equations, table rows) are answered without running the model.
+
+- `TorchCitingSentenceClassifier` runs the HuggingFace model with PyTorch.
+- `OnnxCitingSentenceClassifier` exports the model to ONNX once and runs it with ONNX Runtime, optionally with int8
+  dynamic quantization, which is considerably faster on CPU-only machines. The exported files are exported again when
+  the weights they were exported from change, e.g. after the classifier is retrained in place.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import numpy as np
+
+from pathlib import Path
+from typing import List, Optional
+from transformers import AutoTokenizer
+
+_WORD_REGEX = re.compile(r'[^\W\d_]{2,}')
+
+# The files of a HuggingFace model directory that the exported models depend on
+_WEIGHT_FILES = ('config.json', '*.safetensors', '*.bin')
+
+
+def _weights_fingerprint(model_path: str) -> str:
+    """
+    Identifies the weights of a model by the names, sizes and modification times of its files, without reading them.
+    """
+    files = sorted({file for pattern in _WEIGHT_FILES for file in Path(model_path).glob(pattern)})
+    stats = [[file.name, file.stat().st_size, file.stat().st_mtime_ns] for file in files]
+
+    return hashlib.sha1(json.dumps(stats).encode('utf-8')).hexdigest()
+
+
+def _source_path(onnx_path: Path) -> Path:
+    # Sidecar file holding the fingerprint of the weights an ONNX file was exported from
+    return onnx_path.with_name(f'{onnx_path.name}.source')
+
+
+def _is_current(onnx_path: Path, fingerprint: str) -> bool:
+    source_path = _source_path(onnx_path)
+    return onnx_path.exists() and source_path.exists() and source_path.read_text().strip() == fingerprint
+
+
+def _publish(tmp_path: Path, onnx_path: Path, fingerprint: str) -> None:
+    """
+    Moves a fully written ONNX file in place and records the weights it comes from, so that an interrupted export
+    never leaves a truncated file behind.
+    """
+    tmp_path.replace(onnx_path)
+    tmp_source_path = _source_path(tmp_path)
+    tmp_source_path.write_text(fingerprint)
+    tmp_source_path.replace(_source_path(onnx_path))
+
+
+def is_obviously_non_citing(sentence: str, min_words: int = 3, min_letter_ratio: float = 0.5) -> bool:
+    """
+    Cheap check for fragments that cannot be citing sentences, such as very short strings, equations or table rows.
+
+    Args:
+        sentence (str): The sentence to check.
+        min_words (int): The minimum number of words of a citing sentence.
+        min_letter_ratio (float): The minimum fraction of letters among the non-whitespace characters.
+
+    Returns:
+        bool: Whether the sentence can be skipped.
+    """
+    if len(_WORD_REGEX.findall(sentence)) < min_words:
+        return True
+
+    characters = [c for c in sentence if not c.isspace()]
+    return sum(c.isalpha() for c in characters) < min_letter_ratio * len(characters)
+
+
+class CitingSentenceClassifier:
+    """
+    Base class of the classifier backends, implementing early exit and length-bucketed, token-budgeted batching.
+
+    Calling an instance on a list of sentences returns the same format as the HuggingFace `text-classification`
+    pipeline, e.g. [{'label': False, 'score': 0.9988425374031067}, ...]. Sentences skipped by the early exit get
+    {'label': False, 'score': 1.0}.
+
+    Args:
+        model_path (str): The path to the fine-tuned model and its tokenizer.
+        max_tokens_per_batch (int): The maximum number of tokens, padding included, in a batch.
+        max_batch_size (int): The maximum number of sentences in a batch.
+        max_length (int): The maximum number of tokens of a sentence, longer sentences are truncated.
+        early_exit (bool): Whether to skip the model for obviously non-citing fragments.
+    """
+
+    def __init__(self, model_path: str, max_tokens_per_batch: int = 8192, max_batch_size: int = 128,
+                 max_length: int = 512, early_exit: bool = True):
+        self.model_path = model_path
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.max_length = max_length
+        self.early_exit = early_exit
+        self._tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+    def __call__(self, sentences: List[str]) -> List[dict]:
+        results = [{'label': False, 'score': 1.0} for _ in sentences]
+
+        indices = [i for i, sentence in enumerate(sentences)
+                   if not (self.early_exit and is_obviously_non_citing(sentence))]
+        if not indices:
+            return results
+
+        encoded = self._tokenizer([sentences[i] for i in indices], truncation=True, max_length=self.max_length)
+        features = [{key: encoded[key][j] for key in encoded.keys()} for j in range(len(indices))]
+
+        for batch in self._batches(features):
+            probabilities = _softmax(self._logits(self._tokenizer.pad([features[j] for j in batch],
+                                                                       return_tensors='np')))
+            for j, row in zip(batch, probabilities):
+                label = int(row.argmax())
+                results[indices[j]] = {'label': label == 1, 'score': float(row[label])}
+
+        return results
+
+    def _batches(self, features: List[dict]) -> List[List[int]]:
+        """
+        Groups sentences of similar length so that each batch, once padded, fits in the token budget.
+        """
+        order = sorted(range(len(features)), key=lambda i: len(features[i]['input_ids']))
+
+        batches = []
+        batch = []
+        for i in order:
+            # Sentences come in increasing length, so the current one sets the padded length of the batch
+            padded_length = len(features[i]['input_ids'])
+            if batch and (len(batch) >= self.max_batch_size
+                          or (len(batch) + 1) * padded_length > self.max_tokens_per_batch):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _logits(self, batch: dict) -> np.ndarray:
+        raise NotImplementedError
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class TorchCitingSentenceClassifier(CitingSentenceClassifier):
+    """
+    Runs the classifier with PyTorch.
+
+    Args:
+        device (str): The device to run the model on, defaults to CUDA when available.
+    """
+
+    def __init__(self, model_path: str, device: Optional[str] = None, **kwargs):
+        super().__init__(model_path, **kwargs)
+
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        self._torch = torch
+        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self._model = AutoModelForSequenceClassification.from_pretrained(model_path).to(self.device)
+        self._model.eval()
+
+    def _logits(self, batch: dict) -> np.ndarray:
+        with self._torch.inference_mode():
+            inputs = {key: self._torch.from_numpy(value).to(self.device) for key, value in batch.items()}
+            return self._model(**inputs).logits.float().cpu().numpy()
+
+
+class OnnxCitingSentenceClassifier(CitingSentenceClassifier):
+    """
+    Runs the classifier with ONNX Runtime, exporting the model to ONNX on first use.
+
+    Args:
+        onnx_dir (str): The directory where the exported models are stored, defaults to `<model_path>/onnx`.
+        quantize (bool): Whether to use an int8 dynamically quantized version of the model.
+        device (str): 'cuda' to run on the CUDA execution provider, anything else runs on CPU.
+    """
+
+    def __init__(self, model_path: str, onnx_dir: Optional[str] = None, quantize: bool = False,
+                 device: Optional[str] = None, **kwargs):
+        super().__init__(model_path, **kwargs)
+
+        import onnxruntime
+
+        onnx_dir = Path(onnx_dir or os.path.join(model_path, 'onnx'))
+        fingerprint = _weights_fingerprint(model_path)
+        onnx_path = self._export(onnx_dir, fingerprint)
+        if quantize:
+            onnx_path = self._quantize(onnx_path, fingerprint)
+
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if device == 'cuda' \
+            else ['CPUExecutionProvider']
+        self._session = onnxruntime.InferenceSession(str(onnx_path), providers=providers)
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+        logging.info(f"Loaded ONNX classifier {onnx_path}")
+
+    def _export(self, onnx_dir: Path, fingerprint: str) -> Path:
+        onnx_path = onnx_dir / 'model.onnx'
+        if _is_current(onnx_path, fingerprint):
+            return onnx_path
+
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        logging.info(f"Exporting {self.model_path} to {onnx_path}")
+        onnx_dir.mkdir(parents=True, exist_ok=True)
+
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        model.eval()
+        sample = self._tokenizer(['We used the Adam optimizer.'], return_tensors='pt')
+        input_names = list(sample.keys())
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['logits'] = {0: 'batch'}
+
+        tmp_path = onnx_path.with_name('model.tmp.onnx')
+        with torch.inference_mode():
+            torch.onnx.export(model, tuple(sample[name] for name in input_names), str(tmp_path),
+                              input_names=input_names, output_names=['logits'], dynamic_axes=dynamic_axes,
+                              opset_version=17)
+        _publish(tmp_path, onnx_path, fingerprint)
+
+        return onnx_path
+
+    @staticmethod
+    def _quantize(onnx_path: Path, fingerprint: str) -> Path:
+        quantized_path = onnx_path.with_name('model.int8.onnx')
+        if _is_current(quantized_path, fingerprint):
+            return quantized_path
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logging.info(f"Quantizing {onnx_path} to {quantized_path}")
+        tmp_path = onnx_path.with_name('model.int8.tmp.onnx')
+        quantize_dynamic(str(onnx_path), str(tmp_path), weight_type=QuantType.QInt8)
+        _publish(tmp_path, quantized_path, fingerprint)
+
+        return quantized_path
+
+    def _logits(self, batch: dict) -> np.ndarray:
+        inputs = {key: value.astype(np.int64) for key, value in batch.items() if key in self._input_names}
+        return self._session.run(['logits'], inputs)[0]
+
+
+def load_citing_sentence_classifier(model_path: str, backend: str = 'torch', quantize: bool = False,
+                                    device: Optional[str] = None, **kwargs) -> CitingSentenceClassifier:
+    """
+    Loads the citing sentence classifier with the given inference backend.
+
+    Args:
+        model_path (str): The path to the fine-tuned model and its tokenizer.
+        backend (str): Either 'torch' or 'onnx'.
+        quantize (bool): Whether to use int8 dynamic quantization, only supported by the ONNX backend.
+        device (str): The device to run the model on.
+        **kwargs: Batching options passed to `CitingSentenceClassifier`.
+
+    Returns:
+        CitingSentenceClassifier: The classifier.
+    """
+    if backend == 'torch':
+        if quantize:
+            raise ValueError("Quantization is only supported by the ONNX backend.")
+        return TorchCitingSentenceClassifier(model_path, device=device, **kwargs)
+    if backend == 'onnx':
+        return OnnxCitingSentenceClassifier(model_path, quantize=quantize, device=device, **kwargs)
+
+    raise ValueError(f"Unknown classifier backend: {backend}")
@@ -0,0 +1,114 @@
+"""
+Local cross-encoder reranker that can be used in place of `RankLLMRerank`.
+
+Scores (query, document) pairs with a sequence classification model such as `BAAI/bge-reranker-v2-m3`, without any
+network calls.
+"""
+
+import logging
+import torch
+
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from pydantic import PrivateAttr
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from typing import List, Optional, Sequence
+
+
+class CrossEncoderReranker(BaseDocumentCompressor):
+    """
+    Reranks documents by scoring each of them against the query with a cross-encoder model.
+
+    Pairs are tokenized once, sorted by length and scored in batches padded only up to the longest pair of each batch,
+    which keeps padding to a minimum when document lengths vary.
+
+    Args:
+        model_name (str): The HuggingFace name or local path of the cross-encoder model.
+        top_n (int): The number of documents to return.
+        batch_size (int): The number of pairs scored in one forward pass.
+        max_length (int): The maximum number of tokens of a (query, document) pair, longer pairs are truncated.
+        device (str): The device to run the model on, defaults to CUDA when available.
+        quantize (bool): Whether to apply int8 dynamic quantization to the linear layers. Only supported on CPU.
+    """
+
+    model_name: str = 'BAAI/bge-reranker-v2-m3'
+    top_n: int = 5
+    batch_size: int = 32
+    max_length: int = 512
+    device: Optional[str] = None
+    quantize: bool = False
+
+    _tokenizer = PrivateAttr()
+    _model = PrivateAttr()
+
+    def model_post_init(self, __context) -> None:
+        if self.device is None:
+            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+        model.eval()
+
+        if self.quantize:
+            if self.device == 'cpu':
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            else:
+                logging.warning("int8 dynamic quantization is only supported on CPU, using the full precision model")
+
+        self._model = model.to(self.device)
+        logging.info(f"Loaded reranker model {self.model_name} on device {self.device}")
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Computes the relevance score of each text to the query.
+
+        Args:
+            query (str): The query.
+            texts (List[str]): The texts to be scored.
+
+        Returns:
+            List[float]: The relevance scores, in the same order as the texts.
+        """
+        if not texts:
+            return []
+
+        encoded = self._tokenizer([[query, text] for text in texts], truncation=True, max_length=self.max_length)
+        features = [{key: encoded[key][i] for key in encoded.keys()} for i in range(len(texts))]
+
+        # Sorting by length means each batch is padded to a similar length
+        order = sorted(range(len(texts)), key=lambda i: len(features[i]['input_ids']))
+
+        scores = [0.0] * len(texts)
+        with torch.inference_mode():
+            for i in range(0, len(order), self.batch_size):
+                batch_indices = order[i:i + self.batch_size]
+                batch = self._tokenizer.pad([features[j] for j in batch_indices], return_tensors='pt')
+                batch = {key: value.to(self.device) for key, value in batch.items()}
+
+                logits = self._model(**batch).logits.view(-1).float().cpu()
+                for j, logit in zip(batch_indices, logits.tolist()):
+                    scores[j] = logit
+
+        return scores
+
+    def compress_documents(self,
+                           documents: Sequence[Document],
+                           query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        """
+        Reranks the documents by relevance to the query and keeps the `top_n` best ones.
+
+        Args:
+            documents (Sequence[Document]): The documents to be reranked.
+            query (str): The query to rank the documents against.
+            callbacks (Optional[Callbacks]): Unused, kept for compatibility with `BaseDocumentCompressor`.
+
+        Returns:
+            Sequence[Document]: The most relevant documents, ordered by decreasing relevance, with their score stored
+                under the `relevance_score` metadata key.
+        """
+        scores = self.score(query, [doc.page_content for doc in documents])
+        ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)[:self.top_n]
+
+        return [Document(page_content=doc.page_content, metadata={**doc.metadata, 'relevance_score': score})
+                for doc, score in ranked]
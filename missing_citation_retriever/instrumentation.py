@@ -0,0 +1,243 @@
+"""
+Timing spans and counters recorded by `MissingCitationRetriever` while checking papers.
+
+The retriever reports to a `Metrics` object:
+- spans time the stages of a check: `check_paper`, `extract`, `tokenize`, `classify`, `retrieve`, `embed`, `search`,
+  `fetch` and `rerank`. Spans nest, e.g. `embed`, `search` and `fetch` run within `retrieve`.
+- counters count the work done: sentences extracted, filtered by their citation marker, classified, found citing and
+  retrieved, Elasticsearch requests, reranker calls and documents, rate limited LLM calls and the estimated number of
+  tokens sent to the LLM.
+
+The default `Metrics` does nothing and costs a method call per span or counter. `InMemoryMetrics` keeps totals that can
+be read with `snapshot`, `PrometheusMetrics` exports them through `prometheus_client` and `OpenTelemetryMetrics`
+reports spans and metrics through the OpenTelemetry API, to whatever SDK and exporter the application configured.
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Iterable, Iterator, Optional
+
+# Returned by every disabled span, so that entering one allocates nothing
+_NULL_SPAN = nullcontext()
+
+
+class Metrics:
+    """
+    Disabled metrics, ignoring every span and counter.
+
+    Attributes:
+        enabled (bool): Whether the metrics are recorded, so that callers can skip computing costly values.
+    """
+
+    enabled = False
+
+    def span(self, name: str) -> ContextManager:
+        """
+        Times the code run within the returned context manager as a stage.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        return _NULL_SPAN
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Adds a value to a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (int): The value added.
+        """
+
+    def snapshot(self) -> dict:
+        """
+        Returns the recorded spans and counters, empty when they are exported elsewhere.
+        """
+        return {}
+
+
+class InMemoryMetrics(Metrics):
+    """
+    Metrics keeping the number of calls, total and maximum duration of each stage and the total of each counter.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                calls, total, longest = self._spans.get(name, (0, 0.0, 0.0))
+                self._spans[name] = (calls + 1, total + elapsed, max(longest, elapsed))
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'spans': {name: {'calls': calls, 'seconds': total, 'max_seconds': longest}
+                          for name, (calls, total, longest) in self._spans.items()},
+                'counters': dict(self._counters),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Metrics exported through `prometheus_client`, as a `citeseek_stage_duration_seconds` histogram labeled by stage and
+    one `citeseek_<name>_total` counter per counter.
+
+    Args:
+        registry (CollectorRegistry): The registry the metrics are registered in, the default registry if None. A
+            registry can only hold the metrics of one instance.
+        namespace (str): The prefix of the metric names.
+    """
+
+    enabled = True
+
+    def __init__(self, registry=None, namespace: str = 'citeseek'):
+        from prometheus_client import REGISTRY, Histogram
+
+        self._registry = registry or REGISTRY
+        self._namespace = namespace
+        self._durations = Histogram('stage_duration_seconds', 'Duration of the stages of a paper check', ['stage'],
+                                    namespace=namespace, registry=self._registry,
+                                    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120))
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._durations.labels(name).observe(time.perf_counter() - start)
+
+    def count(self, name: str, value: int = 1) -> None:
+        counter = self._counters.get(name)
+        if counter is None:
+            from prometheus_client import Counter
+
+            with self._lock:
+                counter = self._counters.get(name)
+                if counter is None:
+                    counter = self._counters[name] = Counter(name, f'Number of {name.replace("_", " ")}',
+                                                             namespace=self._namespace, registry=self._registry)
+        counter.inc(value)
+
+    def render(self) -> bytes:
+        """
+        Renders the metrics of the registry in the Prometheus text format, to be served on a `/metrics` endpoint.
+        """
+        from prometheus_client import generate_latest
+
+        return generate_latest(self._registry)
+
+
+class OpenTelemetryMetrics(Metrics):
+    """
+    Metrics reported through the OpenTelemetry API: every span is a trace span and is also recorded in a
+    `citeseek.stage.duration` histogram, and counters are `citeseek.<name>` counters.
+
+    Without a configured OpenTelemetry SDK, the API records nothing.
+
+    Args:
+        tracer_provider (TracerProvider): The provider of the tracer, the global one if None.
+        meter_provider (MeterProvider): The provider of the meter, the global one if None.
+    """
+
+    enabled = True
+
+    def __init__(self, tracer_provider=None, meter_provider=None):
+        from opentelemetry import metrics, trace
+
+        self._tracer = trace.get_tracer('citeseek', tracer_provider=tracer_provider)
+        self._meter = metrics.get_meter('citeseek', meter_provider=meter_provider)
+        self._durations = self._meter.create_histogram('citeseek.stage.duration', unit='s',
+                                                       description='Duration of the stages of a paper check')
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        with self._tracer.start_as_current_span(name):
+            try:
+                yield
+            finally:
+                self._durations.record(time.perf_counter() - start, {'stage': name})
+
+    def count(self, name: str, value: int = 1) -> None:
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, self._meter.create_counter(f'citeseek.{name}'))
+        counter.add(value)
+
+
+# Shared by every retriever created without metrics
+NULL_METRICS = Metrics()
+
+
+def timed(metrics: Metrics, name: str, iterable: Iterable) -> Iterable:
+    """
+    Times each step of an iterator in its own span, e.g. the extraction of each page by a generator.
+
+    Args:
+        metrics (Metrics): The metrics the spans are reported to.
+        name (str): The name of the stage.
+        iterable (Iterable): The iterable whose steps are timed, returned as is when metrics are disabled.
+    """
+    return _timed(metrics, name, iter(iterable)) if metrics.enabled else iterable
+
+
+def _timed(metrics: Metrics, name: str, iterator: Iterator) -> Iterator:
+    while True:
+        with metrics.span(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+
+_END = object()
+
+
+def create_metrics(kind: Optional[str]) -> Metrics:
+    """
+    Creates metrics by name.
+
+    Args:
+        kind (str): 'none' or None for disabled metrics, 'memory', 'prometheus' or 'opentelemetry'.
+
+    Returns:
+        Metrics: The metrics.
+    """
+    if kind in (None, 'none'):
+        return NULL_METRICS
+    if kind == 'memory':
+        return InMemoryMetrics()
+    if kind == 'prometheus':
+        return PrometheusMetrics()
+    if kind == 'opentelemetry':
+        return OpenTelemetryMetrics()
+
+    raise ValueError(f"Unknown metrics: {kind}")
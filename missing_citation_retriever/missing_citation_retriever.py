@@ -1,31 +1,125 @@
+import asyncio
+import functools
+import hashlib
+import itertools
+import json
 import logging
 import os
-import re
-import torch
-
-from elasticsearch import Elasticsearch
-from langchain_community.document_compressors import RankLLMRerank
-from langchain_core.documents import Document
-from langchain_elasticsearch import ElasticsearchStore
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from nltk import sent_tokenize
-from paper_text_extractor.paper_text_extractor import get_paper_text
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from database.knn_profiles import KnnProfile, chunk_index_mappings, get_knn_profile
+from database.paper_metadata import METADATA_PROPERTIES, PaperFilter, paper_metadata
+from missing_citation_retriever.instrumentation import NULL_METRICS, Metrics, timed
+from paper_text_extractor.citation_markers import contains_citation_marker
+from paper_text_extractor.section_segmenter import SectionKind
 from pathlib import Path
-from transformers import pipeline
-from typing import TypedDict, List
-from langgraph.graph import START, StateGraph
+from typing import TYPE_CHECKING, Callable, Hashable, Iterator, Optional, TypedDict, List
+
+# Heavy dependencies (torch, transformers, langchain, langgraph, nltk, elasticsearch) are imported where they are
+# first needed, so that importing this module and constructing a retriever are fast
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from paper_text_extractor.sentence_splitter import Sentence
+
+
+# Number of distinct papers retrieved per sentence, and number of nearest chunks searched per paper to find them,
+# since an abstract is split into several overlapping chunks
+_RETRIEVED_PAPERS = 50
+_CHUNKS_PER_PAPER = 3
+
+# The instruction the sentences are embedded with when searching for the papers they cite
+QUERY_INSTRUCTION = "Given a sentence where a paper is cited, find the abstract of the paper it cites."
 
 
 def _format_query_instruction(task_description: str, query: str) -> str:
     return f'Instruct: {task_description}\nQuery: {query}'
 
 
-def _contains_reference(sentence: str) -> bool:
-    # Matches any citation in the form of [1], [1-3], [1, 3], [1, 3-5], [1, 3, 5-7], etc.
-    citation_regex = r' ?\[\d+(?:-\d+|(?:, ?\d+(-\d+)?)*)+\] ?'
+def _default_device() -> str:
+    import torch
+
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+class _ModelPool:
+    """
+    Loads models on first use and keeps them, so that each model is loaded at most once per pool even when several
+    threads ask for it at the same time.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, load: Callable):
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self._models[key] = load()
+        return model
+
+
+# Models shared by every retriever created with `share_models=True`
+_SHARED_MODELS = _ModelPool()
+
+
+def _documents_to_cache(docs: List['Document']) -> list:
+    return [[doc.page_content, doc.metadata['title']] for doc in docs]
+
+
+def _documents_from_cache(cached: list) -> List['Document']:
+    from langchain_core.documents import Document
+
+    return [Document(page_content=page_content, metadata={'title': title}) for page_content, title in cached]
+
+
+@functools.cache
+def _llm_encoding():
+    import tiktoken
+
+    return tiktoken.encoding_for_model('gpt-4o-mini')
+
 
-    return bool(re.search(citation_regex, sentence))
+def _count_tokens(texts: List[str]) -> int:
+    return sum(len(tokens) for tokens in _llm_encoding().encode_batch(texts))
+
+
+def _sentence_hash(sentence: str) -> str:
+    from database.result_cache import normalize_sentence
+
+    return hashlib.sha1(normalize_sentence(sentence).encode('utf-8')).hexdigest()
+
+
+def _reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Fuses several rankings of IDs with reciprocal rank fusion, scoring each ID with the sum of `1 / (k + rank)` over the
+    rankings it appears in. Only the first occurrence of an ID in a ranking counts.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(dict.fromkeys(ranking), start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1 / (k + rank)
+
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+async def _gather_or_cancel(aws) -> list:
+    """
+    Like `asyncio.gather`, but cancels the remaining tasks as soon as one of them fails.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
 
 class MissingCitationRetriever:
@@ -40,24 +134,92 @@ class MissingCitationRetriever:
     Args:
         url (str): The URL of the Elasticsearch instance.
         citing_sentence_classifier_path (str): The path to the citing sentence classifier model.
+        retrieval_batch_size (int): The number of sentences embedded and searched together in one request.
+        sentence_batch_size (int): The number of sentences classified together while a paper is read. The citing
+            sentences of a batch are retrieved and reranked before the next batch is read.
+        rerank_concurrency (int): The maximum number of reranker calls running at the same time.
+        max_concurrency (int): The maximum number of sentences going through the async graph at the same time, shared
+            by every `acheck_paper` call made on this instance.
+        max_retries (int): The number of times a reranker call is retried when the LLM is rate limited.
+        retry_base_delay (float): The delay in seconds before the first retry, doubled on every following retry.
+        reranker (str | BaseDocumentCompressor): The reranker used to reorder retrieved papers, either 'llm' for
+            `RankLLMRerank` with `gpt-4o-mini`, 'cross-encoder' for a local `CrossEncoderReranker` or any document
+            compressor instance.
+        quantize_reranker (bool): Whether to apply int8 dynamic quantization to the cross-encoder reranker on CPU.
+        embedding_cache_dir (str): If set, embeddings are cached on disk in this directory and reused across calls and
+            runs.
+        pdf_jobs (int): The number of processes extracting the pages of a PDF in parallel.
+        pdf_cache_dir (str): If set, the text extracted from PDFs is cached in this directory, so re-checking an
+            unchanged paper skips extraction.
+        classifier_backend (str): The inference backend of the citing sentence classifier, 'torch' or 'onnx'.
+        quantize_classifier (bool): Whether to run the ONNX classifier with int8 dynamic quantization.
+        section_kinds (tuple[SectionKind]): The kinds of sections of a paper that are checked for missing citations.
+            Only the body is checked by default, leaving out the front matter, abstract, acknowledgements, references
+            and appendices.
+        share_models (bool): Whether to share loaded models with the other retrievers of this process created with the
+            same option and model configuration, instead of loading a private copy.
+        knn_profile (str | KnnProfile): The latency/recall tradeoff of the kNN search over paper chunks, 'fast',
+            'balanced', 'exact' or a custom `KnnProfile`. Its HNSW and quantization settings are used when
+            `index_papers` creates the chunks index.
+        vector_store_path (str): If set, papers are retrieved from the `NumpyVectorStore` in this directory instead of
+            Elasticsearch, so checking papers needs no running service. Indexing still goes to Elasticsearch.
+        nprobe (int): The number of IVF partitions searched per query when the local vector store is partitioned.
+        retrieval_mode (str): 'dense' to retrieve papers with the kNN search over their chunks only, or 'hybrid' to
+            also run a BM25 search over the titles and abstracts in the same request and fuse both rankings with
+            reciprocal rank fusion, which recovers papers named by rare technical terms.
+        rerank_candidates (int): The number of distinct papers sent to the reranker for each sentence. Defaults to 10
+            in hybrid mode and to every retrieved paper in dense mode.
+        result_cache_dir (str): If set, classification, retrieval and rerank results are cached on disk in this
+            directory by normalized sentence, so re-checking an unchanged paper reuses them. Retrieval and rerank
+            results are invalidated when papers are indexed.
+        result_cache_ttl (float): The number of seconds after which cached results expire, None to never expire them.
+        result_cache_max_entries (int): The maximum number of cached results, the least recently used are evicted.
+        generation_check_interval (float): The number of seconds a read of the index generation is reused, which
+            bounds how long results cached before another process indexed papers can still be served.
+        manifest_dir (str): If set, papers are checked incrementally: a manifest of the classification and retrieval
+            results of every sentence of a paper is stored in this directory, and re-checking the paper only runs the
+            models on the sentences that were added or changed since.
+        metrics (Metrics): Where the timings of the stages of each check and the counts of sentences, Elasticsearch
+            requests and reranker calls are reported, see `missing_citation_retriever.instrumentation`. Nothing is
+            recorded by default.
+
+    Models and connections are created lazily on first use, so construction is cheap. Call `warmup()` to load
+    everything and check the connection to Elasticsearch upfront.
 
     Attributes:
-        _embeddings (HuggingFaceEmbeddings): The embeddings model used for vector representation.
+        _embeddings (HuggingFaceEmbeddings | CachedEmbeddings): The embeddings model used for vector representation.
         _QUERY (str): The query instruction for retrieving relevant papers.
         _vector_store (ElasticsearchStore): The Elasticsearch store for vector embeddings.
         _es (Elasticsearch): The Elasticsearch client.
+        _async_es (AsyncElasticsearch): The Elasticsearch client used by the async pipeline.
         _text_splitter (RecursiveCharacterTextSplitter): The text splitter for document chunking.
-        _citing_sentence_classifier (pipeline): The HuggingFace pipeline for sentence classification.
-        _reranker (RankLLMRerank): The language model reranker for reordering retrieved documents.
-        _graph (StateGraph): The state graph for processing sentences.
+        _citing_sentence_classifier (CitingSentenceClassifier): The citing sentence classifier.
+        _reranker (BaseDocumentCompressor): The reranker for reordering retrieved documents.
+        _graph (StateGraph): The state graph for processing sentences, supporting both `invoke` and `ainvoke`.
+        _semaphore (asyncio.Semaphore): Bounds the number of sentences processed concurrently by the async pipeline.
 
     Methods:
-        index_papers(titles, abstracts):
-            Indexes a list of papers and their text embeddings in the vector store.
+        warmup():
+            Loads every model and connects to Elasticsearch ahead of the first request.
+
+        index_papers(titles, abstracts, external_ids, metadata):
+            Indexes a list of papers, their metadata and their text embeddings in the vector store.
 
-        check_paper(path):
+        check_paper(path, filters):
             Analyzes a paper to identify sentences that likely contain missing citations
-            and retrieves relevant papers for those sentences.
+            and retrieves relevant papers for those sentences, optionally restricted by a `PaperFilter`.
+
+        iter_check_paper(path, filters):
+            Version of `check_paper` yielding the results of each batch of sentences while the paper is still read.
+
+        acheck_paper(path, filters):
+            Asynchronous version of `check_paper` that processes the citing sentences concurrently.
+
+        acheck_papers(paths, filters):
+            Checks several papers concurrently.
+
+        aclose():
+            Closes the connections used by the async pipeline.
 
         classify_sentences(sentences):
             Classifies a list of sentences to determine if they contain citations.
@@ -68,95 +230,638 @@ class MissingCitationRetriever:
         _retrieve(state):
             Retrieves papers relevant to the given sentence through a similarity search.
 
+        _retrieve_many(sentences, filters):
+            Retrieves papers relevant to each of the given sentences using batched requests.
+
+        _aretrieve(state), _aretrieve_many(sentences):
+            Asynchronous versions of `_retrieve` and `_retrieve_many`.
+
         _reorder(state):
             Reorders retrieved papers based on the relevance to the given sentence using
-            a language model reranker.
+            the reranker.
+
+        _areorder(state):
+            Asynchronous version of `_reorder` that retries with exponential backoff when the LLM is rate limited.
     """
 
     class State(TypedDict):
         sentence: str
-        retrieved: List[Document]
+        filters: Optional[PaperFilter]
+        retrieved: list
         reordered: List[str]
 
-    def __init__(self, url='http://localhost:9200', citing_sentence_classifier_path=None):
-        if not os.getenv('OPENAI_API_KEY'):
+    def __init__(self, url='http://localhost:9200', citing_sentence_classifier_path=None,
+                 retrieval_batch_size=64, sentence_batch_size=256, rerank_concurrency=8,
+                 max_concurrency=16, max_retries=5, retry_base_delay=1.0,
+                 reranker='llm', quantize_reranker=False, embedding_cache_dir=None,
+                 pdf_jobs=1, pdf_cache_dir=None, section_kinds=(SectionKind.BODY,),
+                 classifier_backend='torch', quantize_classifier=False, share_models=False,
+                 knn_profile: str | KnnProfile = 'balanced', vector_store_path=None, nprobe=32,
+                 retrieval_mode='dense', rerank_candidates=None, result_cache_dir=None,
+                 result_cache_ttl=7 * 24 * 3600, result_cache_max_entries=1_000_000, generation_check_interval=5.0,
+                 manifest_dir=None, metrics: Metrics = None):
+        if reranker == 'llm' and not os.getenv('OPENAI_API_KEY'):
             raise ValueError("OPENAI_API_KEY is not set.")
+        if isinstance(reranker, str) and reranker not in ('llm', 'cross-encoder'):
+            raise ValueError(f"Unknown reranker: {reranker}")
+        if retrieval_mode not in ('dense', 'hybrid'):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        if retrieval_mode == 'hybrid' and vector_store_path:
+            raise ValueError("Hybrid retrieval needs the BM25 search of Elasticsearch, not a local vector store.")
 
         logging.basicConfig(level=logging.INFO)
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
-        model_kwargs = {'device': device}
-        encode_kwargs = {'normalize_embeddings': True}
-        self._embeddings = HuggingFaceEmbeddings(model_name='intfloat/multilingual-e5-large-instruct',
-                                                 model_kwargs=model_kwargs,
-                                                 encode_kwargs=encode_kwargs)
-        logging.info(f"Loaded embedding model {self._embeddings.model_name} on device {device}")
+        self._url = url
+        self._QUERY = QUERY_INSTRUCTION
+        self._models = _SHARED_MODELS if share_models else _ModelPool()
+        self._embedding_model_name = 'intfloat/multilingual-e5-large-instruct'
+        self._embedding_cache_dir = embedding_cache_dir
+        self._classifier_path = citing_sentence_classifier_path
+        self._classifier_backend = classifier_backend
+        self._quantize_classifier = quantize_classifier
+        self._reranker_kind = reranker if isinstance(reranker, str) else None
+        self._reranker_instance = None if isinstance(reranker, str) else reranker
+        self._quantize_reranker = quantize_reranker
+        self._es_client = None
+        self._async_es_client = None
+        self._compiled_graph = None
+        self._lock = threading.Lock()
+
+        self._knn_profile = get_knn_profile(knn_profile)
+        self._vector_store_path = vector_store_path
+        self._nprobe = nprobe
+        self._retrieval_mode = retrieval_mode
+        self._rerank_candidates = rerank_candidates or (10 if retrieval_mode == 'hybrid' else None)
+        logging.info(f"Using kNN profile {self._knn_profile}")
 
-        self._QUERY = "Given a sentence where a paper is cited, find the abstract of the paper it cites."
-        self._vector_store = ElasticsearchStore('paper_embeddings',
-                                                embedding=self._embeddings,
-                                                es_url=url)
-        self._es = Elasticsearch(url)
-        if not self._es.ping():
-            raise ConnectionError("Elasticsearch instance not reachable.")
+        self._result_cache_dir = result_cache_dir
+        self._result_cache_ttl = result_cache_ttl
+        self._result_cache_max_entries = result_cache_max_entries
+        self._generation_check_interval = generation_check_interval
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self._manifest_dir = Path(manifest_dir) if manifest_dir else None
+        self._metrics = metrics or NULL_METRICS
 
-        self._text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=100, add_start_index=True)
+        self._pdf_jobs = pdf_jobs
+        self._pdf_cache_dir = pdf_cache_dir
+        self._section_kinds = set(section_kinds)
+        self._retrieval_batch_size = retrieval_batch_size
+        self._sentence_batch_size = sentence_batch_size
+        self._rerank_concurrency = rerank_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_retries = max_retries
+        self._retry_base_delay = retry_base_delay
 
-        self._citing_sentence_classifier = pipeline('text-classification',
-                                                    model=citing_sentence_classifier_path,
-                                                    device=device)
-        self._citing_sentence_classifier.model.config.id2label = {0: False, 1: True}
+    @property
+    def _embeddings(self):
+        def load():
+            from langchain_huggingface import HuggingFaceEmbeddings
 
-        self._reranker = RankLLMRerank(top_n=5, model='gpt', gpt_model='gpt-4o-mini')
+            device = _default_device()
+            embeddings = HuggingFaceEmbeddings(model_name=self._embedding_model_name,
+                                               model_kwargs={'device': device},
+                                               encode_kwargs={'normalize_embeddings': True})
+            logging.info(f"Loaded embedding model {embeddings.model_name} on device {device}")
+            return embeddings
 
-        graph_builder = StateGraph(self.State).add_sequence([self._retrieve, self._reorder])
-        graph_builder.add_edge(START, "_retrieve")
-        self._graph = graph_builder.compile()
+        embeddings = self._models.get(('embeddings', self._embedding_model_name), load)
+        if not self._embedding_cache_dir:
+            return embeddings
 
-    def index_papers(self, titles: list[str], abstracts: list[str]):
+        def load_cached():
+            from database.embedding_cache import CachedEmbeddings
+
+            return CachedEmbeddings(embeddings, self._embedding_cache_dir)
+
+        return self._models.get(('cached_embeddings', self._embedding_model_name, self._embedding_cache_dir),
+                                load_cached)
+
+    @property
+    def _citing_sentence_classifier(self):
+        def load():
+            from missing_citation_retriever.citing_sentence_classifier import load_citing_sentence_classifier
+
+            return load_citing_sentence_classifier(self._classifier_path,
+                                                   backend=self._classifier_backend,
+                                                   quantize=self._quantize_classifier,
+                                                   device=_default_device())
+
+        return self._models.get(('classifier', self._classifier_path, self._classifier_backend,
+                                 self._quantize_classifier), load)
+
+    @property
+    def _reranker(self):
+        if self._reranker_instance is not None:
+            return self._reranker_instance
+
+        def load():
+            if self._reranker_kind == 'llm':
+                from langchain_community.document_compressors import RankLLMRerank
+
+                return RankLLMRerank(top_n=5, model='gpt', gpt_model='gpt-4o-mini')
+
+            from missing_citation_retriever.cross_encoder_reranker import CrossEncoderReranker
+
+            return CrossEncoderReranker(top_n=5, device=_default_device(), quantize=self._quantize_reranker)
+
+        return self._models.get(('reranker', self._reranker_kind, self._quantize_reranker), load)
+
+    @property
+    def _text_splitter(self):
+        from database.vector_database import paper_text_splitter
+
+        return self._models.get('text_splitter', paper_text_splitter)
+
+    @property
+    def _vector_store(self):
+        def load():
+            from langchain_elasticsearch import ElasticsearchStore
+
+            return ElasticsearchStore('paper_embeddings', embedding=self._embeddings, es_url=self._url)
+
+        return self._models.get(('vector_store', self._url, id(self._embeddings)), load)
+
+    @property
+    def _local_vector_store(self):
+        def load():
+            from database.numpy_vector_store import NumpyVectorStore
+
+            return NumpyVectorStore(self._vector_store_path, nprobe=self._nprobe)
+
+        return self._models.get(('local_vector_store', self._vector_store_path, self._nprobe), load)
+
+    @property
+    def _result_cache(self):
+        def load():
+            from database.result_cache import ResultCache
+
+            return ResultCache(Path(self._result_cache_dir) / 'results.sqlite', ttl=self._result_cache_ttl,
+                               max_entries=self._result_cache_max_entries)
+
+        return self._models.get(('result_cache', self._result_cache_dir), load)
+
+    @property
+    def _es(self):
+        if self._es_client is None:
+            with self._lock:
+                if self._es_client is None:
+                    from elasticsearch import Elasticsearch
+
+                    es = Elasticsearch(self._url)
+                    if not es.ping():
+                        raise ConnectionError("Elasticsearch instance not reachable.")
+                    self._es_client = es
+        return self._es_client
+
+    @property
+    def _async_es(self):
+        # Created on first use so that it binds to the event loop running the async pipeline
+        if self._async_es_client is None:
+            from elasticsearch import AsyncElasticsearch
+
+            self._async_es_client = AsyncElasticsearch(self._url)
+        return self._async_es_client
+
+    @property
+    def _graph(self):
+        if self._compiled_graph is None:
+            with self._lock:
+                if self._compiled_graph is None:
+                    from langchain_core.runnables import RunnableLambda
+                    from langgraph.graph import START, StateGraph
+
+                    graph_builder = StateGraph(self.State).add_sequence([
+                        ('_retrieve', RunnableLambda(self._retrieve, afunc=self._aretrieve)),
+                        ('_reorder', RunnableLambda(self._reorder, afunc=self._areorder)),
+                    ])
+                    graph_builder.add_edge(START, "_retrieve")
+                    self._compiled_graph = graph_builder.compile()
+        return self._compiled_graph
+
+    def warmup(self):
+        """
+        Loads every model, connects to Elasticsearch and prepares the sentence tokenizer, so that the first request
+        does not pay for it.
+
+        Raises:
+            ConnectionError: If Elasticsearch is not reachable.
+        """
+        from paper_text_extractor.sentence_splitter import punkt_tokenizer
+
+        # Accessing the lazy attributes creates them
+        for attribute in ('_local_vector_store' if self._vector_store_path else '_es', '_reranker', '_graph'):
+            getattr(self, attribute)
+
+        self._embeddings.embed_documents([_format_query_instruction(self._QUERY, 'warmup')])
+        self._citing_sentence_classifier(['This sentence only warms up the classifier model.'])
+        punkt_tokenizer()
+
+    def index_papers(self, titles: list[str], abstracts: list[str], external_ids: list[str] = None,
+                     metadata: list[dict] = None) -> int:
         """
         Indexes a list of papers and their text embeddings in the vector store.
 
+        Papers get deterministic IDs from `paper_id`, and papers that are already indexed or repeated in the list are
+        skipped, so indexing the same papers again leaves the indices unchanged.
+
+        The metadata of each paper is stored with the paper and copied to each of its chunks, so that `check_paper`
+        can restrict the kNN search to matching papers with a `PaperFilter`. Papers that are already indexed get the
+        given metadata fields set in place, so metadata can be added to an existing corpus by indexing it again.
+
         Args:
             titles (list[str]): A list of paper titles.
             abstracts (list[str]): A list of paper abstracts.
+            external_ids (list[str]): Optional external IDs of the papers, such as DOIs, used as their document IDs.
+            metadata (list[dict]): Optional metadata of each paper, with a 'year', a 'venue', a list of
+                'fields_of_study' and a dictionary of 'external_ids', any of which may be missing.
         Returns:
-            None
+            int: The number of papers added.
         """
-        ids = self._insert_documents_in_index([{'title': title, 'abstract': abstract}
-                                               for title, abstract in zip(titles, abstracts)],
-                                              'papers')
+        from database.vector_database import existing_ids, paper_id, update_paper_metadata
+        from langchain_core.documents import Document
+
+        papers = {}
+        for i, (title, abstract) in enumerate(zip(titles, abstracts)):
+            external_id = external_ids[i] if external_ids else None
+            # The external ID is stored with the paper, so that `database.maintenance` can tell its ID again
+            papers.setdefault(paper_id(title, abstract, external_id),
+                              {'title': title, 'abstract': abstract,
+                               **({'external_id': str(external_id)} if external_id else {}),
+                               **paper_metadata(metadata[i] if metadata else {})})
+
+        existing = {id_: paper_metadata(papers.pop(id_)) for id_ in existing_ids(self._es, list(papers), 'papers')}
+        # Papers indexed before their metadata was known get it now, without being embedded again
+        updated = update_paper_metadata(self._es, existing, 'papers', 'paper_embeddings') if metadata else 0
+        if updated:
+            logging.info(f"Updated the metadata of {updated} indexed papers")
 
-        docs: [Document] = [Document(page_content="\n\n".join([title, abstract]),
-                                     metadata={'id': id_})
-                            for title, abstract, id_ in zip(titles, abstracts, ids)]
+        docs: ['Document'] = [Document(page_content="\n\n".join([paper['title'], paper['abstract']]),
+                                     metadata={'id': id_, **paper_metadata(paper)})
+                            for id_, paper in papers.items()]
 
         split_docs = self._text_splitter.split_documents(docs)
+        if not split_docs:
+            if updated:
+                self._bump_generation()
+            return 0
 
-        self._vector_store.add_documents(split_docs)
+        # Embed here rather than in the vector store, so that the chunks index can be created with the mapping of the
+        # kNN profile before the first chunk is added
+        texts = [doc.page_content for doc in split_docs]
+        vectors = self._embeddings.embed_documents(texts)
+        if not self._es.indices.exists(index='paper_embeddings'):
+            self._es.indices.create(index='paper_embeddings', mappings=chunk_index_mappings(len(vectors[0]),
+                                                                                            self._knn_profile))
+        if not self._es.indices.exists(index='papers'):
+            self._es.indices.create(index='papers', mappings={'properties': {
+                'title': {'type': 'text'},
+                'abstract': {'type': 'text'},
+                'external_id': {'type': 'keyword'},
+                **METADATA_PROPERTIES,
+            }})
 
-    def check_paper(self, path: Path):
+        # Chunk IDs are numbered per paper like in `database.ingest`, so writing a paper again overwrites its chunks
+        chunk_ids, chunk_numbers = [], {}
+        for doc in split_docs:
+            chunk_numbers[doc.metadata['id']] = chunk_numbers.get(doc.metadata['id'], -1) + 1
+            chunk_ids.append(f"{doc.metadata['id']}-{chunk_numbers[doc.metadata['id']]}")
+
+        self._vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=[doc.metadata for doc in split_docs],
+                                          ids=chunk_ids)
+        # Papers are written after their chunks, so that a paper only counts as indexed once its chunks are
+        self._insert_documents_in_index(list(papers.values()), 'papers', list(papers))
+
+        self._bump_generation()
+
+        return len(papers)
+
+    def _bump_generation(self) -> None:
+        """
+        Invalidates the results cached against the previous papers.
+        """
+        from database.result_cache import bump_index_generation
+
+        self._generation = bump_index_generation(self._es, 'papers')
+        self._generation_checked_at = time.monotonic()
+
+    def check_paper(self, path: Path, filters: Optional[PaperFilter] = None):
         """
         Analyzes a paper to identify sentences that likely contain missing citations and retrieves relevant papers for
         those sentences.
 
         Args:
             path (Path): The file path to the paper to be analyzed.
+            filters (PaperFilter): Optional restrictions on the retrieved papers, applied as pre-filters of the kNN
+                search, e.g. `PaperFilter(max_year=...)` with the year of the checked paper. Papers indexed without the
+                filtered metadata are never retrieved.
+
+        Returns:
+            List[dict]: A list of dictionaries where each dictionary contains a sentence and recommended papers.
+        """
+        self._check_filters(filters)
+        with self._metrics.span('check_paper'):
+            if self._manifest_dir:
+                return self._check_paper_incrementally(path, filters)
+
+            return list(self.iter_check_paper(path, filters))
+
+    def _check_filters(self, filters: Optional[PaperFilter]) -> None:
+        if filters and self._vector_store_path:
+            raise ValueError("Filtering papers needs the metadata indexed in Elasticsearch, not a local vector store.")
+
+    def iter_check_paper(self, path: Path, filters: Optional[PaperFilter] = None) -> Iterator[dict]:
+        """
+        Checks a paper while it is read: pages are extracted and split into sentences one at a time, and as soon as
+        `sentence_batch_size` sentences are read, they are classified and the papers of the citing ones are retrieved
+        and reranked. The first results are yielded before the whole paper is extracted, and memory stays bounded
+        however long the paper is.
+
+        Papers are always checked from scratch, without the manifest of incremental checks.
+
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+            filters (PaperFilter): Optional restrictions on the retrieved papers, see `check_paper`.
+
+        Yields:
+            dict: A dictionary mapping a citing sentence to its recommended papers, in reading order.
+        """
+        self._check_filters(filters)
+        for citing_sentences in self._iter_citing_sentences(path):
+            for sentence, titles in zip(citing_sentences, self._retrieve_and_rerank(citing_sentences, filters)):
+                yield {sentence: titles}
+
+    def _retrieve_and_rerank(self, citing_sentences: List[str],
+                             filters: Optional[PaperFilter] = None) -> List[List[str]]:
+        """
+        Retrieves and reranks papers for each citing sentence.
+
+        Args:
+            citing_sentences (List[str]): The citing sentences.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            List[List[str]]: The titles of the recommended papers for each sentence.
+        """
+        if not citing_sentences:
+            return []
+
+        # Embed and search in batches instead of going through the graph one sentence at a time
+        retrieved = []
+        for i in range(0, len(citing_sentences), self._retrieval_batch_size):
+            retrieved.extend(self._retrieve_many(citing_sentences[i:i + self._retrieval_batch_size], filters))
+
+        # Reranking is bound by the LLM round trip, so run several requests at once
+        with ThreadPoolExecutor(max_workers=self._rerank_concurrency) as executor:
+            return list(executor.map(lambda sentence, docs: self._reorder({'sentence': sentence, 'filters': filters,
+                                                                            'retrieved': docs})['reordered'],
+                                     citing_sentences, retrieved))
+
+    def _check_paper_incrementally(self, path: Path, filters: Optional[PaperFilter] = None) -> List[dict]:
+        """
+        Checks a paper, reusing the results stored in its manifest for the sentences that did not change since the
+        last check and updating the manifest.
+
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            List[dict]: A list of dictionaries where each dictionary contains a sentence and recommended papers.
+        """
+        sentences = self._candidate_sentences(path)
+        entries, to_classify, configs = self._reusable_entries(path, sentences, filters)
+
+        self._add_classifications(entries, to_classify, self.classify_sentences(to_classify))
+        to_retrieve = self._sentences_to_retrieve(sentences, entries)
+        for sentence, titles in zip(to_retrieve, self._retrieve_and_rerank(to_retrieve, filters)):
+            entries[_sentence_hash(sentence)]['reordered'] = titles
+
+        return self._save_manifest(path, sentences, entries, configs)
+
+    async def acheck_paper(self, path: Path, filters: Optional[PaperFilter] = None):
+        """
+        Asynchronous version of `check_paper`.
+
+        Every citing sentence goes through the graph with `ainvoke`, with at most `max_concurrency` sentences in flight
+        across all concurrent calls on this instance. Cancelling the returned coroutine cancels all pending retrievals
+        and reranker calls; text extraction and classification run in a worker thread and finish before cancellation
+        takes effect.
+
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+            filters (PaperFilter): Optional restrictions on the retrieved papers, see `check_paper`.
 
         Returns:
             List[dict]: A list of dictionaries where each dictionary contains a sentence and recommended papers.
         """
-        raw_text = get_paper_text(path, remove_references=True, remove_abstract=True)
+        self._check_filters(filters)
+        with self._metrics.span('check_paper'):
+            if self._manifest_dir:
+                return await self._acheck_paper_incrementally(path, filters)
 
-        sentences = sent_tokenize(raw_text)
-        sentences = list(filter(lambda sentence: not _contains_reference(sentence), sentences))
-        sentences = [sentence.replace('-\n', '') for sentence in sentences]
+            citing_sentences = await asyncio.to_thread(self._find_citing_sentences, path)
+
+            responses = await _gather_or_cancel(self._ainvoke_bounded(sentence, filters)
+                                                for sentence in citing_sentences)
+
+            return [{r['sentence']: r['reordered']} for r in responses]
+
+    async def _acheck_paper_incrementally(self, path: Path, filters: Optional[PaperFilter] = None) -> List[dict]:
+        """
+        Asynchronous version of `_check_paper_incrementally`.
+        """
+        sentences = await asyncio.to_thread(self._candidate_sentences, path)
+        entries, to_classify, configs = await asyncio.to_thread(self._reusable_entries, path, sentences, filters)
+
+        outputs = await asyncio.to_thread(self.classify_sentences, to_classify)
+        self._add_classifications(entries, to_classify, outputs)
+        to_retrieve = self._sentences_to_retrieve(sentences, entries)
+        responses = await _gather_or_cancel(self._ainvoke_bounded(sentence, filters) for sentence in to_retrieve)
+        for sentence, response in zip(to_retrieve, responses):
+            entries[_sentence_hash(sentence)]['reordered'] = response['reordered']
+
+        return await asyncio.to_thread(self._save_manifest, path, sentences, entries, configs)
+
+    async def acheck_papers(self, paths: List[Path], filters: Optional[PaperFilter] = None) -> List[List[dict]]:
+        """
+        Checks several papers concurrently, sharing the concurrency limit of this instance.
+
+        Args:
+            paths (List[Path]): The file paths to the papers to be analyzed.
+            filters (PaperFilter): Optional restrictions on the papers retrieved for every paper.
+
+        Returns:
+            List[List[dict]]: The results of `acheck_paper` for each paper, in the same order as the paths.
+        """
+        return await _gather_or_cancel(self.acheck_paper(path, filters) for path in paths)
+
+    async def aclose(self):
+        """
+        Closes the connections used by the async pipeline.
+        """
+        if self._async_es_client is not None:
+            await self._async_es_client.close()
+            self._async_es_client = None
+
+    def _find_citing_sentences(self, path: Path) -> List[str]:
+        """
+        Extracts the sentences of a paper that lack a citation marker but are classified as citing sentences.
+
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+
+        Returns:
+            List[str]: The citing sentences.
+        """
+        return [sentence for batch in self._iter_citing_sentences(path) for sentence in batch]
+
+    def _iter_citing_sentences(self, path: Path) -> Iterator[List[str]]:
+        """
+        Classifies the sentences of a paper in batches of `sentence_batch_size` while the paper is read.
+
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+
+        Yields:
+            List[str]: The citing sentences of each batch.
+        """
+        batch = []
+        for sentence in self._iter_candidate_sentences(path):
+            batch.append(sentence.text)
+            if len(batch) == self._sentence_batch_size:
+                yield self._citing(batch)
+                batch = []
+
+        if batch:
+            yield self._citing(batch)
+
+    def _citing(self, sentences: List[str]) -> List[str]:
         model_output = self.classify_sentences(sentences)
         citing_sentences = [sentence for sentence, output in zip(sentences, model_output) if output['label']]
+        self._metrics.count('citing_sentences', len(citing_sentences))
+
+        return citing_sentences
+
+    def _candidate_sentences(self, path: Path) -> List[str]:
+        """
+        Extracts the sentences of the checked sections of a paper that lack a citation marker.
 
-        responses = [self._graph.invoke({'sentence': sentence}) for sentence in citing_sentences]
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+
+        Returns:
+            List[str]: The sentences to classify.
+        """
+        return [sentence.text for sentence in self._iter_candidate_sentences(path)]
+
+    def _iter_candidate_sentences(self, path: Path) -> Iterator['Sentence']:
+        """
+        Extracts the sentences of the checked sections of a paper that lack a citation marker, page by page.
 
-        return [{r['sentence']: r['reordered']} for r in responses]
+        Words hyphenated across lines are joined before splitting sentences, and sentences never run across a
+        heading.
+
+        Args:
+            path (Path): The file path to the paper to be analyzed.
+
+        Yields:
+            Sentence: The sentences to classify, with the page and offset where they start.
+        """
+        from paper_text_extractor.paper_text_extractor import iter_pages
+        from paper_text_extractor.section_segmenter import iter_section_parts
+        from paper_text_extractor.sentence_splitter import SentenceSplitter
+
+        pages = iter_pages(path, jobs=self._pdf_jobs, cache_dir=self._pdf_cache_dir)
+        parts = timed(self._metrics, 'extract', iter_section_parts(pages))
+        splitter = SentenceSplitter()
+
+        for part in itertools.chain((part for part in parts if part.kind in self._section_kinds), [None]):
+            with self._metrics.span('tokenize'):
+                sentences = splitter.feed(part) if part else splitter.flush()
+
+            candidates = [sentence for sentence in sentences if not contains_citation_marker(sentence.text)]
+            self._metrics.count('sentences_extracted', len(sentences))
+            self._metrics.count('sentences_filtered', len(sentences) - len(candidates))
+            yield from candidates
+
+    def _manifest_path(self, path: Path) -> Path:
+        # Manifests are keyed by the location of the paper, since its content is what changes between checks
+        return self._manifest_dir / f"{hashlib.sha1(str(Path(path).resolve()).encode('utf-8')).hexdigest()}.json"
+
+    def _manifest_configs(self, filters: Optional[PaperFilter] = None) -> dict:
+        """
+        Returns fingerprints of the configurations the classification and retrieval results of a manifest depend on.
+        """
+        from database.result_cache import ResultCache
+
+        return {
+            'classification': ResultCache.key(self._classifier_path, self._classifier_backend,
+                                              self._quantize_classifier).hex(),
+            'retrieval': ResultCache.key(self._embedding_model_name, self._index_generation(),
+                                         self._vector_store_path or self._url, self._nprobe, self._knn_profile,
+                                         self._retrieval_mode, self._rerank_candidates,
+                                         self._reranker_config(), self._filters_key(filters)).hex(),
+        }
+
+    def _reusable_entries(self, path: Path, sentences: List[str],
+                          filters: Optional[PaperFilter] = None) -> tuple[dict, List[str], dict]:
+        """
+        Loads the manifest entries of a paper that are still valid for its current sentences.
+
+        Classification results are dropped when the classifier changed, and retrieval results when the retrieval
+        configuration, the filters, the reranker or the indexed papers changed.
+
+        Returns:
+            tuple[dict, List[str], dict]: The reusable entries by sentence hash, the sentences that must be classified
+                and the configurations the manifest is saved with.
+        """
+        manifest_path = self._manifest_path(path)
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {'configs': {}, 'sentences': {}}
+        configs = self._manifest_configs(filters)
+
+        entries = {}
+        if manifest['configs'].get('classification') == configs['classification']:
+            keep_retrieval = manifest['configs'].get('retrieval') == configs['retrieval']
+            for sentence in sentences:
+                entry = manifest['sentences'].get(_sentence_hash(sentence))
+                if entry is not None:
+                    entries[_sentence_hash(sentence)] = entry if keep_retrieval else {'citing': entry['citing']}
+
+        to_classify = list(dict.fromkeys(sentence for sentence in sentences if _sentence_hash(sentence) not in entries))
+        logging.info(f"Reusing the results of {len(sentences) - len(to_classify)} of {len(sentences)} sentences "
+                     f"from the manifest of {path}")
+
+        return entries, to_classify, configs
+
+    @staticmethod
+    def _add_classifications(entries: dict, sentences: List[str], outputs: List[dict]) -> None:
+        for sentence, output in zip(sentences, outputs):
+            entries[_sentence_hash(sentence)] = {'citing': bool(output['label'])}
+
+    @staticmethod
+    def _sentences_to_retrieve(sentences: List[str], entries: dict) -> List[str]:
+        return [sentence for sentence in dict.fromkeys(sentences)
+                if entries[_sentence_hash(sentence)]['citing'] and 'reordered' not in entries[_sentence_hash(sentence)]]
+
+    def _save_manifest(self, path: Path, sentences: List[str], entries: dict, configs: dict) -> List[dict]:
+        """
+        Writes the manifest of a paper, keeping only the entries of its current sentences, and returns the results of
+        its citing sentences.
+        """
+        self._manifest_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = self._manifest_path(path)
+        # Write to a temporary file first so that a crash never leaves a truncated manifest
+        tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+        tmp_path.write_text(json.dumps({'path': str(path), 'configs': configs, 'sentences': entries}))
+        os.replace(tmp_path, manifest_path)
+
+        return [{sentence: entries[_sentence_hash(sentence)]['reordered']} for sentence in sentences
+                if entries[_sentence_hash(sentence)]['citing']]
+
+    async def _ainvoke_bounded(self, sentence: str, filters: Optional[PaperFilter] = None) -> dict:
+        async with self._semaphore:
+            return await self._graph.ainvoke({'sentence': sentence, 'filters': filters})
 
     def classify_sentences(self, sentences: List[str]) -> List[dict]:
         """
@@ -174,31 +879,136 @@ class MissingCitationRetriever:
         if not sentences:
             return []
 
-        batch_size = 16
-        results = []
-        for i in range(0, len(sentences), batch_size):
-            results.extend(self._citing_sentence_classifier(sentences[i:i + batch_size]))
+        def classify(uncached: List[str]) -> List[dict]:
+            with self._metrics.span('classify'):
+                self._metrics.count('sentences_classified', len(uncached))
+                return self._citing_sentence_classifier(uncached)
+
+        return self._cached('classify', sentences, classify)
+
+    def _index_generation(self):
+        """
+        Returns the version of the indexed papers that cached retrieval and rerank results depend on.
+        """
+        if self._vector_store_path:
+            return os.stat(Path(self._vector_store_path) / 'meta.json').st_mtime_ns
+
+        now = time.monotonic()
+        if self._generation is None or now - self._generation_checked_at >= self._generation_check_interval:
+            from database.result_cache import index_generation
+
+            self._generation = index_generation(self._es, 'papers')
+            self._generation_checked_at = now
+
+        return self._generation
+
+    def _reranker_config(self) -> list:
+        if self._reranker_kind == 'llm':
+            return ['llm', 'gpt-4o-mini', 5]
+        if self._reranker_kind == 'cross-encoder':
+            return ['cross-encoder', self._quantize_reranker]
+        return [type(self._reranker_instance).__qualname__]
+
+    @staticmethod
+    def _filters_key(filters: Optional[PaperFilter]) -> Optional[list]:
+        return filters.cache_key() if filters else None
+
+    def _result_key(self, kind: str, sentence: str, filters: Optional[PaperFilter] = None) -> bytes:
+        """
+        Computes the key of a cached result from the sentence and the configuration the result depends on.
+        """
+        from database.result_cache import ResultCache, normalize_sentence
+
+        parts = [kind, normalize_sentence(sentence)]
+        if kind == 'classify':
+            parts += [self._classifier_path, self._classifier_backend, self._quantize_classifier]
+        else:
+            parts += [self._embedding_model_name, self._index_generation(), self._vector_store_path or self._url,
+                      self._nprobe, self._knn_profile, self._retrieval_mode, self._rerank_candidates]
+            # Results retrieved without filters keep the keys they had before filters existed
+            if filters:
+                parts.append(self._filters_key(filters))
+            if kind == 'rerank':
+                parts.append(self._reranker_config())
+
+        return ResultCache.key(*parts)
+
+    def _cached(self, kind: str, sentences: List[str], compute: Callable[[List[str]], list],
+                to_cache: Callable = lambda result: result, from_cache: Callable = lambda cached: cached,
+                filters: Optional[PaperFilter] = None) -> list:
+        """
+        Looks up the results of several sentences in the result cache and computes only the missing ones.
+
+        Args:
+            kind (str): The kind of results, 'classify', 'retrieve' or 'rerank'.
+            sentences (List[str]): The sentences.
+            compute (Callable[[List[str]], list]): Computes the results of a list of sentences.
+            to_cache (Callable): Turns a result into a JSON-serializable value.
+            from_cache (Callable): Turns a cached value back into a result.
+            filters (PaperFilter): The filters the retrieved papers were restricted by.
+
+        Returns:
+            list: The result of each sentence.
+        """
+        if not self._result_cache_dir:
+            return compute(sentences)
+
+        keys, results, missing = self._lookup_cached(kind, sentences, from_cache, filters)
+        if missing:
+            computed = compute([sentences[i] for i in missing])
+            self._store_cached(keys, results, missing, computed, to_cache)
+
+        return results
+
+    async def _acached(self, kind: str, sentences: List[str], compute: Callable, to_cache: Callable = lambda r: r,
+                       from_cache: Callable = lambda c: c, filters: Optional[PaperFilter] = None) -> list:
+        """
+        Asynchronous version of `_cached`, taking a coroutine function to compute the missing results.
+        """
+        if not self._result_cache_dir:
+            return await compute(sentences)
+
+        keys, results, missing = await asyncio.to_thread(self._lookup_cached, kind, sentences, from_cache, filters)
+        if missing:
+            computed = await compute([sentences[i] for i in missing])
+            await asyncio.to_thread(self._store_cached, keys, results, missing, computed, to_cache)
+
         return results
 
-    def _insert_documents_in_index(self, documents: list[dict], index_name: str) -> [str]:
+    def _lookup_cached(self, kind: str, sentences: List[str], from_cache: Callable,
+                       filters: Optional[PaperFilter] = None):
+        keys = [self._result_key(kind, sentence, filters) for sentence in sentences]
+        results = [None if cached is None else from_cache(cached) for cached in self._result_cache.get_many(keys)]
+
+        return keys, results, [i for i, result in enumerate(results) if result is None]
+
+    def _store_cached(self, keys: List[bytes], results: list, missing: List[int], computed: list,
+                      to_cache: Callable) -> None:
+        self._result_cache.put_many([(keys[i], to_cache(result)) for i, result in zip(missing, computed)])
+        for i, result in zip(missing, computed):
+            results[i] = result
+
+    def _insert_documents_in_index(self, documents: list[dict], index_name: str, ids: list[str]) -> [str]:
         """
-        Inserts a list of documents into a specified Elasticsearch index.
+        Inserts a list of documents into a specified Elasticsearch index, replacing the documents with the same IDs.
 
         Used to store clear paper text that chunks can point back to.
 
         Args:
             documents (list[dict]): A list of dictionaries containing the documents to be indexed.
             index_name (str): The name of the Elasticsearch index where the documents should be stored.
+            ids (list[str]): The IDs of the documents.
 
         Returns:
             list[str]: IDs of the inserted documents
         """
         operations = []
 
-        for document in documents:
+        for document, id_ in zip(documents, ids):
             operations.append({
                 'index': {
-                    '_index': index_name
+                    '_index': index_name,
+                    '_id': id_,
                 }
             })
 
@@ -218,23 +1028,288 @@ class MissingCitationRetriever:
         Returns:
             dict: The updated state of the system.
         """
-        instruction = _format_query_instruction(self._QUERY, state['sentence'])
-        retrieved_snippets = self._vector_store.similarity_search(instruction,
-                                                                  k=50,
-                                                                  fetch_k=10000)
+        return {'retrieved': self._retrieve_many([state['sentence']], state.get('filters'))[0]}
+
+    def _retrieve_many(self, sentences: List[str], filters: Optional[PaperFilter] = None) -> List[List['Document']]:
+        """
+        Retrieves papers relevant to each of the given sentences using batched requests, reusing cached results when
+        the result cache is enabled.
+
+        Args:
+            sentences (List[str]): The sentences to retrieve papers for.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            List[List[Document]]: The retrieved papers for each sentence, in the same order as the sentences.
+        """
+        if not sentences:
+            return []
+
+        with self._metrics.span('retrieve'):
+            return self._cached('retrieve', sentences, functools.partial(self._retrieve_many_uncached, filters=filters),
+                                _documents_to_cache, _documents_from_cache, filters)
+
+    def _retrieve_many_uncached(self, sentences: List[str],
+                                filters: Optional[PaperFilter] = None) -> List[List['Document']]:
+        """
+        Retrieves papers relevant to each of the given sentences using batched requests.
+
+        All queries are embedded in a single forward pass, the kNN searches are sent together through `msearch` with
+        their chunks collapsed to distinct papers, and the titles and abstracts are fetched with a single deduplicated
+        `mget`. Filters are applied to the kNN search of the chunks and to the BM25 search of hybrid retrieval.
+
+        Args:
+            sentences (List[str]): The sentences to retrieve papers for.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            List[List[Document]]: The retrieved papers for each sentence, in the same order as the sentences.
+        """
+        if not sentences:
+            return []
+
+        self._metrics.count('sentences_retrieved', len(sentences))
+        with self._metrics.span('embed'):
+            query_vectors = self._embeddings.embed_documents(self._query_instructions(sentences))
+        if self._vector_store_path:
+            return self._retrieve_many_locally(query_vectors)
+
+        with self._metrics.span('search'):
+            self._metrics.count('es_requests')
+            doc_ids_per_sentence = self._parse_search_responses(
+                self._es.msearch(searches=self._searches(sentences, query_vectors, filters)))
+
+        # Retrieve complete documents using the IDs, fetching each paper only once
+        unique_ids = list(dict.fromkeys(doc_id for doc_ids in doc_ids_per_sentence for doc_id in doc_ids))
+        if not unique_ids:
+            return [[] for _ in sentences]
+
+        with self._metrics.span('fetch'):
+            self._metrics.count('es_requests')
+            docs_response = self._es.mget(index='papers', ids=unique_ids, source=['title', 'abstract'])
+
+        return self._build_documents(doc_ids_per_sentence, self._found_papers(docs_response))
+
+    def _retrieve_many_locally(self, query_vectors: List[List[float]]) -> List[List['Document']]:
+        """
+        Retrieves papers relevant to each query vector from the local vector store.
+        """
+        with self._metrics.span('search'):
+            doc_ids_per_sentence = [list(dict.fromkeys(doc_ids))[:_RETRIEVED_PAPERS] for doc_ids in
+                                    self._local_vector_store.search_papers(query_vectors,
+                                                                           _RETRIEVED_PAPERS * _CHUNKS_PER_PAPER)]
+        doc_ids_per_sentence = self._limit_candidates(doc_ids_per_sentence)
+        unique_ids = list(dict.fromkeys(doc_id for doc_ids in doc_ids_per_sentence for doc_id in doc_ids))
+
+        with self._metrics.span('fetch'):
+            papers = self._local_vector_store.get_papers(unique_ids)
+
+        return self._build_documents(doc_ids_per_sentence, papers)
+
+    async def _aretrieve(self, state: State):
+        """
+        Asynchronous version of `_retrieve`.
+
+        Args:
+            state (State): The current state of the system.
+
+        Returns:
+            dict: The updated state of the system.
+        """
+        return {'retrieved': (await self._aretrieve_many([state['sentence']], state.get('filters')))[0]}
+
+    async def _aretrieve_many(self, sentences: List[str],
+                              filters: Optional[PaperFilter] = None) -> List[List['Document']]:
+        """
+        Asynchronous version of `_retrieve_many`.
+
+        Args:
+            sentences (List[str]): The sentences to retrieve papers for.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            List[List[Document]]: The retrieved papers for each sentence, in the same order as the sentences.
+        """
+        if not sentences:
+            return []
+
+        with self._metrics.span('retrieve'):
+            return await self._acached('retrieve', sentences,
+                                       functools.partial(self._aretrieve_many_uncached, filters=filters),
+                                       _documents_to_cache, _documents_from_cache, filters)
+
+    async def _aretrieve_many_uncached(self, sentences: List[str],
+                                       filters: Optional[PaperFilter] = None) -> List[List['Document']]:
+        """
+        Asynchronous version of `_retrieve_many_uncached`, using the async Elasticsearch client.
+
+        Args:
+            sentences (List[str]): The sentences to retrieve papers for.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            List[List[Document]]: The retrieved papers for each sentence, in the same order as the sentences.
+        """
+        if not sentences:
+            return []
+
+        self._metrics.count('sentences_retrieved', len(sentences))
+        with self._metrics.span('embed'):
+            query_vectors = await self._embeddings.aembed_documents(self._query_instructions(sentences))
+        if self._vector_store_path:
+            return await asyncio.to_thread(self._retrieve_many_locally, query_vectors)
+
+        with self._metrics.span('search'):
+            self._metrics.count('es_requests')
+            doc_ids_per_sentence = self._parse_search_responses(
+                await self._async_es.msearch(searches=self._searches(sentences, query_vectors, filters)))
+
+        unique_ids = list(dict.fromkeys(doc_id for doc_ids in doc_ids_per_sentence for doc_id in doc_ids))
+        if not unique_ids:
+            return [[] for _ in sentences]
+
+        with self._metrics.span('fetch'):
+            self._metrics.count('es_requests')
+            docs_response = await self._async_es.mget(index='papers', ids=unique_ids, source=['title', 'abstract'])
+
+        return self._build_documents(doc_ids_per_sentence, self._found_papers(docs_response))
+
+    def _query_instructions(self, sentences: List[str]) -> List[str]:
+        return [_format_query_instruction(self._QUERY, sentence) for sentence in sentences]
+
+    def _searches(self, sentences: List[str], query_vectors: List[List[float]],
+                  filters: Optional[PaperFilter] = None) -> List[dict]:
+        """
+        Builds the `msearch` body of the retrieval of every sentence. In hybrid mode, the kNN search of each sentence is
+        followed by a BM25 search over the titles and abstracts of the papers.
+        """
+        knn_searches = self._knn_searches(query_vectors, filters)
+        if self._retrieval_mode == 'dense':
+            return knn_searches
+
+        searches = []
+        for i, sentence in enumerate(sentences):
+            query = {'multi_match': {'query': sentence, 'fields': ['title^2', 'abstract']}}
+            if filters:
+                query = {'bool': {'must': query, 'filter': filters.es_filters(prefix='')}}
+
+            searches.extend(knn_searches[2 * i:2 * i + 2])
+            searches.append({'index': 'papers'})
+            searches.append({
+                'query': query,
+                'size': _RETRIEVED_PAPERS,
+                '_source': False,
+            })
+
+        return searches
+
+    def _parse_search_responses(self, msearch_response) -> List[List[str]]:
+        """
+        Extracts the IDs of the retrieved papers of each sentence from the response to `_searches`, fusing the kNN and
+        BM25 rankings in hybrid mode.
+        """
+        if self._retrieval_mode == 'dense':
+            return self._limit_candidates(self._parse_knn_responses(msearch_response))
+
+        responses = msearch_response['responses']
+        knn_ids = self._parse_knn_responses({'responses': responses[0::2]})
+
+        bm25_ids = []
+        for response in responses[1::2]:
+            if 'error' in response:
+                raise RuntimeError(f"BM25 search failed: {response['error']}")
+
+            bm25_ids.append([hit['_id'] for hit in response['hits']['hits']])
+
+        return self._limit_candidates([_reciprocal_rank_fusion([knn, bm25]) for knn, bm25 in zip(knn_ids, bm25_ids)])
+
+    def _limit_candidates(self, doc_ids_per_sentence: List[List[str]]) -> List[List[str]]:
+        """
+        Keeps the first `rerank_candidates` distinct papers retrieved for each sentence.
+        """
+        if self._rerank_candidates is None:
+            return doc_ids_per_sentence
+
+        return [list(dict.fromkeys(doc_ids))[:self._rerank_candidates] for doc_ids in doc_ids_per_sentence]
+
+    def _knn_searches(self, query_vectors: List[List[float]], filters: Optional[PaperFilter] = None) -> List[dict]:
+        """
+        Builds the `msearch` body running one kNN search over the paper chunks for each query vector, with the
+        settings of the kNN profile.
+
+        The chunks are collapsed on the ID of their paper, so each search returns the best chunk of up to
+        `_RETRIEVED_PAPERS` distinct papers and nothing but the paper ID. Filters are pre-filters on the metadata
+        copied to the chunks, so only the chunks of matching papers are searched.
+        """
+        filter_clauses = filters.es_filters() if filters else None
+        searches = []
+        for query_vector in query_vectors:
+            searches.append({'index': 'paper_embeddings'})
+            searches.append({
+                **self._knn_profile.search_body('vector', query_vector, _RETRIEVED_PAPERS * _CHUNKS_PER_PAPER,
+                                                size=_RETRIEVED_PAPERS, filter=filter_clauses),
+                'collapse': {'field': 'metadata.id'},
+                '_source': False,
+            })
+
+        return searches
+
+    @staticmethod
+    def _parse_knn_responses(msearch_response) -> List[List[str]]:
+        """
+        Extracts the IDs of the papers the retrieved chunks point to from an `msearch` response, read from the
+        collapsed field.
+        """
+        doc_ids_per_sentence = []
+        for response in msearch_response['responses']:
+            if 'error' in response:
+                raise RuntimeError(f"kNN search failed: {response['error']}")
+
+            doc_ids_per_sentence.append([hit['fields']['metadata.id'][0] for hit in response['hits']['hits']])
+
+        return doc_ids_per_sentence
 
-        # Retrieve complete documents using the IDs
-        doc_ids = [snippet.metadata['id'] for snippet in retrieved_snippets]
-        docs_response = self._es.mget(index='papers', body={'ids': doc_ids})
-        docs = [doc['_source'] for doc in docs_response['docs'] if doc['found']]
+    @staticmethod
+    def _found_papers(mget_response) -> dict[str, dict]:
+        return {doc['_id']: doc['_source'] for doc in mget_response['docs'] if doc['found']}
 
-        return {'retrieved': [Document(page_content=doc['title'] + '\n\n' + doc['abstract'],
-                                       metadata={'title': doc['title']})
-                              for doc in docs]}
+    @staticmethod
+    def _build_documents(doc_ids_per_sentence: List[List[str]], docs: dict[str, dict]) -> List[List['Document']]:
+        """
+        Turns the retrieved papers into documents for each sentence, keeping the retrieval order.
+        """
+        from langchain_core.documents import Document
+
+        return [[Document(page_content=docs[doc_id]['title'] + '\n\n' + docs[doc_id]['abstract'],
+                          metadata={'title': docs[doc_id]['title']})
+                 for doc_id in doc_ids if doc_id in docs]
+                for doc_ids in doc_ids_per_sentence]
 
     def _reorder(self, state: State):
         """
-        Reorders retrieved papers based on the relevance to the given sentence using a language model reranker.
+        Reorders retrieved papers based on the relevance to the given sentence using the reranker.
+
+        Args:
+            state (State): The current state of the system.
+
+        Returns:
+            dict: The updated state of the system.
+        """
+        query = _format_query_instruction(self._QUERY, state['sentence'])
+
+        def rerank(_):
+            self._count_reranker_call(state['retrieved'], query)
+            reranked_docs = self._reranker.compress_documents(state['retrieved'], query)
+            return [[doc.metadata['title'] for doc in reranked_docs]]
+
+        with self._metrics.span('rerank'):
+            return {'reordered': self._cached('rerank', [state['sentence']], rerank,
+                                              filters=state.get('filters'))[0]}
+
+    async def _areorder(self, state: State):
+        """
+        Asynchronous version of `_reorder` that retries with exponential backoff and jitter when the LLM is rate
+        limited.
 
         Args:
             state (State): The current state of the system.
@@ -242,7 +1317,43 @@ class MissingCitationRetriever:
         Returns:
             dict: The updated state of the system.
         """
-        reranked_docs = self._reranker.compress_documents(state['retrieved'],
-                                                          _format_query_instruction(self._QUERY, state['sentence']))
+        # Only the LLM reranker needs openai, the cross-encoder never gets rate limited
+        retried = ()
+        if self._reranker_kind == 'llm':
+            from openai import RateLimitError
+
+            retried = (RateLimitError,)
+
+        query = _format_query_instruction(self._QUERY, state['sentence'])
+
+        async def rerank(_):
+            for attempt in range(self._max_retries + 1):
+                try:
+                    self._count_reranker_call(state['retrieved'], query)
+                    reranked_docs = await self._reranker.acompress_documents(state['retrieved'], query)
+                    return [[doc.metadata['title'] for doc in reranked_docs]]
+                except retried:
+                    self._metrics.count('llm_rate_limited')
+                    if attempt == self._max_retries:
+                        raise
+
+                    delay = self._retry_base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                    logging.warning(f"Reranker rate limited, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+        with self._metrics.span('rerank'):
+            return {'reordered': (await self._acached('rerank', [state['sentence']], rerank,
+                                                      filters=state.get('filters')))[0]}
+
+    def _count_reranker_call(self, docs: List['Document'], query: str) -> None:
+        """
+        Counts a reranker call and its documents, and estimates the number of tokens sent when reranking with the LLM.
+        """
+        if not self._metrics.enabled:
+            return
 
-        return {'reordered': [doc.metadata['title'] for doc in reranked_docs]}
+        self._metrics.count('reranker_calls')
+        self._metrics.count('reranker_documents', len(docs))
+        if self._reranker_kind == 'llm':
+            # RankLLM builds its prompt from the query and documents, the few tokens of its template are left out
+            self._metrics.count('llm_input_tokens', _count_tokens([query, *(doc.page_content for doc in docs)]))
@@ -0,0 +1,393 @@
+"""
+HTTP service wrapping `MissingCitationRetriever`, so that every consumer shares one resident set of models.
+
+Classifier and embedding calls coming from concurrent requests are grouped by a `MicroBatcher` into a single forward
+pass, and paper checks go through a bounded job queue: a check is accepted with `202` and polled through its job, and
+new checks are rejected with `503` while the queue is full instead of piling up.
+
+Requires a running Elasticsearch instance such as the one in `docker-compose.yaml`. Run from the repository root:
+
+    python -m missing_citation_retriever.service --classifier-path <path> --reranker cross-encoder
+
+Endpoints:
+    POST /papers/check: Queues a check of the PDF sent as the request body, returns the job ID. The retrieved papers
+        can be restricted with the `min_year`, `max_year`, `venue` and `field_of_study` query parameters, the last two
+        repeatable, e.g. `?max_year=2019` to only recommend papers published by the year of the checked paper.
+    GET /jobs/{job_id}: Returns the status of a job and its result once done.
+    POST /sentences/classify: Classifies a JSON list of sentences as citing or not.
+    GET /health: Returns the number of queued jobs.
+    GET /metrics: Returns the stage timings and counters in the Prometheus text format with `--metrics prometheus`, or
+        as JSON with `--metrics memory`.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from database.paper_metadata import PaperFilter
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from langchain_core.embeddings import Embeddings
+from missing_citation_retriever.instrumentation import PrometheusMetrics, create_metrics
+from missing_citation_retriever.missing_citation_retriever import MissingCitationRetriever
+from pydantic import BaseModel
+from typing import Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Groups calls made from several threads within a short window into one call of a batch function.
+
+    Each caller blocks until the batch holding its items has been processed and gets back only its own results, in
+    order. A batch is sent as soon as it holds `max_batch_size` items or `max_wait` seconds after its first call.
+
+    Args:
+        fn (Callable[[list], list]): The batch function, returning one result per item.
+        max_batch_size (int): The number of items after which a batch is sent without waiting any longer.
+        max_wait (float): The number of seconds the first call of a batch waits for more calls.
+        name (str): The name of the worker thread.
+    """
+
+    def __init__(self, fn: Callable[[list], list], max_batch_size: int = 256, max_wait: float = 0.005,
+                 name: str = 'micro-batcher'):
+        self._fn = fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __call__(self, items: list) -> list:
+        if not items:
+            return []
+
+        future = Future()
+        self._queue.put((list(items), future))
+        return future.result()
+
+    def close(self) -> None:
+        """
+        Stops the worker thread once the calls already queued have been processed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            batch = [request]
+            size = len(request[0])
+            deadline = time.monotonic() + self._max_wait
+            stop = False
+            while size < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: list[tuple[list, Future]]) -> None:
+        try:
+            results = self._fn([item for items, _ in batch for item in items])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for items, future in batch:
+            future.set_result(results[offset:offset + len(items)])
+            offset += len(items)
+
+
+class _BatchedEmbeddings(Embeddings):
+    """
+    Embeddings sending every call through a `MicroBatcher`.
+    """
+
+    def __init__(self, batcher: MicroBatcher):
+        self._batcher = batcher
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._batcher(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._batcher([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._batcher, texts)
+
+
+class BatchingMissingCitationRetriever(MissingCitationRetriever):
+    """
+    A `MissingCitationRetriever` that micro-batches classifier and embedding calls made from concurrent threads.
+
+    Accepts the same arguments as `MissingCitationRetriever`, plus:
+
+    Args:
+        batch_window (float): The number of seconds a classifier or embedding call waits for calls from other
+            threads to join its batch.
+        max_batch_size (int): The number of sentences after which a batch is sent without waiting any longer.
+    """
+
+    def __init__(self, *args, batch_window: float = 0.005, max_batch_size: int = 256, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # The batchers call the models of the parent class, which are still only loaded on first use
+        parent = super(BatchingMissingCitationRetriever, self)
+        self._classifier_batcher = MicroBatcher(lambda sentences: parent._citing_sentence_classifier(sentences),
+                                                max_batch_size, batch_window, name='classifier-batcher')
+        self._embedding_batcher = MicroBatcher(lambda texts: parent._embeddings.embed_documents(texts),
+                                               max_batch_size, batch_window, name='embedding-batcher')
+        self._batched_embeddings = _BatchedEmbeddings(self._embedding_batcher)
+
+    @property
+    def _embeddings(self):
+        return self._batched_embeddings
+
+    @property
+    def _citing_sentence_classifier(self):
+        return self._classifier_batcher
+
+    def close(self) -> None:
+        """
+        Stops the batching threads.
+        """
+        self._classifier_batcher.close()
+        self._embedding_batcher.close()
+
+
+class JobQueue:
+    """
+    Bounded queue of paper checks processed by a fixed number of workers.
+
+    Finished jobs are kept so their results can be fetched, up to `max_finished` of them, dropping the oldest first.
+
+    Args:
+        retriever (MissingCitationRetriever): The retriever checking the papers.
+        max_pending (int): The maximum number of jobs waiting to run, further submissions are rejected.
+        workers (int): The number of papers checked at the same time.
+        max_finished (int): The number of finished jobs kept in memory.
+    """
+
+    def __init__(self, retriever: MissingCitationRetriever, max_pending: int = 32, workers: int = 2,
+                 max_finished: int = 1000):
+        self._retriever = retriever
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._workers = workers
+        self._max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._tasks = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        # Jobs that never ran still own their PDF
+        while not self._queue.empty():
+            os.remove(self._queue.get_nowait()[1])
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, pdf: bytes, filters: Optional[PaperFilter] = None) -> str:
+        """
+        Queues a check of a paper.
+
+        Args:
+            pdf (bytes): The content of the PDF.
+            filters (PaperFilter): Optional restrictions on the retrieved papers.
+
+        Returns:
+            str: The ID of the job.
+
+        Raises:
+            asyncio.QueueFull: If the maximum number of pending jobs is reached.
+        """
+        if self._queue.full():
+            raise asyncio.QueueFull
+
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as file:
+            file.write(pdf)
+
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {'status': 'queued', 'submitted_at': time.time()}
+        self._queue.put_nowait((job_id, file.name, filters))
+
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    async def _work(self) -> None:
+        while True:
+            job_id, path, filters = await self._queue.get()
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            try:
+                job['result'] = await asyncio.to_thread(self._retriever.check_paper, path, filters)
+                job['status'] = 'done'
+            except Exception as e:
+                logging.exception(f"Job {job_id} failed")
+                job['status'] = 'failed'
+                job['error'] = str(e)
+            finally:
+                os.remove(path)
+                job['finished_at'] = time.time()
+                self._forget_finished()
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if 'finished_at' in job]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
+
+
+class SentencesRequest(BaseModel):
+    sentences: List[str]
+
+
+def create_app(retriever: MissingCitationRetriever, max_pending: int = 32, workers: int = 2,
+               warmup: bool = True) -> FastAPI:
+    """
+    Creates the service around a retriever.
+
+    Args:
+        retriever (MissingCitationRetriever): The retriever serving every request.
+        max_pending (int): The maximum number of paper checks waiting to run.
+        workers (int): The number of papers checked at the same time.
+        warmup (bool): Whether to load every model before accepting requests.
+
+    Returns:
+        FastAPI: The application.
+    """
+    jobs = JobQueue(retriever, max_pending=max_pending, workers=workers)
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        if warmup:
+            await asyncio.to_thread(retriever.warmup)
+        jobs.start()
+        yield
+        await jobs.stop()
+        if isinstance(retriever, BatchingMissingCitationRetriever):
+            retriever.close()
+
+    app = FastAPI(title='citeseek', lifespan=lifespan)
+
+    @app.post('/papers/check', status_code=202)
+    async def check_paper(request: Request, min_year: Optional[int] = None, max_year: Optional[int] = None,
+                          venue: List[str] = Query(default=[]), field_of_study: List[str] = Query(default=[])):
+        pdf = await request.body()
+        if not pdf.startswith(b'%PDF'):
+            raise HTTPException(status_code=400, detail='The request body is not a PDF.')
+
+        try:
+            filters = PaperFilter(min_year, max_year, venue, field_of_study)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            job_id = jobs.submit(pdf, filters or None)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail='Too many papers queued, retry later.',
+                                headers={'Retry-After': '5'})
+
+        return {'job_id': job_id, 'status_url': f'/jobs/{job_id}'}
+
+    @app.get('/jobs/{job_id}')
+    async def get_job(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail='Unknown job.')
+
+        return {'job_id': job_id, **job}
+
+    @app.post('/sentences/classify')
+    async def classify_sentences(request: SentencesRequest):
+        return await asyncio.to_thread(retriever.classify_sentences, request.sentences)
+
+    @app.get('/health')
+    async def health():
+        return {'status': 'ok', 'pending_jobs': jobs.pending}
+
+    @app.get('/metrics')
+    async def metrics():
+        if isinstance(retriever._metrics, PrometheusMetrics):
+            from prometheus_client import CONTENT_TYPE_LATEST
+
+            return Response(retriever._metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+        return retriever._metrics.snapshot()
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve missing citation checks over HTTP")
+    parser.add_argument("--url", type=str, default="http://localhost:9200", help="Elasticsearch URL")
+    parser.add_argument("--classifier-path", type=str, required=True, help="Path to the citing sentence classifier")
+    parser.add_argument("--classifier-backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--reranker", choices=["llm", "cross-encoder"], default="llm")
+    parser.add_argument("--embedding-cache-dir", type=str, default=None)
+    parser.add_argument("--pdf-cache-dir", type=str, default=None)
+    parser.add_argument("--result-cache-dir", type=str, default=None,
+                        help="Directory caching classification, retrieval and rerank results across requests")
+    parser.add_argument("--knn-profile", choices=["fast", "balanced", "exact"], default="balanced")
+    parser.add_argument("--retrieval-mode", choices=["dense", "hybrid"], default="dense")
+    parser.add_argument("--rerank-candidates", type=int, default=None,
+                        help="Papers sent to the reranker per sentence, 10 by default in hybrid mode")
+    parser.add_argument("--batch-window", type=float, default=0.005,
+                        help="Seconds a classifier or embedding call waits for others to join its batch")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-pending", type=int, default=32, help="Queued paper checks before rejecting with 503")
+    parser.add_argument("--workers", type=int, default=2, help="Papers checked at the same time")
+    parser.add_argument("--metrics", choices=["none", "memory", "prometheus", "opentelemetry"], default="none",
+                        help="Where stage timings and counters are reported")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    retriever = BatchingMissingCitationRetriever(args.url, args.classifier_path,
+                                                 reranker=args.reranker,
+                                                 classifier_backend=args.classifier_backend,
+                                                 embedding_cache_dir=args.embedding_cache_dir,
+                                                 pdf_cache_dir=args.pdf_cache_dir,
+                                                 result_cache_dir=args.result_cache_dir,
+                                                 knn_profile=args.knn_profile,
+                                                 retrieval_mode=args.retrieval_mode,
+                                                 rerank_candidates=args.rerank_candidates,
+                                                 metrics=create_metrics(args.metrics),
+                                                 batch_window=args.batch_window,
+                                                 max_batch_size=args.max_batch_size)
+
+    uvicorn.run(create_app(retriever, max_pending=args.max_pending, workers=args.workers),
+                host=args.host, port=args.port)
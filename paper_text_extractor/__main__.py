@@ -1,4 +1,7 @@
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
 from .paper_text_extractor import get_paper_text
 
 if __name__ == '__main__':
@@ -6,11 +9,36 @@ if __name__ == '__main__':
         description='This script extracts and processes text from scientific papers in '
                     'PDF format. It includes options to remove abstracts, references, '
                     'and citation markers for easier text analysis.')
-    parser.add_argument('path', type=str, help='Path to the PDF file')
+    parser.add_argument('path', type=str, help='Path to the PDF file, or to a directory of PDF files')
     parser.add_argument('--remove-references', action='store_true', help='Remove references')
     parser.add_argument('--remove-abstract', action='store_true', help='Remove abstract')
     parser.add_argument('--remove-reference-markers', action='store_true', help='Remove reference markers')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes extracting text in parallel')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Directory where extracted pages are cached')
+    parser.add_argument('--output-dir', type=str, default=None,
+                        help='Directory where the text of each PDF is written when path is a directory '
+                             '(defaults to the input directory)')
     args = parser.parse_args()
 
-    text: str = get_paper_text(args.path, args.remove_references, args.remove_abstract, args.remove_reference_markers)
-    print(text.encode('ascii', 'ignore').decode())
+    path = Path(args.path)
+
+    if path.is_dir():
+        # In batch mode each process handles whole files, which parallelizes better than splitting pages
+        pdf_paths = sorted(path.glob('*.pdf'))
+        output_dir = Path(args.output_dir or path)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        extract = partial(get_paper_text,
+                          remove_references=args.remove_references,
+                          remove_abstract=args.remove_abstract,
+                          remove_reference_markers=args.remove_reference_markers,
+                          cache_dir=args.cache_dir)
+
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            for pdf_path, text in zip(pdf_paths, executor.map(extract, pdf_paths)):
+                (output_dir / f'{pdf_path.stem}.txt').write_text(text, encoding='utf-8')
+                print(f'{pdf_path} -> {output_dir / f"{pdf_path.stem}.txt"}')
+    else:
+        text: str = get_paper_text(path, args.remove_references, args.remove_abstract,
+                                   args.remove_reference_markers, args.jobs, args.cache_dir)
+        print(text.encode('ascii', 'ignore').decode())
@@ -0,0 +1,158 @@
+"""
+Detection and removal of citation markers in text.
+
+A single precompiled pattern covers the citation styles found in scientific papers and in the citing sentence
+dataset:
+- numeric markers: [1], [1-3], [1, 3], [1, 3-5], [1; 4]
+- author-year markers: (Vaswani et al., 2017), (Brown et al., 1992; Ando and Zhang, 2005), Radford et al. (2018),
+  Vaswani et al., 2017
+- GROBID-style tags: <GC:and.downey.fellows.vardy.whittle>
+
+Author names are capitalized words other than all-caps tokens, possibly after lowercase particles such as "van der" or
+"de", and a parenthetical marker cannot start with a month or season name, so that acronyms and dates such as
+"(COVID 2020)" or "(January 2020)" are not taken for markers. Parenthetical markers may be in square brackets and end
+with a page locator, as in [Smith 2019] or (Smith, 2019, p. 4). A narrative marker with a single author, as in
+Smith (2019), is only taken at the start of a sentence or after a word that introduces a citation, such as "by" or
+"following", since a capitalized word before a year, as in "Windows (2000)", is otherwise rarely a citation. Bare
+"et al." markers are not taken inside brackets they do not close.
+
+Markers are found and removed in one scan of the text, which also returns where they were.
+"""
+
+import re
+
+from typing import Iterator
+
+_NUMBER = r'\d+(?:\s*[-–]\s*\d+)?'
+_NUMERIC = rf'\[\s*{_NUMBER}(?:\s*[,;]\s*{_NUMBER})*\s*\]'
+
+# Month and season names, grouped by their first letters which is faster to match
+_DATE = (r'(?:J(?:an(?:uary)?|u(?:ne?|ly?))|Feb(?:ruary)?|Ma(?:r(?:ch)?|y)|A(?:pr(?:il)?|ug(?:ust)?|utumn)'
+         r'|S(?:ep(?:t(?:ember)?)?|pring|ummer)|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?|Fall|Winter)\b')
+# Lowercase particles of surnames: van, von, de, del, den, der, des, della, di, da, du, dos, le, la, ten, ter
+_PARTICLE = r'\b(?:v[ao]n|d(?:e(?:lla|[lnrs])?|[aiu]|os)|l[ae]|te[nr])\s+'
+# A capital followed by another one starts an acronym rather than a name
+_SURNAME = r"[A-Z](?![A-Z])[^\W\d_]*(?:[-'’][^\W\d_]+)*"
+_NAME = rf'(?:{_PARTICLE})*{_SURNAME}'
+_COAUTHORS = rf'\s+et\s+al\.|\s+(?:and|&)\s+{_NAME}'
+_AUTHORS = rf'{_NAME}(?:{_COAUTHORS})?'
+_YEAR = r'(?:19|20)\d{2}[a-z]?'
+_YEARS = rf'{_YEAR}(?:\s*[,;]\s*{_YEAR})*'
+_LOCATOR = rf'(?:,?\s*(?:pp?\.|ch\.|sec\.)\s*{_NUMBER}|:\s*{_NUMBER})'
+_AUTHOR_YEAR = rf'{_AUTHORS},?\s+{_YEAR}(?:,\s*{_YEAR})*{_LOCATOR}?'
+# Dates are only ruled out in brackets, the only place where they look like markers without a second author
+_AUTHOR_YEARS = rf'(?:(?:see|e\.g\.|cf\.|i\.e\.),?\s+)?(?!{_DATE}){_AUTHOR_YEAR}(?:\s*;\s*{_AUTHOR_YEAR})*'
+_PARENTHETICAL = rf'\({_AUTHOR_YEARS}\)|\[{_AUTHOR_YEARS}\]'
+# Narrative markers, Radford et al. (2018) or Smith (2019), and bare ones, Vaswani et al., 2017, share their first name
+# so that it is only matched once at each position. Its particles are matched backwards from the name by
+# `_PARTICLES_BEFORE`, since trying them at every position of the text would make the scan several times slower.
+_NAMED = (rf'{_SURNAME}(?:(?P<coauthors>{_COAUTHORS})?\s+\({_YEARS}\)'
+          rf'|(?P<et_al>\s+et\s+al\.,?\s+{_YEAR}))')
+
+_TAG = r'<[A-Z]+:[a-zA-Z0-9._:/-]*>'
+
+# The whitespace preceding a marker is part of the match so that removing it leaves "word." instead of "word ."
+CITATION_MARKER_REGEX = re.compile(
+    rf'[ \t]*(?P<marker>{_NUMERIC}|{_TAG}|{_PARENTHETICAL}|(?P<named>{_NAMED}))'
+)
+
+_PARTICLES_BEFORE = re.compile(rf'[ \t]*((?:{_PARTICLE})+)$')
+# What precedes a single-author narrative marker: the start of a sentence or a word introducing a citation
+_CITATION_CUE_REGEX = re.compile(r'(?:^|[.!?:;]\s*|\b(?:by|of|in|see|following|from|and|with|as|than|unlike|like|to'
+                                 r'|cf\.|e\.g\.,?)\s+)$')
+
+
+def _may_contain_marker(text: str) -> bool:
+    # Every marker contains one of these, and checking for them is much cheaper than running the pattern
+    return '[' in text or '<' in text or '(' in text or 'et al' in text
+
+
+def _iter_markers(text: str) -> Iterator[tuple[int, int, int]]:
+    """
+    Finds the markers of a text in their context.
+
+    Yields:
+        tuple[int, int, int]: The start of each marker with the whitespace preceding it, the start of the marker and
+            its end.
+    """
+    for match in CITATION_MARKER_REGEX.finditer(text):
+        start, (marker_start, end) = match.start(), match.span('marker')
+        if match.group('named') is None:
+            yield start, marker_start, end
+            continue
+
+        # Surnames rarely have more than two particles, which fit in the 32 characters before the name
+        particles = _PARTICLES_BEFORE.search(text, max(0, marker_start - 32), marker_start)
+        if particles:
+            start, marker_start = particles.start(), particles.start(1)
+
+        if match.group('et_al') is not None:
+            # Inside brackets, it is part of a citation the other patterns could not parse, which must not be left
+            # half removed
+            if text.rfind('(', 0, marker_start) > text.rfind(')', 0, marker_start) or \
+                    text.rfind('[', 0, marker_start) > text.rfind(']', 0, marker_start):
+                continue
+        elif match.group('coauthors') is None and \
+                not _CITATION_CUE_REGEX.search(text, max(0, marker_start - 16), marker_start):
+            continue
+
+        yield start, marker_start, end
+
+
+def find_citation_markers(text: str) -> list[tuple[int, int]]:
+    """
+    Finds the citation markers in a text.
+
+    Args:
+        text (str): The text to scan.
+
+    Returns:
+        list[tuple[int, int]]: The (start, end) offsets of each marker, in order.
+    """
+    if not _may_contain_marker(text):
+        return []
+
+    return [(marker_start, end) for _, marker_start, end in _iter_markers(text)]
+
+
+def contains_citation_marker(text: str) -> bool:
+    """
+    Checks whether a text contains at least one citation marker.
+
+    Args:
+        text (str): The text to scan.
+
+    Returns:
+        bool: Whether a citation marker was found.
+    """
+    return _may_contain_marker(text) and next(_iter_markers(text), None) is not None
+
+
+def strip_citation_markers(text: str) -> tuple[str, list[tuple[int, int]]]:
+    """
+    Removes the citation markers from a text, along with the whitespace preceding them.
+
+    Args:
+        text (str): The text to clean.
+
+    Returns:
+        tuple[str, list[tuple[int, int]]]: The text without markers, and the (start, end) offsets of each removed
+            marker in the original text.
+    """
+    if not _may_contain_marker(text):
+        return text, []
+
+    parts = []
+    spans = []
+    position = 0
+
+    for start, marker_start, end in _iter_markers(text):
+        parts.append(text[position:start])
+        spans.append((marker_start, end))
+        position = end
+
+    if not spans:
+        return text, spans
+
+    parts.append(text[position:])
+    return ''.join(parts), spans
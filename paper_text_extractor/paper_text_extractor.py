@@ -5,19 +5,266 @@ and citation markers.
 
 It allows command-line usage to efficiently extract, clean, and preprocess text 
 content from scientific documents in bulk or individually.
+
+Pages can be extracted in parallel by a pool of processes, and the extracted text
+can be cached on disk, keyed by the content of the file and the extraction options,
+so that extracting an unchanged PDF again only reads the cache. `iter_pages` yields
+pages as they are extracted, so that long documents can be processed page by page.
+
+Along with the text, the font size and weight of every line are kept so that the
+document can be split into typed sections (see `section_segmenter`).
 """
 
+import hashlib
+import json
+import os
 import re
+import sys
 
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
 from pathlib import Path
-from typing import IO
-from pdfminer.high_level import extract_text
+from typing import IO, Iterator, Optional
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTChar, LTContainer, LTPage, LTText, LTTextBox, LTTextLine
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from .citation_markers import strip_citation_markers
+from .section_segmenter import Section, SectionKind, segment_sections
+
+# Bump when the extraction output changes, so that stale cache entries are not reused
+_EXTRACTOR_VERSION = 2
+
+_BOLD_FONT_REGEX = re.compile(r'bold|black|heavy|semibold|demi|medi|cmbx', re.IGNORECASE)
+
+
+@dataclass
+class TextLine:
+    """
+    A line of text on a page, along with its style.
+
+    Attributes:
+        offset (int): The offset of the line in the text of its page.
+        text (str): The text of the line, including the trailing newline.
+        size (float): The most common font size of the line.
+        bold (bool): Whether most characters of the line use a bold font.
+    """
+    offset: int
+    text: str
+    size: float
+    bold: bool
+
+
+@dataclass
+class PageText:
+    """
+    The text extracted from a page and the lines it is made of.
+    """
+    text: str
+    lines: list[TextLine]
+
+
+def _open_pdf(source: str | bytes) -> IO:
+    return BytesIO(source) if isinstance(source, bytes) else open(source, 'rb')
+
+
+def _count_pages(source: str | bytes) -> int:
+    with _open_pdf(source) as fp:
+        document = PDFDocument(PDFParser(fp))
+        return sum(1 for _ in PDFPage.create_pages(document))
+
+
+def _line_style(line: LTTextLine) -> tuple[float, bool]:
+    chars = [char for char in line if isinstance(char, LTChar) and not char.get_text().isspace()]
+    if not chars:
+        return 0.0, False
+
+    size = Counter(round(char.size, 1) for char in chars).most_common(1)[0][0]
+    bold = sum(bool(_BOLD_FONT_REGEX.search(char.fontname)) for char in chars) > len(chars) / 2
+
+    return size, bold
+
+
+def _render_page(layout: LTPage) -> list:
+    """
+    Renders a page layout to text the same way pdfminer's `TextConverter` does, recording each line on the way.
+    """
+    parts = []
+    lines = []
+    length = 0
+
+    def write(text: str):
+        nonlocal length
+        parts.append(text)
+        length += len(text)
+
+    def render(item):
+        if isinstance(item, LTTextLine):
+            text = item.get_text()
+            lines.append([length, text, *_line_style(item)])
+            write(text)
+        elif isinstance(item, LTContainer):
+            for child in item:
+                render(child)
+        elif isinstance(item, LTText):
+            write(item.get_text())
+        if isinstance(item, LTTextBox):
+            write('\n')
+
+    render(layout)
+    write('\f')
+
+    return [''.join(parts), lines]
+
+
+def _iter_page_range(source: str | bytes, start: int, end: int, laparams: dict) -> Iterator[list]:
+    """
+    Extracts the text and lines of each page in [start, end), parsing the document only once.
+
+    Concatenating the returned texts gives the same result as pdfminer's `extract_text` for those pages. Pages are
+    returned as plain lists so that they can be sent between processes and cached as JSON.
+    """
+    with _open_pdf(source) as fp:
+        resource_manager = PDFResourceManager(caching=True)
+        device = PDFPageAggregator(resource_manager, laparams=LAParams(**laparams))
+        interpreter = PDFPageInterpreter(resource_manager, device)
+
+        for page in PDFPage.get_pages(fp, pagenos=range(start, end)):
+            interpreter.process_page(page)
+            yield _render_page(device.get_result())
+
+
+def _extract_page_range(source: str | bytes, start: int, end: int, laparams: dict) -> list:
+    return list(_iter_page_range(source, start, end, laparams))
+
+
+def _iter_raw_pages(source: str | bytes, jobs: int, laparams: dict) -> Iterator[list]:
+    if jobs <= 1:
+        yield from _iter_page_range(source, 0, sys.maxsize, laparams)
+        return
+
+    num_pages = _count_pages(source)
+    ranges_size = -(-num_pages // jobs)
+    ranges = [(start, min(start + ranges_size, num_pages)) for start in range(0, num_pages, ranges_size)]
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(ranges) or 1)) as executor:
+        futures = [executor.submit(_extract_page_range, source, start, end, laparams) for start, end in ranges]
+        # Ranges are yielded in order as soon as they are done, while the following ones are still extracted
+        for future in futures:
+            yield from future.result()
+
+
+def extract_pages(path: str | Path | IO,
+                  jobs: int = 1,
+                  cache_dir: Optional[str | Path] = None,
+                  laparams: Optional[dict] = None) -> list[PageText]:
+    """
+    Extracts the text and the styled lines of each page of a PDF file.
+
+    Args:
+        path (str | Path | IO): The file path to the PDF document, or a binary file object.
+        jobs (int): The number of processes extracting pages in parallel. Default is 1.
+        cache_dir (str | Path): Optional directory where the extracted pages are cached,
+            keyed by the content of the file and the extraction options.
+        laparams (dict): Optional keyword arguments for pdfminer's `LAParams`.
+
+    Returns:
+        list[PageText]: The text and lines of each page.
+    """
+    return list(iter_pages(path, jobs, cache_dir, laparams))
+
+
+def iter_pages(path: str | Path | IO,
+               jobs: int = 1,
+               cache_dir: Optional[str | Path] = None,
+               laparams: Optional[dict] = None) -> Iterator[PageText]:
+    """
+    Extracts the text and the styled lines of each page of a PDF file, yielding each page
+    as soon as it is extracted.
+
+    With several jobs, pages are yielded range by range. The extracted pages are only
+    cached once every page has been yielded.
+
+    Args:
+        path (str | Path | IO): The file path to the PDF document, or a binary file object.
+        jobs (int): The number of processes extracting pages in parallel. Default is 1.
+        cache_dir (str | Path): Optional directory where the extracted pages are cached,
+            keyed by the content of the file and the extraction options.
+        laparams (dict): Optional keyword arguments for pdfminer's `LAParams`.
+
+    Yields:
+        PageText: The text and lines of each page, in order.
+    """
+    laparams = laparams or {}
+
+    if isinstance(path, (str, Path)):
+        source = str(path)
+        with open(source, 'rb') as f:
+            content = f.read() if cache_dir else None
+    else:
+        source = content = path.read()
+
+    cache_path = None
+    if cache_dir:
+        options = json.dumps({'version': _EXTRACTOR_VERSION, 'laparams': laparams}, sort_keys=True)
+        key = hashlib.sha256(content + options.encode('utf-8')).hexdigest()
+        cache_path = Path(cache_dir) / f'{key}.json'
+
+        if cache_path.exists():
+            yield from _to_page_texts(json.loads(cache_path.read_text(encoding='utf-8')))
+            return
+
+    pages = []
+    for page in _iter_raw_pages(source, jobs, laparams):
+        # Pages are only kept to be cached
+        if cache_path:
+            pages.append(page)
+        yield _to_page_text(page)
+
+    if cache_path:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + f'.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(pages), encoding='utf-8')
+        os.replace(tmp_path, cache_path)
+
+
+def _to_page_text(page: list) -> PageText:
+    text, lines = page
+    return PageText(text, [TextLine(*line) for line in lines])
+
+
+def _to_page_texts(pages: list) -> list[PageText]:
+    return [_to_page_text(page) for page in pages]
+
+
+def get_paper_sections(path: str | Path | IO,
+                       jobs: int = 1,
+                       cache_dir: Optional[str | Path] = None) -> list[Section]:
+    """
+    Extracts the text of a PDF file split into typed sections (front matter, abstract,
+    body, acknowledgements, references and appendix).
+
+    Args:
+        path (str | Path | IO): The file path to the PDF document.
+        jobs (int): The number of processes extracting pages in parallel. Default is 1.
+        cache_dir (str | Path): Optional directory where the extracted pages are cached.
+
+    Returns:
+        list[Section]: The sections of the document, in reading order.
+    """
+    return segment_sections(extract_pages(path, jobs, cache_dir))
 
 
 def get_paper_text(path: str | Path | IO,
                    remove_references: bool = False,
                    remove_abstract: bool = False,
-                   remove_reference_markers: bool = False) -> str:
+                   remove_reference_markers: bool = False,
+                   jobs: int = 1,
+                   cache_dir: Optional[str | Path] = None) -> str:
     """
     Extracts text content from a PDF file, with options to remove specific sections
     or markers.
@@ -29,28 +276,35 @@ def get_paper_text(path: str | Path | IO,
     Args:
         path (str | Path | IO): The file path to the PDF document.
         remove_references (bool): A flag indicating whether to remove the References
-            section from the extracted text. Default is False.
+            section, and the appendices following it, from the extracted text.
+            Default is False.
         remove_abstract (bool): A flag indicating whether to remove the Abstract
-            section from the extracted text. Default is False.
-        remove_reference_markers (bool): A flag indicating whether to remove
-            reference markers (e.g., [1], [1, 2], [1-3]) from the extracted text.
+            section, and the title and authors preceding it, from the extracted text.
             Default is False.
+        remove_reference_markers (bool): A flag indicating whether to remove
+            reference markers (e.g., [1], [1, 2], [1-3], (Vaswani et al., 2017)) from
+            the extracted text. Default is False.
+        jobs (int): The number of processes extracting pages in parallel. Default is 1.
+        cache_dir (str | Path): Optional directory where the extracted pages are cached.
+            Default is None, which disables caching.
 
     Returns:
         str: The processed text extracted from the PDF document.
     """
-    pdf_text = extract_text(path)
+    pages = extract_pages(path, jobs, cache_dir)
+    pdf_text = ''.join(page.text for page in pages)
 
+    removed_kinds = set()
     if remove_references:
-        pdf_text = pdf_text.split('References', 1)[0]
-
+        removed_kinds |= {SectionKind.REFERENCES, SectionKind.APPENDIX}
     if remove_abstract:
-        pdf_text = pdf_text.split('Abstract', 1)[1]
+        removed_kinds |= {SectionKind.FRONT_MATTER, SectionKind.ABSTRACT}
+
+    if removed_kinds:
+        pdf_text = ''.join(pdf_text[section.start:section.end]
+                           for section in segment_sections(pages) if section.kind not in removed_kinds)
 
     if remove_reference_markers:
-        pdf_text = re.sub(r'\[.*]', '', pdf_text)
-        pdf_text = re.sub(r'\[\s*\d+\s*]', '', pdf_text)
-        pdf_text = re.sub(r'\[\s*\d+(,\s*\d+)*\s*]', '', pdf_text)
-        pdf_text = re.sub(r'\[\s*\d+\s*-\s*\d+\s*]', '', pdf_text)
+        pdf_text, _ = strip_citation_markers(pdf_text)
 
     return pdf_text
@@ -0,0 +1,319 @@
+"""
+Splits the text of a scientific paper into typed sections using the layout of its lines.
+
+Headings are recognized from the font size and weight of each line relative to the body text of the document,
+combined with common heading shapes (numbered headings such as "3.1 Encoder", or well-known section names such as
+"Abstract" or "References" on a line of their own). Headings are only ever matched on whole lines, so a mention of
+"references" inside a paragraph never ends the body of the paper.
+
+`iter_section_parts` segments a document page by page as its pages are extracted, estimating the body font size from
+its first pages instead of the whole document.
+"""
+
+import itertools
+import re
+
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .paper_text_extractor import PageText, TextLine
+
+
+class SectionKind(Enum):
+    FRONT_MATTER = 'front_matter'
+    ABSTRACT = 'abstract'
+    BODY = 'body'
+    ACKNOWLEDGEMENTS = 'acknowledgements'
+    REFERENCES = 'references'
+    APPENDIX = 'appendix'
+
+
+@dataclass
+class Section:
+    """
+    A section of a paper.
+
+    Attributes:
+        kind (SectionKind): The type of the section.
+        title (str): The heading of the section, empty for the front matter.
+        text (str): The text of the section, without its heading.
+        start (int): The offset in the document text where the section, including its heading, starts.
+        end (int): The offset in the document text where the section ends.
+        page (int): The zero-based index of the page the section starts on.
+    """
+    kind: SectionKind
+    title: str
+    text: str
+    start: int
+    end: int
+    page: int
+
+
+@dataclass
+class SectionPart:
+    """
+    The part of a section lying on one page.
+
+    Attributes:
+        kind (SectionKind): The type of the section.
+        title (str): The heading of the section, empty for the front matter.
+        text (str): The text of the part.
+        start (int): The offset in the document text where the part starts.
+        page (int): The zero-based index of the page the part starts on.
+        continues (bool): Whether the part continues the section of the previous part, False for the first part of a
+            section.
+    """
+    kind: SectionKind
+    title: str
+    text: str
+    start: int
+    page: int
+    continues: bool
+
+
+_NUMBERING = r'(?:\d+(?:\.\d+)*\.?|[IVX]+\.|[A-H](?:\.\d+)*\.?)'
+_NUMBERED_HEADING_REGEX = re.compile(rf'^{_NUMBERING}\s+[A-Z]')
+_NUMBER_ONLY_REGEX = re.compile(rf'^{_NUMBERING}$')
+_WORD_REGEX = re.compile(r'[A-Za-z]{3,}')
+_INLINE_ABSTRACT_REGEX = re.compile(r'^abstract\s*[-—–:.]', re.IGNORECASE)
+
+_KIND_BY_NAME = {
+    'abstract': SectionKind.ABSTRACT,
+    'introduction': SectionKind.BODY,
+    'references': SectionKind.REFERENCES,
+    'reference': SectionKind.REFERENCES,
+    'bibliography': SectionKind.REFERENCES,
+    'literature cited': SectionKind.REFERENCES,
+    'acknowledgements': SectionKind.ACKNOWLEDGEMENTS,
+    'acknowledgments': SectionKind.ACKNOWLEDGEMENTS,
+    'acknowledgement': SectionKind.ACKNOWLEDGEMENTS,
+    'acknowledgment': SectionKind.ACKNOWLEDGEMENTS,
+    'appendix': SectionKind.APPENDIX,
+    'appendices': SectionKind.APPENDIX,
+    'supplementary material': SectionKind.APPENDIX,
+}
+
+
+def _heading_name(text: str) -> str:
+    """
+    Strips the numbering and trailing punctuation from a heading, e.g. "7. References" -> "references".
+    """
+    name = re.sub(rf'^{_NUMBERING}\s+', '', text.strip())
+    return name.rstrip('.:').strip().lower()
+
+
+def _body_font_size(pages: list['PageText']) -> float:
+    sizes = Counter()
+    for page in pages:
+        for line in page.lines:
+            sizes[line.size] += len(line.text)
+
+    return sizes.most_common(1)[0][0] if sizes else 0.0
+
+
+class _HeadingDetector:
+    def __init__(self, body_size: float):
+        self.body_size = body_size
+        self.seen_heading = False
+
+    def is_styled(self, line: 'TextLine') -> bool:
+        return line.size > self.body_size + 0.5 or (line.bold and line.size >= self.body_size - 0.5)
+
+    def is_number(self, line: Optional['TextLine']) -> bool:
+        # Heading numbers are sometimes laid out as a line of their own, e.g. "1" then "Introduction"
+        return line is not None and bool(_NUMBER_ONLY_REGEX.match(line.text.strip())) and self.is_styled(line)
+
+    def is_heading(self, line: 'TextLine', previous: Optional['TextLine']) -> bool:
+        text = line.text.strip()
+
+        if not text or len(text) > 100 or len(text.split()) > 12 or not _WORD_REGEX.search(text):
+            return False
+
+        name = _heading_name(text)
+        if name in _KIND_BY_NAME or name.startswith('appendix'):
+            return True
+
+        # An abstract running on the same line as its heading, e.g. "Abstract—We present..."
+        if not self.seen_heading and _INLINE_ABSTRACT_REGEX.match(text):
+            return True
+
+        if not self.is_styled(line) or text[-1] in '.,;' or not (text[0].isupper() or text[0].isdigit()):
+            return False
+
+        # Unnumbered styled lines before the first heading are the title and the authors
+        return bool(_NUMBERED_HEADING_REGEX.match(text)) or self.is_number(previous) or self.seen_heading
+
+
+def _section_kind(title: str, after_references: bool) -> SectionKind:
+    name = _heading_name(title)
+
+    if _INLINE_ABSTRACT_REGEX.match(title.strip()):
+        return SectionKind.ABSTRACT
+    if name in _KIND_BY_NAME:
+        return _KIND_BY_NAME[name]
+    if name.startswith('appendix') or after_references:
+        return SectionKind.APPENDIX
+
+    return SectionKind.BODY
+
+
+def segment_sections(pages: list['PageText']) -> list[Section]:
+    """
+    Splits a document into typed sections in a single pass over its lines.
+
+    Text before the first heading is the front matter. If no heading is found at all, the whole document is returned
+    as a single body section.
+
+    Args:
+        pages (list[PageText]): The pages of the document, as returned by `extract_pages`.
+
+    Returns:
+        list[Section]: The sections of the document, in reading order.
+    """
+    detector = _HeadingDetector(_body_font_size(pages))
+    text = ''.join(page.text for page in pages)
+
+    # (start of heading, end of heading, title, page) for every heading
+    headings = []
+    page_offset = 0
+    previous: Optional['TextLine'] = None
+    previous_start = 0
+
+    for page_index, page in enumerate(pages):
+        for line in page.lines:
+            start = page_offset + line.offset
+
+            if detector.is_heading(line, previous):
+                title = line.text.strip()
+                heading_start = start
+                if detector.is_number(previous):
+                    title = f'{previous.text.strip()} {title}'
+                    heading_start = previous_start
+
+                headings.append((heading_start, start + len(line.text), title, page_index))
+                detector.seen_heading = True
+
+            previous, previous_start = line, start
+
+        page_offset += len(page.text)
+
+    if not headings:
+        return [Section(SectionKind.BODY, '', text, 0, len(text), 0)]
+
+    sections = []
+    if headings[0][0] > 0:
+        sections.append(Section(SectionKind.FRONT_MATTER, '', text[:headings[0][0]], 0, headings[0][0], 0))
+
+    after_references = False
+    for i, (start, heading_end, title, page_index) in enumerate(headings):
+        end = headings[i + 1][0] if i + 1 < len(headings) else len(text)
+        kind = _section_kind(title, after_references)
+        after_references = after_references or kind == SectionKind.REFERENCES
+
+        # Inline abstracts keep their first line, since it holds the beginning of the abstract
+        body_start = start if kind == SectionKind.ABSTRACT and _INLINE_ABSTRACT_REGEX.match(title) else heading_end
+        sections.append(Section(kind, title, text[body_start:end], start, end, page_index))
+
+    return sections
+
+
+def iter_section_parts(pages: Iterable['PageText'], lookahead_pages: int = 3) -> Iterator[SectionPart]:
+    """
+    Splits a document into typed sections page by page, yielding the part of each section lying on a page once the
+    page is read.
+
+    Headings are found like in `segment_sections`, except that the body font size is estimated from the first
+    `lookahead_pages` pages. The front matter is held back until the first heading, since a document without any
+    heading is a single body section.
+
+    Args:
+        pages (Iterable[PageText]): The pages of the document, e.g. as yielded by `iter_pages`.
+        lookahead_pages (int): The number of pages read before yielding anything, to estimate the body font size.
+
+    Yields:
+        SectionPart: The non-empty parts of the sections, in reading order.
+    """
+    pages = iter(pages)
+    first_pages = list(itertools.islice(pages, lookahead_pages))
+    detector = _HeadingDetector(_body_font_size(first_pages))
+
+    kind, title = None, ''
+    after_references = False
+    continues = False
+    front_matter = []
+
+    # The text of the current section not yielded yet starts at `segment_start` on page `segment_page`. `window` is
+    # the text of the current page, preceded by the last line of the previous page when it was held back.
+    segment_start, segment_page = 0, 0
+    window, window_start = '', 0
+    previous: Optional['TextLine'] = None
+    previous_start = 0
+
+    def take(end: int) -> Optional[SectionPart]:
+        nonlocal continues
+
+        text = window[segment_start - window_start:end - window_start]
+        if not text:
+            return None
+
+        part = SectionPart(kind or SectionKind.FRONT_MATTER, title, text, segment_start, segment_page, continues)
+        continues = True
+        return part
+
+    page_offset = 0
+    for page_index, page in enumerate(itertools.chain(first_pages, pages)):
+        window = window[segment_start - window_start:] + page.text
+        window_start = segment_start
+
+        for line in page.lines:
+            start = page_offset + line.offset
+
+            if detector.is_heading(line, previous):
+                heading = line.text.strip()
+                heading_start = start
+                if detector.is_number(previous):
+                    heading = f'{previous.text.strip()} {heading}'
+                    heading_start = previous_start
+
+                part = take(heading_start)
+                if kind is None:
+                    yield from front_matter + ([part] if part else [])
+                    front_matter = None
+                elif part:
+                    yield part
+
+                kind, title = _section_kind(heading, after_references), heading
+                after_references = after_references or kind == SectionKind.REFERENCES
+                continues = False
+
+                # Inline abstracts keep their first line, since it holds the beginning of the abstract
+                inline = kind == SectionKind.ABSTRACT and _INLINE_ABSTRACT_REGEX.match(heading)
+                segment_start, segment_page = start if inline else start + len(line.text), page_index
+                detector.seen_heading = True
+
+            previous, previous_start = line, start
+
+        page_offset += len(page.text)
+        # Hold back a trailing heading number, since it belongs to the heading starting the next page if there is one
+        held_back = bool(page.lines) and detector.is_number(page.lines[-1]) and previous_start >= segment_start
+        end = previous_start if held_back else page_offset
+
+        part = take(end)
+        if part and kind is None:
+            front_matter.append(part)
+        elif part:
+            yield part
+        segment_start, segment_page = end, page_index if held_back else page_index + 1
+
+    part = take(page_offset)
+    if part and kind is None:
+        front_matter.append(part)
+    elif part:
+        yield part
+
+    if kind is None:
+        for part in front_matter:
+            yield SectionPart(SectionKind.BODY, '', part.text, part.start, part.page, part.continues)
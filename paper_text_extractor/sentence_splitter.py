@@ -0,0 +1,170 @@
+"""
+Splits the text of a paper into sentences as it is read, section part by section part.
+
+Words hyphenated across lines are joined and whitespace is collapsed before splitting, so that the Punkt tokenizer
+never sees a word broken by a line end. Only the text of the last, possibly unfinished, sentence of a section is kept
+between parts, so memory stays bounded by the length of a page however long the document is. Each sentence keeps the
+page and offset in the document text where it starts.
+"""
+
+import bisect
+import functools
+import re
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+if TYPE_CHECKING:
+    from nltk.tokenize import PunktTokenizer
+    from .section_segmenter import SectionPart
+
+# A word hyphenated at the end of a line, possibly followed by a page break, and the other runs of whitespace
+_NORMALIZE_REGEX = re.compile(r'(?<=[a-z])-[ \t]*\n\s*(?=[a-z])|\s+')
+
+
+@dataclass
+class Sentence:
+    """
+    A sentence of a document.
+
+    Attributes:
+        text (str): The normalized text of the sentence.
+        page (int): The zero-based index of the page the sentence starts on.
+        offset (int): The offset in the document text where the sentence starts.
+    """
+    text: str
+    page: int
+    offset: int
+
+
+@functools.cache
+def punkt_tokenizer(language: str = 'english') -> 'PunktTokenizer':
+    """
+    Loads the Punkt sentence tokenizer of a language once per process.
+    """
+    from nltk.tokenize import PunktTokenizer
+
+    return PunktTokenizer(language)
+
+
+def normalize_text(text: str) -> tuple[str, list[tuple[int, int]]]:
+    """
+    Joins words hyphenated across lines and collapses whitespace into single spaces.
+
+    Returns:
+        tuple[str, list[tuple[int, int]]]: The normalized text, and pairs of matching offsets in the normalized and
+            original text, sorted, from which any other offset of the normalized text can be mapped back.
+    """
+    parts = []
+    anchors = [(0, 0)]
+    length = last = 0
+
+    for match in _NORMALIZE_REGEX.finditer(text):
+        replacement = ' ' if match.group()[0].isspace() else ''
+        parts.append(text[last:match.start()])
+        parts.append(replacement)
+        length += match.start() - last + len(replacement)
+        last = match.end()
+        anchors.append((length, last))
+
+    parts.append(text[last:])
+
+    return ''.join(parts), anchors
+
+
+def _original_offset(anchors: list[tuple[int, int]], offset: int) -> int:
+    normalized, original = anchors[bisect.bisect_right(anchors, (offset, float('inf'))) - 1]
+    return original + offset - normalized
+
+
+class SentenceSplitter:
+    """
+    Splits the parts of the sections of a document into sentences incrementally.
+
+    Parts are fed in reading order. A sentence is returned once the text following it is known, or its section ends.
+
+    Args:
+        language (str): The language of the Punkt tokenizer.
+    """
+
+    def __init__(self, language: str = 'english'):
+        self._tokenizer = punkt_tokenizer(language)
+        self._text = ''
+        self._start = 0
+        # The start offsets and pages of the parts the buffered text comes from
+        self._starts = []
+        self._pages = []
+
+    def feed(self, part: 'SectionPart') -> list[Sentence]:
+        """
+        Adds the next part of the document.
+
+        Returns:
+            list[Sentence]: The sentences completed by the part, including the last sentence of the previous section
+                when the part starts a new section.
+        """
+        sentences = [] if part.continues else self.flush()
+
+        if not self._text:
+            self._start = part.start
+            self._starts, self._pages = [], []
+        self._text += part.text
+        self._starts.append(part.start)
+        self._pages.append(part.page)
+
+        return sentences + self._split(final=False)
+
+    def flush(self) -> list[Sentence]:
+        """
+        Ends the current section.
+
+        Returns:
+            list[Sentence]: The sentences of the section not returned yet.
+        """
+        sentences = self._split(final=True)
+        self._text = ''
+
+        return sentences
+
+    def _split(self, final: bool) -> list[Sentence]:
+        normalized, anchors = normalize_text(self._text)
+        spans = list(self._tokenizer.span_tokenize(normalized))
+        # The last sentence may continue in the next part
+        kept = spans.pop() if spans and not final else None
+        if not spans:
+            return []
+
+        sentences = []
+        for start, end in spans:
+            # Spans include the whitespace the text starts with
+            start += len(normalized[start:end]) - len(normalized[start:end].lstrip())
+            offset = self._start + _original_offset(anchors, start)
+            page = self._pages[bisect.bisect_right(self._starts, offset) - 1]
+            sentences.append(Sentence(normalized[start:end], page, offset))
+
+        consumed = _original_offset(anchors, kept[0]) if kept else len(self._text)
+        self._text = self._text[consumed:]
+        self._start += consumed
+        # Keep the part the remaining text starts in
+        first = max(bisect.bisect_right(self._starts, self._start) - 1, 0)
+        self._starts, self._pages = self._starts[first:], self._pages[first:]
+
+        return sentences
+
+
+def iter_sentences(parts: Iterable['SectionPart'], language: str = 'english') -> Iterator[Sentence]:
+    """
+    Splits the parts of the sections of a document into sentences, never running a sentence across two sections.
+
+    Args:
+        parts (Iterable[SectionPart]): The parts, e.g. as yielded by `iter_section_parts`, possibly filtered by kind.
+        language (str): The language of the Punkt tokenizer.
+
+    Yields:
+        Sentence: The sentences, in reading order.
+    """
+    splitter = SentenceSplitter(language)
+    for part in parts:
+        yield from splitter.feed(part)
+
+    yield from splitter.flush()